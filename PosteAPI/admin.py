@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.core.checks import messages
 from django.core.exceptions import ValidationError
 
+from .deletion import delete_folder
 from .models import Folder, FolderPermission, Post, Tag, User
 
 
@@ -102,7 +103,7 @@ class FolderAdmin(admin.ModelAdmin):
 
     def delete_model(self, request, obj):
         if self.can_delete_obj(obj):
-            super().delete_model(request, obj)
+            delete_folder(obj)
         else:
             raise ValidationError(
                 "Cannot delete root folder unless the user is being deleted."
@@ -119,15 +120,16 @@ class FolderAdmin(admin.ModelAdmin):
                 request, f"Cannot delete root folder: {obj.title}", level=messages.ERROR
             )
 
-        deletable_queryset = self.model.objects.filter(
-            pk__in=[obj.pk for obj in deletable_objects]
-        )
-        deletable_queryset.delete()
-        self.message_user(
-            request,
-            f"Successfully deleted {len(deletable_objects)} folder(s).",
-            level=messages.INFO,
-        )
+        # Folders inside another selected folder go with that folder's subtree
+        selected = {obj.pk for obj in deletable_objects}
+        in_background = 0
+        for obj in deletable_objects:
+            if selected.isdisjoint(obj.get_ancestor_ids()[1:]):
+                in_background += delete_folder(obj) is not None
+        message = f"Successfully deleted {len(deletable_objects)} folder(s)."
+        if in_background:
+            message += f" {in_background} large folder(s) are still being deleted."
+        self.message_user(request, message, level=messages.INFO)
 
     def delete_selected(self, request, queryset):
         self.delete_queryset(request=request, queryset=queryset)
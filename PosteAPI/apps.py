@@ -6,4 +6,8 @@ class PosteapiConfig(AppConfig):
     name = "PosteAPI"
 
     def ready(self):
+        import PosteAPI.checks
         import PosteAPI.signals
+        from PosteAPI.timing import instrument_serializers
+
+        instrument_serializers()
@@ -0,0 +1,129 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import LRUCache
+from .routers import use_primary
+
+DEFAULT_TOKEN_CACHE = {
+    # Seconds a token -> user mapping is trusted before it is looked up again
+    "TTL": 300,
+    # Most token -> user mappings kept in each process, without a shared cache
+    "MAX_ENTRIES": 10000,
+    # None keeps the mappings in an in-process LRU, where a revocation is only seen by
+    # the process that made it. With several server processes, set the alias of a
+    # Django cache shared by all of them (e.g. Memcached or Redis).
+    "CACHE_ALIAS": None,
+}
+
+# Cached in place of a revoked token's entry. Lookups that were already running when
+# the token was revoked cannot cache it again until this marker expires.
+REVOKED = "revoked"
+REVOKED_TTL = 60
+
+
+class TokenCache:
+    """
+    Maps token keys to (user, token) pairs, either in a shared Django cache or in a
+    bounded in-process LRU.
+
+    Entries are only ever added, never overwritten, so that a lookup that raced with
+    an eviction cannot bring a revoked token back: evicting leaves a REVOKED marker
+    behind for a while instead of removing the entry.
+    """
+
+    key_prefix = "poste:token:"
+
+    def __init__(self, ttl, max_entries, cache_alias=None):
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.local = LRUCache(max_entries, ttl=ttl)
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_TOKEN_CACHE, **getattr(settings, "POSTE_TOKEN_CACHE", {})}
+        return cls(options["TTL"], options["MAX_ENTRIES"], options["CACHE_ALIAS"])
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def get(self, key):
+        if self.shared:
+            entry = self.shared.get(self.key_prefix + key)
+        else:
+            entry = self.local.get(key)
+        return None if entry == REVOKED else entry
+
+    def add(self, key, user, token):
+        """
+        Caches the user of a token that was just looked up, unless the token was
+        evicted in the meantime.
+        """
+        if self.shared:
+            self.shared.add(self.key_prefix + key, (user, token), self.ttl)
+        else:
+            self.local.add(key, (user, token))
+
+    def evict(self, key):
+        self.evict_many([key])
+
+    def evict_many(self, keys):
+        if self.shared:
+            self.shared.set_many(
+                {self.key_prefix + key: REVOKED for key in keys}, REVOKED_TTL
+            )
+        else:
+            for key in keys:
+                self.local.set(key, REVOKED, ttl=REVOKED_TTL)
+
+    def evict_user(self, user_id):
+        """
+        Evicts every token of a user, e.g. after the user was deactivated.
+        """
+        self.evict_many(
+            Token.objects.filter(user_id=user_id).values_list("key", flat=True)
+        )
+
+    def clear(self):
+        """
+        Forgets every cached token. Only the token entries are deleted from a shared
+        cache, which holds other data too: a revoked token's entry is already a
+        REVOKED marker, so those of the existing tokens are all there can be.
+        """
+        self.local.clear()
+        if self.shared:
+            self.shared.delete_many(
+                [
+                    self.key_prefix + key
+                    for key in Token.objects.values_list("key", flat=True)
+                ]
+            )
+
+
+token_cache = TokenCache.from_settings()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers which user a token belongs to, so authenticated
+    requests skip the token/user query until the entry expires.
+
+    Revocation stays immediate: deleting a token, or saving its user, evicts the cached
+    entry (see PosteAPI.signals).
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            # A token just created may not have reached the replicas yet
+            with use_primary():
+                user, token = super().authenticate_credentials(key)
+            token_cache.add(key, user, token)
+        else:
+            user, token = cached
+        # Each request gets its own copy, as views may modify the user
+        return copy.copy(user), token
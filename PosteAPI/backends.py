@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import BaseBackend
 
+from .hashing import check_user_password
+
 
 class EmailBackend(BaseBackend):
     def authenticate(self, request, email=None, password=None, **kwargs):
@@ -10,7 +12,8 @@ class EmailBackend(BaseBackend):
         except UserModel.DoesNotExist:
             return None
 
-        if user.check_password(password):
+        # Hashed within one of PosteAPI.hashing's slots; may raise HashingBusy
+        if check_user_password(user, password):
             return user
 
     def get_user(self, user_id):
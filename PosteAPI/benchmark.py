@@ -0,0 +1,248 @@
+"""
+Synthetic data and endpoint latency benchmarks (see the `benchmark` management
+command).
+
+generate_dataset() builds a production-shaped database with bulk inserts, and
+run_benchmark() times the main endpoints against it through the Django test client.
+It reports latency percentiles and query counts as a JSON-serializable dict, so
+results from different commits can be compared.
+"""
+import math
+import random
+import statistics
+import time
+from dataclasses import asdict, dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import token_cache
+from .cache import response_cache
+from .models import Folder, FolderPermission, FolderPermissionEnum, Post, Tag, User
+from .tagindex import folder_tag_index, post_tag_index
+
+PASSWORD = "benchmark-password"
+ENDPOINTS = ["data", "data_cached", "posts", "folders_for_user", "login", "create_post"]
+
+
+@dataclass
+class DatasetShape:
+    users: int = 20
+    # Levels of folders below each root folder
+    depth: int = 3
+    # Child folders of each folder, down to `depth`
+    fanout: int = 3
+    posts_per_folder: int = 5
+    tags_per_post: int = 3
+    # Share of the other users each top-level folder is shared with, from 0 to 1
+    share_density: float = 0.1
+    tag_pool: int = 200
+    seed: int = 0
+
+
+def generate_dataset(shape):
+    """
+    Fills the database with users, folder trees, posts, tags and shares of the given
+    shape using bulk inserts. Returns the number of rows created per model.
+    """
+    rng = random.Random(shape.seed)
+    password = make_password(PASSWORD)  # hashing is slow; all users share one hash
+    users = User.objects.bulk_create(
+        User(
+            email=f"bench{i}@example.com",
+            username=f"bench{i}@example.com",
+            password=password,
+        )
+        for i in range(shape.users)
+    )
+    # bulk_create skips the signal that creates root folders
+    level = Folder.objects.bulk_create(
+        Folder(title="root", creator=user, is_root=True, path="/") for user in users
+    )
+    folders = list(level)
+    for depth in range(1, shape.depth + 1):
+        level = Folder.objects.bulk_create(
+            Folder(
+                title=f"Folder {depth}.{i}",
+                creator_id=parent.creator_id,
+                parent=parent,
+                path=f"{parent.path}{parent.pk}/",
+            )
+            for parent in level
+            for i in range(shape.fanout)
+        )
+        folders.extend(level)
+
+    tags = Tag.objects.bulk_create(Tag(name=f"tag{i}") for i in range(shape.tag_pool))
+    posts = Post.objects.bulk_create(
+        Post(
+            title=f"Post {i}",
+            description="Benchmark post",
+            url=f"https://example.com/{folder.pk}/{i}",
+            creator_id=folder.creator_id,
+            folder=folder,
+        )
+        for folder in folders
+        for i in range(shape.posts_per_folder)
+    )
+    Post.tags.through.objects.bulk_create(
+        Post.tags.through(post_id=post.pk, tag_id=tag.pk)
+        for post in posts
+        for tag in rng.sample(tags, min(shape.tags_per_post, len(tags)))
+    )
+
+    shares = 0
+    for folder in folders:
+        if folder.path.count("/") != 2:  # only top-level folders, e.g. "/1/"
+            continue
+        others = [user for user in users if user.pk != folder.creator_id]
+        grantees = rng.sample(others, round(shape.share_density * len(others)))
+        FolderPermission.objects.bulk_create(
+            FolderPermission(
+                user=user,
+                folder=folder,
+                permission=rng.choice(FolderPermissionEnum.values),
+            )
+            for user in grantees
+        )
+        shares += len(grantees)
+
+    # Neither the folder counts nor the tag indexes were told about the bulk inserts
+    Folder.objects.recount()
+    post_tag_index.clear()
+    folder_tag_index.clear()
+    return {
+        "users": len(users),
+        "folders": len(folders),
+        "posts": len(posts),
+        "tags": len(tags),
+        "shares": shares,
+    }
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of `values`.
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(latencies, query_counts, status_codes):
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        "iterations": len(latencies),
+        "latency_ms": {
+            "p50": round(percentile(milliseconds, 50), 3),
+            "p95": round(percentile(milliseconds, 95), 3),
+            "p99": round(percentile(milliseconds, 99), 3),
+            "mean": round(statistics.fmean(milliseconds), 3),
+            "max": round(max(milliseconds), 3),
+        },
+        "queries": {
+            "p50": percentile(query_counts, 50),
+            "max": max(query_counts),
+        },
+        "status_codes": {
+            str(code): status_codes.count(code) for code in sorted(set(status_codes))
+        },
+    }
+
+
+def _endpoints(folders_by_user, rng):
+    """
+    Returns (name, prepare, request) triples. Each iteration calls prepare (untimed)
+    and then request (timed) with the client and user making the request.
+    """
+
+    def nothing(client, user):
+        pass
+
+    def clear_response_cache(client, user):
+        response_cache.clear()  # measure building the listing
+
+    def data(client, user):
+        return client.get("/api/data/")
+
+    def posts(client, user):
+        return client.get("/api/posts/")
+
+    def folders_for_user(client, user):
+        return client.get(f"/api/folders/user/{user.pk}/")
+
+    def login(client, user):
+        return client.post(
+            "/api/login/", {"email": user.email, "password": PASSWORD}, format="json"
+        )
+
+    def create_post(client, user):
+        return client.post(
+            "/api/posts/",
+            {
+                "title": "New post",
+                "description": "Created by the benchmark",
+                "url": "https://example.com/new",
+                "folder_id": rng.choice(folders_by_user[user.pk]),
+                "tags": "benchmark, new",
+            },
+            format="json",
+        )
+
+    return [
+        ("data", clear_response_cache, data),
+        ("data_cached", data, data),
+        ("posts", nothing, posts),
+        ("folders_for_user", nothing, folders_for_user),
+        ("login", nothing, login),
+        ("create_post", nothing, create_post),
+    ]
+
+
+def run_benchmark(shape, iterations=50, endpoints=None):
+    """
+    Generates a dataset of the given shape and times `iterations` requests to each
+    endpoint (all of them unless `endpoints` names some). Expects an empty database.
+    """
+    started = time.perf_counter()
+    dataset = generate_dataset(shape)
+    generation_seconds = time.perf_counter() - started
+
+    rng = random.Random(shape.seed)
+    users = list(User.objects.filter(email__startswith="bench"))
+    folders_by_user = {}
+    for pk, creator_id in Folder.objects.values_list("pk", "creator_id"):
+        folders_by_user.setdefault(creator_id, []).append(pk)
+    clients = {}
+    for user in users:
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        clients[user.pk] = client
+
+    results = {}
+    for name, prepare, request in _endpoints(folders_by_user, rng):
+        if endpoints and name not in endpoints:
+            continue
+        latencies, query_counts, status_codes = [], [], []
+        token_cache.clear()
+        for _ in range(iterations):
+            user = rng.choice(users)
+            prepare(clients[user.pk], user)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request(clients[user.pk], user)
+                latencies.append(time.perf_counter() - started)
+            query_counts.append(len(queries))
+            status_codes.append(response.status_code)
+        results[name] = summarize(latencies, query_counts, status_codes)
+
+    return {
+        "shape": asdict(shape),
+        "dataset": dataset,
+        "generation_seconds": round(generation_seconds, 3),
+        "database": connection.vendor,
+        "endpoints": results,
+    }
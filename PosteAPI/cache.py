@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_RESPONSE_CACHE = {
+    # Most responses kept in each process
+    "MAX_ENTRIES": 5000,
+    # Seconds an entry is kept in a shared cache. Keys include folder versions, so an
+    # entry never goes stale; this only bounds how long unreachable ones linger.
+    "TTL": 3600,
+    # Alias of a Django cache shared by all workers. When set it replaces the
+    # in-process LRU.
+    "CACHE_ALIAS": None,
+}
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded mapping that evicts the least recently used entry when
+    full. Entries optionally expire `ttl` seconds after they were set.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key, value):
+        """
+        Sets `key` unless it holds an entry that has not expired yet. Returns whether
+        it was set.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                return False
+            self._set(key, value)
+            return True
+
+    def _set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """
+        Removes every entry whose value matches `predicate`.
+        """
+        with self._lock:
+            for key in [k for k, (_, v) in self._entries.items() if predicate(v)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    """
+    Caches rendered responses and serialized folders under keys that include the
+    versions of the folders they were built from, so a change never serves stale
+    data: it simply leads to a new key.
+
+    Each entry records the ids of the folders it shows. With the in-process LRU,
+    invalidate_folders() drops those entries right away instead of leaving them to
+    age out; a shared cache leaves them to expire.
+    """
+
+    key_prefix = "poste:response:"
+
+    def __init__(self, max_entries, ttl, cache_alias=None):
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.local = LRUCache(max_entries)
+
+    @classmethod
+    def from_settings(cls):
+        options = {
+            **DEFAULT_RESPONSE_CACHE,
+            **getattr(settings, "POSTE_RESPONSE_CACHE", {}),
+        }
+        return cls(options["MAX_ENTRIES"], options["TTL"], options["CACHE_ALIAS"])
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """
+        Returns a dict mapping the keys found to their values.
+        """
+        if self.shared:
+            found = self.shared.get_many([self.key_prefix + key for key in keys])
+            entries = {key: found.get(self.key_prefix + key) for key in keys}
+        else:
+            entries = {key: self.local.get(key) for key in keys}
+        return {key: entry[1] for key, entry in entries.items() if entry is not None}
+
+    def set(self, key, value, folder_ids):
+        self.set_many({key: (value, folder_ids)})
+
+    def set_many(self, items):
+        """
+        Stores a dict mapping keys to (value, ids of the folders the value shows).
+        """
+        entries = {
+            key: (frozenset(folder_ids), value)
+            for key, (value, folder_ids) in items.items()
+        }
+        if self.shared:
+            self.shared.set_many(
+                {self.key_prefix + key: entry for key, entry in entries.items()},
+                self.ttl,
+            )
+        else:
+            for key, entry in entries.items():
+                self.local.set(key, entry)
+
+    def invalidate_folders(self, folder_ids):
+        folder_ids = set(folder_ids)
+        if folder_ids and not self.shared:
+            self.local.delete_where(lambda entry: not entry[0].isdisjoint(folder_ids))
+
+    def clear(self):
+        self.local.clear()
+
+
+response_cache = ResponseCache.from_settings()
@@ -0,0 +1,54 @@
+"""
+System checks for settings that only work when shared by every worker process.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries are only seen by the process that wrote them
+PER_PROCESS_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def is_per_process(cache_alias):
+    backend = settings.CACHES.get(cache_alias, {}).get("BACKEND")
+    return backend in PER_PROCESS_CACHES
+
+
+@register(Tags.caches)
+def check_tag_index_cache(app_configs, **kwargs):
+    from .tagindex import tag_index_options
+
+    alias = tag_index_options()["CACHE_ALIAS"] or "default"
+    if not is_per_process(alias):
+        return []
+    return [
+        Error(
+            f"The tag index cache '{alias}' is not shared between processes, so "
+            "workers would keep serving tag queries from stale indexes.",
+            hint="Point POSTE_TAG_INDEX['CACHE_ALIAS'] at a file-based, Memcached "
+            "or Redis cache.",
+            id="PosteAPI.E001",
+        )
+    ]
+
+
+@register(Tags.caches)
+def check_replica_pin_cache(app_configs, **kwargs):
+    from .routers import replica_options
+
+    options = replica_options()
+    alias = options["CACHE_ALIAS"]
+    if not options["DATABASES"] or not is_per_process(alias):
+        return []
+    return [
+        Error(
+            f"The replica pin cache '{alias}' is not shared between processes, so "
+            "a client could read from a replica right after writing through another "
+            "worker.",
+            hint="Point POSTE_REPLICAS['CACHE_ALIAS'] at a file-based, Memcached or "
+            "Redis cache.",
+            id="PosteAPI.E002",
+        )
+    ]
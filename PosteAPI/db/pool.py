@@ -0,0 +1,254 @@
+"""
+A bounded pool of DB-API connections, shared by the threads of a server process.
+
+Used by the PosteAPI.db.postgresql backend, so that a request reuses an open
+connection instead of paying for a new Postgres handshake. The pool itself knows
+nothing about Postgres: it is given a function opening a connection, and optionally
+functions checking that an idle connection still works and cleaning one up when it
+is given back.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_POOL = {
+    # Connections open at once, idle or in use, per server process
+    "MAX_SIZE": 10,
+    # Seconds after which a connection is closed rather than reused
+    "MAX_LIFETIME": 1800,
+    # Seconds an idle connection is kept open
+    "MAX_IDLE": 300,
+    # Connections idle for longer than this many seconds are checked before reuse
+    "CHECK_AFTER": 30,
+    # Seconds to wait for a connection when they are all in use
+    "TIMEOUT": 5,
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free in time."""
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect,
+        check=None,
+        reset=None,
+        max_size=DEFAULT_POOL["MAX_SIZE"],
+        max_lifetime=DEFAULT_POOL["MAX_LIFETIME"],
+        max_idle=DEFAULT_POOL["MAX_IDLE"],
+        check_after=DEFAULT_POOL["CHECK_AFTER"],
+        timeout=DEFAULT_POOL["TIMEOUT"],
+    ):
+        """
+        `connect()` opens a connection. `check(connection)` raises if an idle
+        connection no longer works; `reset(connection)` returns False (or raises) if
+        a connection given back cannot be reused.
+        """
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.timeout = timeout
+        self._idle = deque()  # (connection, opened at, given back at), newest last
+        self._opened_at = {}  # id(connection) -> opened at, for those in use
+        self._size = 0
+        self._condition = threading.Condition()
+        self._counters = dict.fromkeys(
+            [
+                "checkouts",
+                "reused",
+                "opened",
+                "closed",
+                "check_failures",
+                "waits",
+                "timeouts",
+            ],
+            0,
+        )
+
+    def getconn(self):
+        """
+        Returns an open connection, reusing an idle one when possible. Raises
+        PoolTimeout when all connections stay in use for `timeout` seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            expired = []
+            idle = None
+            reserved = False  # room was made for a new connection
+            with self._condition:
+                while idle is None:
+                    if self._idle:
+                        entry = self._idle.pop()  # the most recently used is warmest
+                        if self._expired(*entry):
+                            expired.append(entry[0])
+                            self._size -= 1
+                        else:
+                            idle = entry
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        reserved = True
+                        break
+                    else:
+                        self._counters["waits"] += 1
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._condition.wait(remaining):
+                            self._counters["timeouts"] += 1
+                            break
+            self._close_all(expired)
+
+            if idle is None:
+                if reserved:
+                    return self._open()
+                raise PoolTimeout(
+                    f"no database connection free after {self.timeout}s "
+                    f"({self.max_size} in use)"
+                )
+            connection, opened_at, returned_at = idle
+            if self.check is not None and time.monotonic() - returned_at >= (
+                self.check_after
+            ):
+                try:
+                    self.check(connection)
+                except Exception:
+                    with self._condition:
+                        self._counters["check_failures"] += 1
+                    self._discard(connection)
+                    continue
+            with self._condition:
+                self._counters["checkouts"] += 1
+                self._counters["reused"] += 1
+                self._opened_at[id(connection)] = opened_at
+            return connection
+
+    def putconn(self, connection, discard=False):
+        """
+        Gives a connection back, closing it instead if `discard` is true, it is too
+        old, or it cannot be reset.
+        """
+        with self._condition:
+            opened_at = self._opened_at.pop(id(connection), None)
+        if opened_at is None:  # not ours, or given back twice
+            _close_quietly(connection)
+            return
+        if not discard and self.reset is not None:
+            try:
+                discard = self.reset(connection) is False
+            except Exception:
+                discard = True
+        now = time.monotonic()
+        if discard or now - opened_at >= self.max_lifetime:
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, opened_at, now))
+            self._condition.notify()
+
+    def close(self):
+        """
+        Closes the idle connections. Those in use are closed when given back.
+        """
+        with self._condition:
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self.max_lifetime = 0
+        self._close_all(idle)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._opened_at),
+                "max_size": self.max_size,
+                **self._counters,
+            }
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._counters["checkouts"] += 1
+            self._counters["opened"] += 1
+            self._opened_at[id(connection)] = time.monotonic()
+        return connection
+
+    def _expired(self, connection, opened_at, returned_at):
+        now = time.monotonic()
+        return (
+            now - opened_at >= self.max_lifetime or now - returned_at >= self.max_idle
+        )
+
+    def _discard(self, connection):
+        _close_quietly(connection)
+        with self._condition:
+            self._size -= 1
+            self._counters["closed"] += 1
+            self._condition.notify()
+
+    def _close_all(self, connections):
+        for connection in connections:
+            _close_quietly(connection)
+        if connections:
+            with self._condition:
+                self._counters["closed"] += len(connections)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, key, create):
+    """
+    Returns the pool of database `alias`, made with `create()` the first time.
+
+    `key` stands for the settings the pool's connections are opened with. When it
+    changes (e.g. the test runner switching to the test database), the pool is
+    replaced and the old one closed, so a connection is never handed out for other
+    settings than it was opened with.
+    """
+    with _pools_lock:
+        old = _pools.get(alias)
+        if old is not None and old[0] == key:
+            return old[1]
+        pool = create()
+        _pools[alias] = (key, pool)
+    if old is not None:
+        old[1].close()
+    return pool
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, (_, pool) in sorted(pools.items())}
+
+
+def _forget_pools():
+    # A forked process must open its own connections; closing the parent's would
+    # close them for the parent too
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
@@ -0,0 +1,88 @@
+"""
+The postgresql backend, with connections taken from a PosteAPI.db.pool pool instead
+of opened for every request.
+
+Configured with a "POOL" dict in the database settings (see DEFAULT_POOL). Django
+still "closes" the connection at the end of each request; with this backend that
+gives it back to the pool.
+"""
+from django.db.backends.postgresql import base
+
+from PosteAPI.db.pool import DEFAULT_POOL, ConnectionPool, PoolTimeout, get_pool
+
+Database = base.Database
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def reset_connection(connection):
+    """
+    Ends whatever transaction a connection given back is in and drops the session
+    state it was left with (settings, temporary tables, prepared statements,
+    advisory locks). Returns False if the connection cannot be reused.
+
+    Django sets the time zone and role again each time it takes a connection.
+    """
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == base.psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != base.psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    # DISCARD ALL cannot run inside a transaction block
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DISCARD ALL")
+    finally:
+        connection.autocommit = autocommit
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pool(self):
+        params = self.get_connection_params()
+        options = {**DEFAULT_POOL, **self.settings_dict.get("POOL", {})}
+
+        def create():
+            return ConnectionPool(
+                lambda: super(DatabaseWrapper, self).get_new_connection(params),
+                check=check_connection,
+                reset=reset_connection,
+                max_size=options["MAX_SIZE"],
+                max_lifetime=options["MAX_LIFETIME"],
+                max_idle=options["MAX_IDLE"],
+                check_after=options["CHECK_AFTER"],
+                timeout=options["TIMEOUT"],
+            )
+
+        key = repr((sorted(params.items()), sorted(options.items())))
+        return get_pool(self.alias, key, create)
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.pool.getconn()
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        # The parent class sets this when it opens a connection, which may have been
+        # for another thread
+        self.isolation_level = base.IsolationLevel(
+            self.settings_dict["OPTIONS"].get(
+                "isolation_level", base.IsolationLevel.READ_COMMITTED
+            )
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # Still inside atomic(), Django keeps using the connection object until
+            # the block exits, so it cannot go to another thread
+            discard = self.in_atomic_block or self.errors_occurred
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection, discard=discard)
@@ -0,0 +1,194 @@
+"""
+Set-based deletion of folder subtrees.
+
+Django's cascade collector loads every descendant folder, post, tag link and share
+into memory before deleting anything. delete_subtree() instead finds the subtree
+with one materialized-path query per chunk and removes it with chunked DELETE
+statements, deepest folders first.
+
+Before anything is deleted, the whole subtree is marked `deleting` in one
+transaction, which also takes it out of its parent's counts and listing: from then
+on Folder.objects no longer returns any of it, so the listings stay consistent while
+the chunks are deleted, and need no further version bumps. Each chunk commits on its
+own. The marks outlive the process, so a deletion interrupted by a restart is
+finished by `manage.py resume_folder_deletions`.
+
+Raw deletes send no signals, so the work the signal receivers would have done
+(tag indexes, folder counts and versions, cached responses and sync tombstones) is
+done here. Only the folders get tombstones: their posts go with them.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models.functions import Length
+
+from .cache import response_cache
+from .models import Folder, FolderPermission, Post, TombstoneKind, User
+from .sync import record_removals
+from .tagindex import folder_tag_index, post_tag_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUBTREE_DELETE = {
+    # Rows deleted per statement
+    "CHUNK_SIZE": 1000,
+    # Subtrees with more folders and posts than this are deleted in the background
+    "BACKGROUND_THRESHOLD": 5000,
+}
+
+
+def subtree_delete_options():
+    return {**DEFAULT_SUBTREE_DELETE, **getattr(settings, "POSTE_SUBTREE_DELETE", {})}
+
+
+def subtree_size(folder):
+    """
+    Returns the number of folders and posts in the subtree of `folder`.
+    """
+    folders = folder.get_descendants(include_self=True)
+    return folders.count() + Post.objects.filter(folder__in=folders).count()
+
+
+def check_deletable(folder):
+    """
+    Raises ValidationError for a user's root folder, like Folder.delete(): it only
+    goes when the user does.
+    """
+    if (
+        folder.is_root
+        and folder.creator_id is not None
+        and User.objects.filter(id=folder.creator_id).exists()
+    ):
+        raise ValidationError(
+            "Cannot delete user's root folder unless the user is being deleted."
+        )
+
+
+def mark_deleting(folder):
+    """
+    Hides `folder` and its descendants, in one transaction that also removes the
+    folder from its parent's child folder count and bumps the parent's version.
+    """
+    with transaction.atomic():
+        if Folder.objects.filter(pk=folder.pk).update(deleting=True):
+            Folder.objects.descendants_of(folder.descendant_path_prefix).update(
+                deleting=True
+            )
+            Folder.objects.adjust_counts("child_folder_count", {folder.parent_id: -1})
+            if folder.parent_id is not None:
+                Folder.objects.filter(pk=folder.parent_id).bump_versions()
+    folder.deleting = True
+    if folder.parent_id is not None:
+        response_cache.invalidate_folders([folder.parent_id])
+
+
+def _subtree(folder):
+    return Folder.all_objects.descendants_of(
+        folder.descendant_path_prefix
+    ) | Folder.all_objects.filter(pk=folder.pk)
+
+
+def delete_subtree(folder, chunk_size=None):
+    """
+    Deletes `folder`, its descendants, their posts, tag links and shares. Returns the
+    number of folders and posts deleted.
+    """
+    check_deletable(folder)
+    chunk_size = chunk_size or subtree_delete_options()["CHUNK_SIZE"]
+    deleted = {"folders": 0, "posts": 0}
+    mark_deleting(folder)
+    # Folders created inside the subtree meanwhile make a chunk fail; it is then
+    # retried with them included, but not forever
+    retries = 3
+    while True:
+        # A folder's path is always longer than its parent's, so the longest paths
+        # come first and no folder is deleted before its children
+        folder_ids = list(
+            _subtree(folder)
+            .order_by(Length("path").desc(), "-pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not folder_ids:
+            break
+        deleted["posts"] += _delete_posts(folder_ids, chunk_size)
+        try:
+            with transaction.atomic():
+                # While the shares still tell who could see the folders
+                record_removals(TombstoneKind.FOLDER, [(pk, pk) for pk in folder_ids])
+                Folder.tags.through.objects.filter(
+                    folder_id__in=folder_ids
+                )._raw_delete(Folder.objects.db)
+                FolderPermission.objects.filter(folder_id__in=folder_ids)._raw_delete(
+                    FolderPermission.objects.db
+                )
+                deleted["folders"] += Folder.all_objects.filter(
+                    pk__in=folder_ids
+                )._raw_delete(Folder.objects.db)
+                folder_tag_index.remove_objects(folder_ids)
+        except IntegrityError:
+            retries -= 1
+            if retries == 0:
+                raise
+            continue
+        response_cache.invalidate_folders(folder_ids)
+    return deleted
+
+
+def _delete_posts(folder_ids, chunk_size):
+    deleted = 0
+    while True:
+        post_ids = list(
+            Post.objects.filter(folder_id__in=folder_ids).values_list("pk", flat=True)[
+                :chunk_size
+            ]
+        )
+        if not post_ids:
+            return deleted
+        with transaction.atomic():
+            Post.tags.through.objects.filter(post_id__in=post_ids)._raw_delete(
+                Post.objects.db
+            )
+            deleted += Post.objects.filter(pk__in=post_ids)._raw_delete(Post.objects.db)
+            post_tag_index.remove_objects(post_ids)
+
+
+def delete_folder(folder):
+    """
+    Deletes a folder's subtree, in a background thread if it is large. Returns the
+    thread doing the deletion, or None if it is already done. Either way the subtree
+    is gone from every listing when this returns. Raises ValidationError for a root
+    folder.
+    """
+    check_deletable(folder)
+    if subtree_size(folder) <= subtree_delete_options()["BACKGROUND_THRESHOLD"]:
+        delete_subtree(folder)
+        return None
+    mark_deleting(folder)
+    thread = threading.Thread(
+        target=_delete_in_background, args=(folder,), name=f"delete-folder-{folder.pk}"
+    )
+    thread.start()
+    return thread
+
+
+def _delete_in_background(folder):
+    try:
+        deleted = delete_subtree(folder)
+        logger.info("Deleted folder subtree", extra={"folder_id": folder.pk, **deleted})
+    except Exception:
+        logger.exception(
+            "Failed to delete folder subtree", extra={"folder_id": folder.pk}
+        )
+    finally:
+        close_old_connections()
+
+
+def interrupted_deletions():
+    """
+    Returns the folders marked for deletion whose parent is not, i.e. the top of
+    each subtree whose deletion was interrupted.
+    """
+    return Folder.all_objects.filter(deleting=True).exclude(parent__deleting=True)
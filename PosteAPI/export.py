@@ -0,0 +1,96 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Folder, Post
+
+# Rows fetched per query while walking the tree, and objects written per chunk
+CHUNK_SIZE = 2000
+OBJECTS_PER_WRITE = 100
+
+
+def iter_user_export(user, chunk_size=CHUNK_SIZE):
+    """
+    Yields a JSON document describing everything in a user's folder tree, as a series
+    of strings:
+
+        {"user": {...}, "folders": [...], "posts": [...]}
+
+    Folders and posts are read with chunked iterator() queries and written as soon as
+    they are read, so memory use stays flat however large the tree is.
+
+    The user's root folder is looked up right away rather than once the stream is
+    read, so Folder.DoesNotExist is raised before anything is sent.
+    """
+    root = Folder.objects.get(creator=user, is_root=True)
+    return _iter_export(user, root, chunk_size)
+
+
+def _iter_export(user, root, chunk_size):
+    tree = root.get_descendants(include_self=True)
+    folders = tree.order_by("path", "id").prefetch_related("tags").iterator(chunk_size)
+    posts = (
+        Post.objects.filter(folder__in=tree)
+        .order_by("folder_id", "id")
+        .prefetch_related("tags")
+        .iterator(chunk_size)
+    )
+
+    yield '{"user": %s' % _dumps(
+        {
+            "id": user.id,
+            "email": user.email,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+        }
+    )
+    yield ', "folders": '
+    yield from _iter_array(_folder_data(folder) for folder in folders)
+    yield ', "posts": '
+    yield from _iter_array(_post_data(post) for post in posts)
+    yield "}\n"
+
+
+def _folder_data(folder):
+    return {
+        "id": folder.id,
+        "parent_id": folder.parent_id,
+        "title": folder.title,
+        "description": folder.description,
+        "is_root": folder.is_root,
+        "created_at": folder.created_at,
+        "tags": [tag.name for tag in folder.tags.all()],
+    }
+
+
+def _post_data(post):
+    return {
+        "id": post.id,
+        "folder_id": post.folder_id,
+        "creator_id": post.creator_id,
+        "title": post.title,
+        "description": post.description,
+        "url": post.url,
+        "created_at": post.created_at,
+        "tags": [tag.name for tag in post.tags.all()],
+    }
+
+
+def _iter_array(objects):
+    """
+    Encodes an iterable as a JSON array, a few objects per yielded string.
+    """
+    yield "["
+    batch = []
+    separator = ""
+    for obj in objects:
+        batch.append(separator + _dumps(obj))
+        separator = ", "
+        if len(batch) >= OBJECTS_PER_WRITE:
+            yield "".join(batch)
+            batch = []
+    yield "".join(batch) + "]"
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder)
@@ -0,0 +1,144 @@
+"""
+Admission control for password hashing.
+
+Checking or hashing a password is deliberately slow. hashlib's PBKDF2 releases the
+GIL, so hashes in different request threads do run in parallel, but a burst of
+logins would still take every worker thread and core for as long as it lasts.
+HashingSlots lets at most MAX_PENDING passwords per process be hashed at once;
+once they are all taken, a request waits up to WAIT seconds for a slot and then
+gets HashingBusy, which the views turn into 503 Service Unavailable. Hashing runs in
+the request thread: handing it to another process would not free that thread, which
+waits for the result either way.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+DEFAULT_PASSWORD_HASHING = {
+    # Passwords being hashed at once, per server process
+    "MAX_PENDING": 8,
+    # Seconds a request waits for one of them to be free before giving up
+    "WAIT": 2.0,
+}
+
+
+def password_hashing_options():
+    return {
+        **DEFAULT_PASSWORD_HASHING,
+        **getattr(settings, "POSTE_PASSWORD_HASHING", {}),
+    }
+
+
+class HashingBusy(Exception):
+    """Raised when too many passwords are already being hashed."""
+
+
+class HashingSlots:
+    def __init__(self, max_pending, wait):
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def run(self, function, *args):
+        """
+        Returns `function(*args)`, run once a slot is free.
+        """
+        if not self._slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            return function(*args)
+        finally:
+            self._slots.release()
+
+
+_options = password_hashing_options()
+hashing_slots = HashingSlots(_options["MAX_PENDING"], _options["WAIT"])
+
+
+def _must_update(encoded):
+    # Same as the setter condition in django.contrib.auth.hashers.check_password
+    preferred = hashers.get_hasher("default")
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(password, encoded):
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    return hashing_slots.run(hashers.check_password, password, encoded)
+
+
+def hash_password(password):
+    return hashing_slots.run(hashers.make_password, password)
+
+
+def set_user_password(user, password):
+    """
+    Same as user.set_password(password), within a hashing slot.
+    """
+    user.password = hash_password(password)
+    user._password = password  # lets save() notify the password validators
+
+
+def check_user_password(user, password):
+    """
+    Same as user.check_password(password), within a hashing slot. Like Django, it
+    rehashes and saves the password if it was hashed with outdated settings.
+    """
+    if not verify_password(password, user.password):
+        return False
+    if _must_update(user.password):
+        set_user_password(user, password)
+        user._password = None
+        user.save(update_fields=["password"])
+    return True
+
+
+# Work factor attribute of each hasher, and whether hashing time grows linearly
+# with it or doubles with each step
+WORK_FACTORS = {
+    "pbkdf2_sha256": ("iterations", "linear"),
+    "pbkdf2_sha1": ("iterations", "linear"),
+    "argon2": ("time_cost", "linear"),
+    "scrypt": ("work_factor", "linear"),
+    "bcrypt_sha256": ("rounds", "exponential"),
+    "bcrypt": ("rounds", "exponential"),
+}
+
+
+def time_hasher(hasher, samples=5):
+    """
+    Returns the median number of seconds `hasher` takes to hash a password.
+    """
+    timings = []
+    for _ in range(samples):
+        salt = hasher.salt()
+        started = time.perf_counter()
+        hasher.encode("benchmark-password", salt)
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2]
+
+
+def recommend_work_factor(hasher, seconds, target_seconds):
+    """
+    Returns (attribute, current value, value expected to take `target_seconds`), or
+    None for hashers without a work factor.
+    """
+    if hasher.algorithm not in WORK_FACTORS:
+        return None
+    attribute, growth = WORK_FACTORS[hasher.algorithm]
+    current = getattr(hasher, attribute)
+    ratio = target_seconds / seconds
+    if growth == "exponential":
+        recommended = current + math.floor(math.log2(ratio))
+    elif attribute == "work_factor":
+        # scrypt needs a power of two
+        recommended = 2 ** math.floor(math.log2(current * ratio))
+    else:
+        recommended = math.floor(current * ratio)
+    return attribute, current, max(recommended, 1)
@@ -0,0 +1,118 @@
+"""
+Building blocks of the folder listing served by DataView and AsyncDataView.
+
+Each function below makes its own queries and depends only on its arguments, so the
+async view can run them concurrently.
+"""
+import hashlib
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+from .cache import response_cache
+from .models import Folder, Post
+from .serializers import FolderSerializer, PostSerializer
+
+
+def get_listed_folder(user, folder_id=None):
+    """
+    Returns the folder with id `folder_id`, or the user's root folder, or None.
+    """
+    if folder_id:
+        return Folder.objects.filter(id=folder_id).first()
+    return Folder.objects.filter(creator=user, is_root=True).first()
+
+
+def shared_folder_versions(user):
+    # Every folder the user holds a permission on, including their own
+    shared = Folder.objects.accessible_to(user, include_owned=False)
+    return list(shared.order_by("pk").values_list("pk", "version"))
+
+
+def listing_etag(user, versions):
+    """
+    Returns the ETag of a folder listing shown to `user`, given the (id, version) of
+    every folder it depends on. Folder versions change whenever their listing does.
+    """
+    payload = json.dumps([user.pk, list(versions)], separators=(",", ":"))
+    return '"%s"' % hashlib.sha1(payload.encode()).hexdigest()
+
+
+def cache_key(etag):
+    return "data:" + etag.strip('"')
+
+
+def serialize_child_folders(user, folder):
+    """
+    Returns the serialized child folders of `folder` created by `user`, and their ids.
+    """
+    folders = list(Folder.objects.filter(creator=user, parent=folder).for_listing())
+    return FolderSerializer(folders, many=True).data, [f.pk for f in folders]
+
+
+def serialize_posts(folder):
+    return PostSerializer(
+        Post.objects.filter(folder=folder).for_listing(), many=True
+    ).data
+
+
+def serialize_subtree(folder, user, depth=None):
+    """
+    Returns `folder` serialized with its posts and, nested under "folders", the
+    descendants `user` can see down to `depth` levels below it (all of them if None),
+    each with their own posts and descendants. A folder below one the user cannot
+    see is left out along with it.
+
+    The whole subtree is read with one range scan of the path index, so the number
+    of queries does not depend on its size or depth. A recursive CTE would do the
+    same in one query, but folders already store their materialized path: the range
+    scan needs no raw SQL per database, and depth and permission filters stay plain
+    ORM lookups on the same queryset.
+    """
+    folders = folder.get_descendants(include_self=True).accessible_to(user).with_depth()
+    if depth is not None:
+        folders = folders.filter(depth__lte=folder.path.count("/") - 1 + depth)
+    # Parents have shorter paths, so each folder is placed after its parent
+    folders = folders.for_listing().order_by("depth", "pk")
+    nodes = {}
+    for child in folders:
+        if child.pk != folder.pk and child.parent_id not in nodes:
+            continue
+        node = {**FolderSerializer(child).data, "folders": [], "posts": []}
+        nodes[child.pk] = node
+        if child.pk != folder.pk:
+            nodes[child.parent_id]["folders"].append(node)
+    # The folders serialized above, not a subquery that would also match the folders
+    # created since
+    posts = Post.objects.filter(folder_id__in=list(nodes)).for_listing()
+    for post in posts.order_by("pk"):
+        nodes[post.folder_id]["posts"].append(PostSerializer(post).data)
+    return nodes[folder.pk]
+
+
+def serialize_shared_folders(versions):
+    """
+    Serializes the folders with the given (id, version) pairs. A shared folder looks
+    the same to everyone it is shared with, so each one is cached once per version
+    and reused across users.
+    """
+    keys = {pk: f"folder:{pk}:{version}" for pk, version in versions}
+    cached = response_cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cached]
+    if missing:
+        folders = Folder.objects.filter(pk__in=missing).for_listing()
+        serialized = {f.pk: dict(FolderSerializer(f).data) for f in folders}
+        response_cache.set_many(
+            {keys[pk]: (data, [pk]) for pk, data in serialized.items()}
+        )
+        cached.update({keys[pk]: data for pk, data in serialized.items()})
+    return [cached[keys[pk]] for pk in keys if keys[pk] in cached]
+
+
+def cache_listing(etag, listing, folder_ids):
+    """
+    Renders and caches a listing, returning the rendered JSON.
+    """
+    body = JSONRenderer().render(listing)
+    response_cache.set(cache_key(etag), body, folder_ids)
+    return body
@@ -0,0 +1,185 @@
+"""
+Structured, non-blocking logging for PosteAPI.
+
+Records are turned into JSON lines by a background thread: BackgroundHandler only
+puts them on a bounded queue, so a request thread never waits on I/O. When the
+queue is full, records are dropped and counted rather than blocking. Every record
+carries the id of the request it was logged in (see RequestIdMiddleware), plus any
+fields passed with `extra`.
+
+Configured in PosteBackend/settings.py (LOGGING): LOG_LEVEL sets the level of the
+PosteAPI loggers, LOG_LEVELS overrides it per logger ("PosteAPI.views=DEBUG,...")
+and LOG_SAMPLING keeps only a share of the records below WARNING of a logger
+("PosteAPI.views=0.1,...").
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+current_request_id = contextvars.ContextVar("current_request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed with `extra`
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def parse_logger_values(value, convert):
+    """
+    Parses "logger=value,logger=value" (as used by LOG_LEVELS and LOG_SAMPLING) into
+    a dict, converting each value with `convert`.
+    """
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {name.strip(): convert(setting.strip()) for name, setting in pairs}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a share of the records below WARNING, per logger. `rates` maps logger
+    names to the share kept; a logger without a rate uses its nearest ancestor's.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Hands records to a writer thread through a bounded queue. The writer formats
+    them with this handler's formatter and writes them to `stream`.
+    """
+
+    def __init__(self, stream=None, max_queue_size=10000):
+        super().__init__()
+        self.queue = queue.Queue(max_queue_size)
+        self.dropped = 0
+        self.writer = logging.StreamHandler(stream or sys.stdout)
+        self.listener = QueueListener(self.queue, self.writer)
+        self.listener.start()
+        self.stopped = False
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.writer.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Resolves everything that depends on the calling thread, i.e. the message
+        arguments, the traceback and the request id, leaving formatting to the writer.
+        """
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = current_request_id.get()
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def drain(self):
+        """
+        Blocks until every queued record has been written.
+        """
+        self.queue.join()
+
+    def close(self):
+        if not self.stopped:
+            self.stopped = True
+            self.listener.stop()  # writes out what is still queued
+        super().close()
+
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id, taken from a well-formed X-Request-ID header (e.g. set
+    by nginx) or generated. Logs record it, and the response echoes it back.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_id.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_id.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    @staticmethod
+    def start(request):
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return current_request_id.set(request_id)
@@ -0,0 +1,109 @@
+import json
+import subprocess
+from dataclasses import fields
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner
+
+from PosteAPI.benchmark import ENDPOINTS, DatasetShape, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the main endpoints against a synthetic dataset in a throwaway test "
+        "database and reports latency percentiles and query counts as JSON"
+    )
+
+    def add_arguments(self, parser):
+        defaults = DatasetShape()
+        for field in fields(DatasetShape):
+            parser.add_argument(
+                "--" + field.name.replace("_", "-"),
+                type=field.type,
+                default=getattr(defaults, field.name),
+            )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=50,
+            help="Requests made to each endpoint (default: 50)",
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            choices=ENDPOINTS,
+            help="Only benchmark this endpoint; may be repeated",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="File to write the results to (default: standard output)",
+        )
+        parser.add_argument(
+            "--compare",
+            help="Results of an earlier run to print the latency changes against",
+        )
+
+    def handle(self, *args, **options):
+        shape = DatasetShape(
+            **{field.name: options[field.name] for field in fields(DatasetShape)}
+        )
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        # Run against a fresh test database, never the configured one
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            results = run_benchmark(shape, options["iterations"], options["endpoints"])
+        finally:
+            runner.teardown_databases(old_config)
+        results["commit"] = self.current_commit()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        if baseline:
+            self.print_comparison(baseline, results)
+
+    def current_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_comparison(self, baseline, results):
+        self.stderr.write(
+            f"{'endpoint':<20}{'p50 ms':>20}{'p95 ms':>20}{'queries':>12}"
+        )
+        for name, current in results["endpoints"].items():
+            previous = baseline.get("endpoints", {}).get(name)
+            if previous is None:
+                continue
+            columns = [
+                self.change(previous["latency_ms"][key], current["latency_ms"][key])
+                for key in ("p50", "p95")
+            ]
+            queries = f"{previous['queries']['p50']} -> {current['queries']['p50']}"
+            self.stderr.write(
+                f"{name:<20}{columns[0]:>20}{columns[1]:>20}{queries:>12}"
+            )
+
+    def change(self, before, after):
+        percent = (after - before) / before * 100 if before else 0
+        return f"{before:.1f} -> {after:.1f} ({percent:+.0f}%)"
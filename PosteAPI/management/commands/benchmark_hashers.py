@@ -0,0 +1,52 @@
+import os
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+from PosteAPI.hashing import recommend_work_factor, time_hasher
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the configured password hashers on this host and recommends work "
+        "factors for a target hashing time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-ms",
+            type=float,
+            default=250,
+            help="Time one password hash should take, in milliseconds (default: 250)",
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=5,
+            help="Hashes timed per hasher; the median is reported (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        target = options["target_ms"] / 1000
+        cpus = os.cpu_count() or 1
+        for index, hasher in enumerate(get_hashers()):
+            name = type(hasher).__name__
+            if index == 0:
+                name += " (default)"
+            try:
+                seconds = time_hasher(hasher, options["samples"])
+            except ValueError as e:  # the hasher's library is not installed
+                self.stdout.write(f"{name}: unavailable ({e})")
+                continue
+            line = (
+                f"{name}: {seconds * 1000:.1f} ms per hash, "
+                f"about {cpus / seconds:.0f} hashes/s with {cpus} CPU(s)"
+            )
+            recommendation = recommend_work_factor(hasher, seconds, target)
+            if recommendation is not None:
+                attribute, current, recommended = recommendation
+                line += (
+                    f"; {attribute}={current}, use {attribute}={recommended} "
+                    f"for {options['target_ms']:g} ms"
+                )
+            self.stdout.write(line)
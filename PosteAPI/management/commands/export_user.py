@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from PosteAPI.export import iter_user_export
+from PosteAPI.models import Folder, User
+
+
+class Command(BaseCommand):
+    help = "Exports a user's folders, posts and tags as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Email of the user to export")
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="File to write the export to (default: standard output)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options["email"].lower())
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist")
+        try:
+            chunks = iter_user_export(user)
+        except Folder.DoesNotExist:
+            raise CommandError(f"User {options['email']} has no root folder")
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from PosteAPI.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Deletes the sync tombstones older than POSTE_SYNC['TOMBSTONE_DAYS']"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Keep the tombstones of this many days instead",
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones(options["days"])
+        self.stdout.write(f"Deleted {deleted} tombstone(s)")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from PosteAPI.models import Folder
+from PosteAPI.signals import bump_folder_versions
+
+
+class Command(BaseCommand):
+    help = "Recomputes the post and child folder counts stored on folders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the folders whose counts are wrong",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            wrong = list(
+                Folder.objects.with_wrong_counts().values_list("pk", flat=True)
+            )
+            if wrong and not options["dry_run"]:
+                Folder.objects.filter(pk__in=wrong).recount()
+                # Counts are shown in the listings of the folders' parents
+                bump_folder_versions(wrong)
+        action = "Found" if options["dry_run"] else "Fixed"
+        self.stdout.write(f"{action} wrong counts on {len(wrong)} folder(s)")
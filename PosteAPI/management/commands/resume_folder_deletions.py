@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from PosteAPI.deletion import delete_subtree, interrupted_deletions
+
+
+class Command(BaseCommand):
+    help = (
+        "Finishes deleting the folder subtrees whose background deletion was "
+        "interrupted, e.g. by a restart"
+    )
+
+    def handle(self, *args, **options):
+        folders = list(interrupted_deletions())
+        for folder in folders:
+            deleted = delete_subtree(folder)
+            self.stdout.write(
+                f"Deleted folder {folder.pk}: {deleted['folders']} folder(s), "
+                f"{deleted['posts']} post(s)"
+            )
+        self.stdout.write(f"Resumed {len(folders)} deletion(s)")
@@ -1,7 +1,202 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce, Concat, Length, Replace, Substr
+from django.utils import timezone
 
 
-class FolderManager(models.Manager):
+def path_ids(path):
+    """Returns the ancestor ids stored in a materialized path, nearest first."""
+    return [int(pk) for pk in reversed(path.strip("/").split("/")) if pk]
+
+
+class FolderQuerySet(models.QuerySet):
+    def descendants_of(self, path_prefix):
+        """
+        Returns the folders whose materialized path starts with `path_prefix`, i.e.
+        every descendant of the folder that prefix belongs to.
+        """
+        if connections[self.db].vendor == "sqlite":
+            # SQLite only uses an index for LIKE when it is case-sensitive, so scan
+            # the index as a range instead: paths only hold digits and "/", and "0"
+            # is the character that sorts right after "/"
+            return self.filter(path__gte=path_prefix, path__lt=path_prefix[:-1] + "0")
+        return self.filter(path__startswith=path_prefix)
+
+    def with_depth(self):
+        """
+        Annotates each folder with `depth`, its number of ancestors (0 for a root
+        folder), counted from the "/" separators of its path.
+        """
+        return self.annotate(
+            depth=Length("path")
+            - Length(Replace("path", models.Value("/"), models.Value("")))
+            - 1
+        )
+
+    def rebase_paths(self, old_prefix, new_prefix):
+        """
+        Replaces `old_prefix` with `new_prefix` in the paths of the folders below
+        `old_prefix`, i.e. moves a subtree, in a single UPDATE.
+        """
+        return self.descendants_of(old_prefix).update(
+            path=Concat(
+                models.Value(new_prefix),
+                Substr("path", len(old_prefix) + 1),
+                output_field=models.CharField(),
+            )
+        )
+
+    def longest_path(self):
+        """Returns the length of the longest path among these folders, or 0."""
+        return self.aggregate(longest=Coalesce(models.Max(Length("path")), 0))[
+            "longest"
+        ]
+
+    def lock_with_ancestors(self, pks):
+        """
+        Locks the folders with the given ids and all their ancestors (SELECT ... FOR
+        UPDATE, in id order) and returns them by id. Two moves that could only make a
+        cycle together, one into the subtree of the other, then both lock both moved
+        folders, so the second sees where the first put them.
+        """
+        pks = set(pks)
+        paths = dict(self.filter(pk__in=pks).values_list("pk", "path"))
+        wanted = pks | {pk for path in paths.values() for pk in path_ids(path)}
+        while True:
+            folders = {
+                folder.pk: folder
+                for folder in self.select_for_update()
+                .filter(pk__in=wanted)
+                .order_by("pk")
+            }
+            ancestors = {
+                ancestor
+                for pk in pks & folders.keys()
+                for ancestor in path_ids(folders[pk].path)
+            }
+            if ancestors <= wanted:
+                return folders
+            # One of them moved before the lock was taken
+            wanted |= ancestors
+
+    def delete(self):
+        from PosteAPI.sync import record_subtree_removals, removals_recorded
+
+        with transaction.atomic(using=self.db):
+            # For every subtree at once, instead of each folder and post
+            record_subtree_removals(self)
+            with removals_recorded():
+                return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bump_versions(self):
+        """
+        Increments the version of these folders and of their parents, whose listings
+        include them, and sets their updated_at. Returns the number of folders bumped.
+        """
+        return self.model.objects.filter(
+            models.Q(pk__in=self.values("pk"))
+            | models.Q(pk__in=self.values("parent_id"))
+        ).update(version=models.F("version") + 1, updated_at=timezone.now())
+
+    def accessible_to(self, user, min_permission="viewer", include_owned=True):
+        """
+        Returns the folders `user` holds at least `min_permission` on, plus those they
+        created unless `include_owned` is false. Resolved in the same query, through
+        a subquery on the (user, folder) index of FolderPermission.
+        """
+        from PosteAPI.models import FolderPermission, FolderPermissionEnum
+
+        accessible = models.Q(
+            pk__in=FolderPermission.objects.filter(
+                user=user, permission__in=FolderPermissionEnum.at_least(min_permission)
+            ).values("folder_id")
+        )
+        if include_owned:
+            accessible |= models.Q(creator=user)
+        return self.filter(accessible)
+
+    def adjust_counts(self, field, deltas):
+        """
+        Adds `deltas[folder id]` to the `field` count ("post_count" or
+        "child_folder_count") of each folder, with one UPDATE per distinct delta.
+        """
+        folders_by_delta = {}
+        for pk, delta in deltas.items():
+            if pk is not None and delta:
+                folders_by_delta.setdefault(delta, []).append(pk)
+        for delta, folder_ids in folders_by_delta.items():
+            self.filter(pk__in=folder_ids).update(**{field: models.F(field) + delta})
+
+    def _actual_counts(self):
+        from PosteAPI.models import Post
+
+        def count(queryset, field):
+            counts = (
+                queryset.filter(**{field: models.OuterRef("pk")})
+                .order_by()
+                .values(field)
+                .annotate(count=models.Count("pk"))
+                .values("count")
+            )
+            return Coalesce(models.Subquery(counts), 0)
+
+        return {
+            "post_count": count(Post.objects.all(), "folder"),
+            "child_folder_count": count(self.model.objects.all(), "parent"),
+        }
+
+    def with_wrong_counts(self):
+        """
+        Returns the folders whose post or child folder count is off.
+        """
+        actual = self._actual_counts()
+        return self.annotate(
+            actual_post_count=actual["post_count"],
+            actual_child_folder_count=actual["child_folder_count"],
+        ).exclude(
+            post_count=models.F("actual_post_count"),
+            child_folder_count=models.F("actual_child_folder_count"),
+        )
+
+    def recount(self):
+        """
+        Recomputes the post and child folder counts of these folders in one UPDATE.
+        """
+        return self.update(**self._actual_counts())
+
+    def for_listing(self):
+        """
+        Loads everything FolderSerializer needs up front, so serializing a listing
+        costs a fixed number of queries no matter how many folders it contains.
+        """
+        from PosteAPI.models import FolderPermission
+
+        return self.prefetch_related(
+            "tags",
+            models.Prefetch(
+                "child_folders", queryset=self.model.objects.only("id", "parent")
+            ),
+            models.Prefetch(
+                "folderpermission_set",
+                queryset=FolderPermission.objects.select_related("user"),
+            ),
+        )
+
+
+class FolderManager(models.Manager.from_queryset(FolderQuerySet)):
+    def __init__(self, include_deleting=False):
+        super().__init__()
+        self.include_deleting = include_deleting
+
+    def get_queryset(self):
+        # Folders being deleted in the background are hidden everywhere at once
+        queryset = super().get_queryset()
+        if self.include_deleting:
+            return queryset
+        return queryset.filter(deleting=False)
+
     def create(self, *args, **kwargs):
         if (
             "parent" not in kwargs or kwargs["parent"] is None
@@ -14,3 +209,24 @@ class FolderManager(models.Manager):
             )  # get root folder for the creator
             kwargs["parent"] = root_folder
         return super().create(*args, **kwargs)
+
+
+class PostQuerySet(models.QuerySet):
+    def delete(self):
+        from PosteAPI.models import TombstoneKind
+        from PosteAPI.sync import record_removals, removals_recorded
+
+        with transaction.atomic(using=self.db):
+            # In one batch, instead of a few queries per post
+            record_removals(TombstoneKind.POST, self.values_list("pk", "folder_id"))
+            with removals_recorded():
+                return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def for_listing(self):
+        """
+        Loads everything PostSerializer needs up front.
+        """
+        return self.prefetch_related("tags")
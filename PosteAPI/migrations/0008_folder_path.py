@@ -0,0 +1,42 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    """
+    Fills in the materialized path of every existing folder, one tree level at a time.
+    """
+    Folder = apps.get_model("PosteAPI", "Folder")
+    db_alias = schema_editor.connection.alias
+    folders = Folder.objects.using(db_alias)
+
+    parent_paths = {}
+    level = list(folders.filter(parent__isnull=True).only("id", "parent_id", "path"))
+    while level:
+        for folder in level:
+            folder.path = parent_paths.get(folder.parent_id, "/")
+        folders.bulk_update(level, ["path"], batch_size=500)
+        parent_paths = {folder.id: f"{folder.path}{folder.id}/" for folder in level}
+        level = list(
+            folders.filter(parent_id__in=list(parent_paths)).only(
+                "id", "parent_id", "path"
+            )
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0007_folder_description"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="path",
+            field=models.CharField(
+                db_index=True, default="/", editable=False, max_length=1000
+            ),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
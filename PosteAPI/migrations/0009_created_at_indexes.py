@@ -0,0 +1,30 @@
+# Generated by Django 4.2.5 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0008_folder_path"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="folder",
+            index=models.Index(
+                fields=["created_at", "id"], name="PosteAPI_fo_created_7ccc7c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["created_at", "id"], name="PosteAPI_po_created_abf0b5_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["created_at", "id"], name="PosteAPI_us_created_b90e47_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+from django.db import migrations
+
+# The DDL is copied here rather than imported from PosteAPI.search, so that this
+# migration keeps creating the same index whatever later becomes of the app code.
+
+POSTGRES_INDEX_SQL = [
+    """
+    ALTER TABLE "PosteAPI_post" ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(url, '')), 'C')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS "PosteAPI_post_search_idx"
+    ON "PosteAPI_post" USING GIN (search_vector)
+    """,
+]
+POSTGRES_DROP_SQL = [
+    'DROP INDEX IF EXISTS "PosteAPI_post_search_idx"',
+    'ALTER TABLE "PosteAPI_post" DROP COLUMN IF EXISTS search_vector',
+]
+
+# See https://www.sqlite.org/fts5.html#external_content_tables
+SQLITE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS "PosteAPI_post_fts" USING fts5(
+        title, description, url,
+        content='PosteAPI_post', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "PosteAPI_post_fts_ai" AFTER INSERT ON "PosteAPI_post"
+    BEGIN
+        INSERT INTO "PosteAPI_post_fts"(rowid, title, description, url)
+        VALUES (new.id, new.title, new.description, new.url);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "PosteAPI_post_fts_ad" AFTER DELETE ON "PosteAPI_post"
+    BEGIN
+        INSERT INTO "PosteAPI_post_fts"("PosteAPI_post_fts", rowid, title, description, url)
+        VALUES ('delete', old.id, old.title, old.description, old.url);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "PosteAPI_post_fts_au" AFTER UPDATE ON "PosteAPI_post"
+    BEGIN
+        INSERT INTO "PosteAPI_post_fts"("PosteAPI_post_fts", rowid, title, description, url)
+        VALUES ('delete', old.id, old.title, old.description, old.url);
+        INSERT INTO "PosteAPI_post_fts"(rowid, title, description, url)
+        VALUES (new.id, new.title, new.description, new.url);
+    END
+    """,
+    """INSERT INTO "PosteAPI_post_fts"("PosteAPI_post_fts") VALUES ('rebuild')""",
+]
+SQLITE_DROP_SQL = [
+    'DROP TRIGGER IF EXISTS "PosteAPI_post_fts_ai"',
+    'DROP TRIGGER IF EXISTS "PosteAPI_post_fts_ad"',
+    'DROP TRIGGER IF EXISTS "PosteAPI_post_fts_au"',
+    'DROP TABLE IF EXISTS "PosteAPI_post_fts"',
+]
+
+
+def run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def forwards(apps, schema_editor):
+    run(schema_editor, {"postgresql": POSTGRES_INDEX_SQL, "sqlite": SQLITE_INDEX_SQL})
+
+
+def backwards(apps, schema_editor):
+    run(schema_editor, {"postgresql": POSTGRES_DROP_SQL, "sqlite": SQLITE_DROP_SQL})
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0009_created_at_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
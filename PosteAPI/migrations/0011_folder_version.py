@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0010_post_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="version",
+            field=models.PositiveBigIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.5 on 2026-10-17 04:10
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Folder = apps.get_model("PosteAPI", "Folder")
+    Post = apps.get_model("PosteAPI", "Post")
+    db_alias = schema_editor.connection.alias
+
+    def count(model, field):
+        counts = (
+            model.objects.using(db_alias)
+            .filter(**{field: models.OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=models.Count("pk"))
+            .values("count")
+        )
+        return Coalesce(models.Subquery(counts), 0)
+
+    Folder.objects.using(db_alias).update(
+        post_count=count(Post, "folder"),
+        child_folder_count=count(Folder, "parent"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0011_folder_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="child_folder_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="folder",
+            name="post_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
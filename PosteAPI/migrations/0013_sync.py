@@ -0,0 +1,119 @@
+# Generated by Django 4.2.5 on 2026-10-17 05:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Adding a column rebuilds the post table on SQLite, dropping the triggers that keep
+# the search index of 0010_post_search_index up to date; copied from there
+SQLITE_TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS "PosteAPI_post_fts_ai" AFTER INSERT ON "PosteAPI_post"
+    BEGIN
+        INSERT INTO "PosteAPI_post_fts"(rowid, title, description, url)
+        VALUES (new.id, new.title, new.description, new.url);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "PosteAPI_post_fts_ad" AFTER DELETE ON "PosteAPI_post"
+    BEGIN
+        INSERT INTO "PosteAPI_post_fts"("PosteAPI_post_fts", rowid, title, description, url)
+        VALUES ('delete', old.id, old.title, old.description, old.url);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "PosteAPI_post_fts_au" AFTER UPDATE ON "PosteAPI_post"
+    BEGIN
+        INSERT INTO "PosteAPI_post_fts"("PosteAPI_post_fts", rowid, title, description, url)
+        VALUES ('delete', old.id, old.title, old.description, old.url);
+        INSERT INTO "PosteAPI_post_fts"(rowid, title, description, url)
+        VALUES (new.id, new.title, new.description, new.url);
+    END
+    """,
+    """INSERT INTO "PosteAPI_post_fts"("PosteAPI_post_fts") VALUES ('rebuild')""",
+]
+
+
+def recreate_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in SQLITE_TRIGGER_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0012_folder_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="folderpermission",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(recreate_search_triggers, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("folder", "Folder"), ("post", "Post")], max_length=6
+                    ),
+                ),
+                ("object_id", models.PositiveBigIntegerField()),
+                ("user_id", models.PositiveBigIntegerField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user_id", "deleted_at", "id"],
+                        name="PosteAPI_to_user_id_8a3282_idx",
+                    ),
+                    models.Index(
+                        fields=["deleted_at"], name="PosteAPI_to_deleted_f2b1a1_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="folder",
+            index=models.Index(
+                fields=["updated_at", "id"], name="PosteAPI_fo_updated_1c110d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["updated_at", "id"], name="PosteAPI_po_updated_99af80_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-17 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PosteAPI", "0013_sync"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="deleting",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -2,10 +2,10 @@ import string
 
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy
 
-from PosteAPI.managers import FolderManager
+from PosteAPI.managers import FolderManager, PostQuerySet, path_ids
 
 
 class User(AbstractUser):
@@ -14,6 +14,31 @@ class User(AbstractUser):
     last_name = models.CharField(max_length=150, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [models.Index(fields=["created_at", "id"])]
+
+    def delete(self, *args, **kwargs):
+        from PosteAPI.sync import (
+            record_removals,
+            record_subtree_removals,
+            removals_recorded,
+        )
+
+        with transaction.atomic():
+            # The user's folders cascade with their subtrees, and their posts in
+            # other users' folders go too
+            folder_ids = record_subtree_removals(
+                Folder.all_objects.filter(creator=self)
+            )
+            record_removals(
+                TombstoneKind.POST,
+                Post.objects.filter(creator=self)
+                .exclude(folder_id__in=folder_ids)
+                .values_list("pk", "folder_id"),
+            )
+            with removals_recorded():
+                return super().delete(*args, **kwargs)
+
     def unshare_folder_with_target(self, folder, target):
         folder_permissions = FolderPermission.objects.filter(user=target, folder=folder)
         if not folder_permissions:
@@ -114,6 +139,8 @@ class User(AbstractUser):
 
 class Folder(models.Model):
     objects = FolderManager()
+    # Also returns the folders being deleted (see PosteAPI.deletion)
+    all_objects = FolderManager(include_deleting=True)
     title = models.CharField(max_length=100, blank=False)
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
     tags = models.ManyToManyField("Tag", blank=True, related_name="folder")
@@ -128,6 +155,56 @@ class Folder(models.Model):
     is_root = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(default="")
+    # Materialized path: the ids of all ancestors, root first, e.g. "/1/5/" for a
+    # folder whose parent is 5 and whose root is 1. A root folder's path is "/".
+    # Kept up to date by save(), so ancestor and descendant lookups never recurse.
+    path = models.CharField(max_length=1000, default="/", db_index=True, editable=False)
+    # Incremented whenever anything shown in this folder's listing changes: its own
+    # fields, tags and shares, or its child folders and posts (see PosteAPI.signals).
+    # Only ever changed by UPDATE queries, never written back by save().
+    version = models.PositiveBigIntegerField(default=1, editable=False)
+    # Number of posts and child folders, kept by UPDATE queries in the same
+    # transaction as the change (see PosteAPI.signals); `manage.py recount_folders`
+    # recomputes them
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    child_folder_count = models.PositiveIntegerField(default=0, editable=False)
+    # Set whenever the version is incremented, so clients can sync what changed
+    # since a point in time (see PosteAPI.sync)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set on a subtree that is being deleted, which Folder.objects no longer returns
+    deleting = models.BooleanField(default=False, editable=False)
+
+    # Fields only ever changed by UPDATE queries; save() never writes them back
+    QUERY_MAINTAINED_FIELDS = (
+        "version",
+        "post_count",
+        "child_folder_count",
+        "deleting",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["updated_at", "id"]),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_saved_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_saved_state()
+
+    def _remember_saved_state(self):
+        """
+        Records the hierarchy as it is stored in the database, so save() can tell
+        whether the folder moved.
+        """
+        self._saved_parent_id = self.__dict__.get("parent_id")
+        self._saved_path = self.__dict__.get("path")
 
     def delete(self, *args, **kwargs):
         if (
@@ -138,10 +215,23 @@ class Folder(models.Model):
             raise ValidationError(
                 "Cannot delete user's root folder unless the user is being deleted."
             )
-        super().delete(*args, **kwargs)
+        from PosteAPI.sync import record_subtree_removals, removals_recorded
+
+        with transaction.atomic():
+            # For the whole subtree at once, instead of each folder and post
+            record_subtree_removals(Folder.all_objects.filter(pk=self.pk))
+            with removals_recorded():
+                return super().delete(*args, **kwargs)
 
     def set_parent(self, new_parent):
-        if new_parent and self in new_parent.get_ancestors():
+        # Re-assigning the current parent (as prefetch_related does) cannot create
+        # a cycle, so skip walking the ancestors in that case
+        unchanged = (
+            new_parent is not None
+            and new_parent.pk is not None
+            and new_parent.pk == self.__dict__.get("parent_id")
+        )
+        if new_parent and not unchanged and self.is_ancestor_of(new_parent):
             raise ValidationError("A folder cannot be an ancestor of itself.")
         super(Folder, self).__setattr__("parent", new_parent)
 
@@ -153,12 +243,67 @@ class Folder(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        moved = self._state.adding or self.parent_id != getattr(
+            self, "_saved_parent_id", None
+        )
+        if moved:
+            self.path = self._build_path()
+            if self._state.adding:
+                self.check_path_length(self.path)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # The version and counts in memory may be stale, so never write them back.
+            # Neither is the path of a folder that did not move: one of its ancestors
+            # may have moved since it was loaded.
+            skipped = set(self.QUERY_MAINTAINED_FIELDS)
+            if not moved:
+                skipped.add("path")
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+            ]
+        with transaction.atomic():
+            if moved and not self._state.adding:
+                self._lock_for_move()
+            super().save(*args, **kwargs)
+            self._move_descendants()
+        self._remember_saved_state()
+
+    def _lock_for_move(self):
+        """
+        Locks this folder, its new parent and the parent's ancestors, then checks the
+        move against their stored paths: a concurrent move may have put the new parent
+        below this folder since set_parent() checked it in memory.
+        """
+        folders = Folder.all_objects.only("id", "path").lock_with_ancestors(
+            [self.pk, self.parent_id]
+        )
+        parent = folders.get(self.parent_id)
+        if parent is not None and self.pk in [parent.pk, *path_ids(parent.path)]:
+            raise ValidationError("A folder cannot be an ancestor of itself.")
+        # Descendants are found by the stored path, not the one in memory
+        self._saved_path = folders[self.pk].path if self.pk in folders else None
+        self.check_path_length(self.path, self._saved_path)
+
+    def check_path_length(self, new_path, old_path=None):
+        """
+        Raises ValidationError if moving this folder from `old_path` (None for a new
+        folder) to `new_path` would give it or one of its descendants a path longer
+        than the path column holds.
+        """
+        longest = len(new_path)
+        if old_path is not None:
+            old_prefix = f"{old_path}{self.pk}/"
+            deepest = Folder.all_objects.descendants_of(old_prefix).longest_path()
+            if deepest:
+                longest = max(longest, deepest - len(old_path) + len(new_path))
+        if longest > Folder._meta.get_field("path").max_length:
+            raise ValidationError("Folders cannot be nested this deeply.")
 
     def clean(self):
         if self.is_root:
             root_exists = (
-                Folder.objects.filter(creator=self.creator, is_root=True)
+                Folder.objects.filter(creator_id=self.creator_id, is_root=True)
                 .exclude(pk=self.pk)
                 .exists()
             )
@@ -166,21 +311,79 @@ class Folder(models.Model):
                 raise ValidationError("A user cannot have more than one root folder.")
         elif not self.parent:  # if the folder is not root, and has no parent specified
             raise ValidationError("A non-root folder must have a parent.")
-        elif self in self.parent.get_ancestors():
+        elif self.is_ancestor_of(self.parent):
             raise ValidationError("A folder cannot be an ancestor of itself.")
-        elif self.parent.creator != self.creator:
+        elif self.parent.creator_id != self.creator_id:
             raise ValidationError("A folder cannot be assigned to another user.")
 
+    def _build_path(self):
+        if self.parent_id is None and not Folder.parent.is_cached(self):
+            return "/"
+        if self.parent is None:
+            return "/"
+        ancestor_ids = self.parent.get_ancestor_ids()
+        return "/" + "".join(f"{pk}/" for pk in reversed(ancestor_ids))
+
+    def _move_descendants(self):
+        """
+        Rewrites the paths of every descendant after this folder has moved, in a
+        single UPDATE.
+        """
+        old_path = getattr(self, "_saved_path", None)
+        if old_path is None or old_path == self.path:
+            return
+        Folder.objects.rebase_paths(
+            f"{old_path}{self.pk}/", self.descendant_path_prefix
+        )
+
+    @property
+    def descendant_path_prefix(self):
+        """The path prefix shared by every descendant of this folder."""
+        return f"{self.path}{self.pk}/"
+
+    def get_ancestor_ids(self):
+        """
+        Returns the ids of this folder and its ancestors, nearest first.
+
+        Parents that are already loaded in memory are followed (they may hold unsaved
+        moves); the rest of the chain is read from the stored path, so no queries are
+        made for folders loaded from the database.
+        """
+        ids = []
+        seen = set()
+        folder = self
+        while folder is not None and id(folder) not in seen:
+            seen.add(id(folder))
+            ids.append(folder.pk)
+            if folder.parent_id is not None and not Folder.parent.is_cached(folder):
+                ids.extend(path_ids(folder.path))
+                break
+            folder = folder.parent
+        return ids
+
     def get_ancestors(self):
-        ancestors = [self]
-        if self.parent:
-            ancestors.extend(self.parent.get_ancestors())
-        return ancestors
+        ids = self.get_ancestor_ids()
+        folders = Folder.objects.in_bulk([pk for pk in ids[1:] if pk is not None])
+        return [self] + [folders[pk] for pk in ids[1:] if pk in folders]
+
+    def get_descendants(self, include_self=False):
+        descendants = Folder.objects.descendants_of(self.descendant_path_prefix)
+        if include_self:
+            descendants = descendants | Folder.objects.filter(pk=self.pk)
+        return descendants
+
+    def is_ancestor_of(self, folder):
+        """
+        Returns True if this folder is `folder` itself or one of its ancestors.
+        """
+        if folder is self:
+            return True
+        return self.pk is not None and self.pk in folder.get_ancestor_ids()
 
     def place_in_folder(self, parent_folder):
         if not parent_folder:
             raise ValidationError("Must specify a parent folder.")
-        if self in parent_folder.get_ancestors():
+        if self.is_ancestor_of(parent_folder):
             raise ValidationError("A folder cannot be an ancestor of itself.")
         super(Folder, self).__setattr__("parent", parent_folder)
 
@@ -189,6 +392,7 @@ class Folder(models.Model):
 
 
 class Post(models.Model):
+    objects = PostQuerySet.as_manager()
     title = models.CharField(max_length=100, blank=False)
     description = models.TextField(blank=True)
     url = models.CharField(max_length=1000, blank=False)
@@ -196,6 +400,39 @@ class Post(models.Model):
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name="posts")
     tags = models.ManyToManyField("Tag", blank=True, related_name="posts")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also set when the post's tags change (see PosteAPI.signals)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["updated_at", "id"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The post_save receivers update the folder counts in the same transaction
+        with transaction.atomic():
+            if not self._state.adding:
+                self._loaded_folder_id = self._stored_folder_id(
+                    kwargs.get("update_fields")
+                )
+            super().save(*args, **kwargs)
+
+    def _stored_folder_id(self, update_fields):
+        """
+        Returns the folder the post is saved out of: the one stored, locked until the
+        counts are updated, as the one loaded may be stale by now.
+        """
+        if update_fields is not None and not {"folder", "folder_id"} & set(
+            update_fields
+        ):
+            return self.folder_id
+        return (
+            Post.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("folder_id", flat=True)
+            .first()
+        )
 
     def edit(self, newTitle, newDescription, newURL, newTags):
         self.title = newTitle
@@ -213,24 +450,29 @@ class Tag(models.Model):
 
     # This will automatically have a reverse relationship to Posts and Folders
 
+    @staticmethod
+    def normalize_name(name):
+        """
+        Returns a tag name the way it is stored: stripped of punctuation, converted to
+        lowercase, and with any form of whitespace removed.
+        """
+        name = name.translate(
+            str.maketrans("", "", string.punctuation)
+        )  # remove punctuation
+        name = name.lower()  # lowercase
+        return "".join(name.split())  # remove all whitespace, including internal
+
     def save(self, *args, **kwargs):
         """
-        Saves the Tag instance after processing the name attribute.
+        Saves the Tag instance after normalizing the name attribute (see normalize_name).
 
-        The name is stripped of punctuation, converted to lowercase, and any form of whitespace
-        is removed. If the name is empty after processing, a ValidationError is raised to prevent
+        If the name is empty after processing, a ValidationError is raised to prevent
         saving an invalid tag.
 
         Raises:
             ValidationError: If the processed name is empty.
         """
-        self.name = self.name.translate(
-            str.maketrans("", "", string.punctuation)
-        )  # remove punctuation
-        self.name = self.name.lower()  # lowercase
-        self.name = "".join(
-            self.name.split()
-        )  # remove all whitespace, including internal
+        self.name = self.normalize_name(self.name)
         if not self.name:
             raise ValidationError("Tag name cannot be empty.")
         return super(Tag, self).save(*args, **kwargs)
@@ -249,14 +491,51 @@ class FolderPermissionEnum(models.TextChoices):
     # a full access user is an editor who can share the folder with other users
     FULL_ACCESS = "full_access", gettext_lazy("Full Access")
 
+    @classmethod
+    def at_least(cls, permission):
+        """
+        Returns the permissions granting at least as much as `permission`.
+        """
+        ranked = list(cls)  # declared from least to most access
+        return ranked[ranked.index(cls(permission)) :]
+
 
 class FolderPermission(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE)
     permission = models.CharField(max_length=12, choices=FolderPermissionEnum.choices)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "folder")
 
     def __str__(self):
         return f"{self.user.username} has {self.permission} permission within {self.folder.title}"
+
+
+class TombstoneKind(models.TextChoices):
+    FOLDER = "folder", gettext_lazy("Folder")
+    POST = "post", gettext_lazy("Post")
+
+
+class Tombstone(models.Model):
+    """
+    Records that a folder or post was deleted, or may have stopped being visible, to
+    a user, so that their clients can remove it when they sync (see PosteAPI.sync).
+    """
+
+    kind = models.CharField(max_length=6, choices=TombstoneKind.choices)
+    object_id = models.PositiveBigIntegerField()
+    # Not a foreign key: deleting a user leaves tombstones for the other users of
+    # their shared folders while the user row itself is being deleted
+    user_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id", "deleted_at", "id"]),
+            models.Index(fields=["deleted_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} removed for {self.user_id}"
@@ -0,0 +1,116 @@
+"""
+Moving several folders at once.
+
+move_folders() locks every folder a batch mentions, with the ancestors of the new
+parents, and checks ownership and cycles against the stored materialized paths, so
+validation costs the same however deep the folders are. Moves that depend on each other (moving a
+folder into one that is itself being moved) are checked against where every
+folder ends up, and applied parents first so no intermediate state has a cycle.
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .managers import path_ids
+from .models import Folder
+from .signals import bump_folder_versions
+
+
+def final_ancestors(folder_id, folders, new_parents):
+    """
+    Returns the ids of `folder_id` and its ancestors, nearest first, once the folders
+    in `new_parents` have moved, or None if the moves would make a cycle. `folders`
+    must hold the moved folders and their new parents.
+    """
+    chain = [folder_id]
+    while True:
+        if folder_id in new_parents:
+            folder_id = new_parents[folder_id]
+        else:
+            # The stored path holds the rest of the chain up to the first ancestor
+            # that moves
+            for ancestor in path_ids(folders[folder_id].path):
+                chain.append(ancestor)
+                if ancestor in new_parents:
+                    folder_id = new_parents[ancestor]
+                    break
+            else:
+                return chain
+        if folder_id in chain:
+            return None
+        chain.append(folder_id)
+
+
+def move_folders(user, moves):
+    """
+    Moves folders owned by `user` into other folders they own, all or nothing.
+    `moves` is a list of (folder id, new parent id) pairs. Raises ValidationError
+    if any move is invalid.
+    """
+    new_parents = dict(moves)
+    with transaction.atomic():
+        # The new parents' ancestors are locked too, so a concurrent move into one
+        # of the moved subtrees waits for this one (and then sees the cycle)
+        folders = Folder.objects.only(
+            "id", "parent_id", "path", "creator_id", "is_root"
+        ).lock_with_ancestors(set(new_parents) | set(new_parents.values()))
+        errors = _validate(user, folders, new_parents)
+        if errors:
+            raise ValidationError(errors)
+
+        # Parents first: a folder's new parent is then already where it ends up
+        depths = {
+            pk: len(final_ancestors(pk, folders, new_parents)) for pk in new_parents
+        }
+        paths = {pk: folder.path for pk, folder in folders.items()}
+        old_parents = []
+        child_counts = Counter()
+        for pk in sorted(new_parents, key=depths.get):
+            parent_id = new_parents[pk]
+            if folders[pk].parent_id == parent_id:
+                continue
+            old_parents.append(folders[pk].parent_id)
+            child_counts[folders[pk].parent_id] -= 1
+            child_counts[parent_id] += 1
+            old_prefix = f"{paths[pk]}{pk}/"
+            new_path = f"{paths[parent_id]}{parent_id}/"
+            new_prefix = f"{new_path}{pk}/"
+            folders[pk].check_path_length(new_path, paths[pk])
+            Folder.objects.rebase_paths(old_prefix, new_prefix)
+            Folder.objects.filter(pk=pk).update(parent_id=parent_id, path=new_path)
+            # Keep the paths of the loaded folders current for the moves that follow
+            paths[pk] = new_path
+            for other, path in paths.items():
+                if path.startswith(old_prefix):
+                    paths[other] = new_prefix + path[len(old_prefix) :]
+
+        # Updates send no post_save signals
+        Folder.objects.adjust_counts("child_folder_count", child_counts)
+        bump_folder_versions([*new_parents, *new_parents.values(), *old_parents])
+
+
+def _validate(user, folders, new_parents):
+    def ids(pks):
+        return ", ".join(map(str, sorted(pks)))
+
+    missing = (set(new_parents) | set(new_parents.values())) - folders.keys()
+    if missing:
+        return [f"folder does not exist: {ids(missing)}"]
+    errors = []
+    not_owned = {
+        pk
+        for pk in set(new_parents) | set(new_parents.values())
+        if folders[pk].creator_id != user.pk
+    }
+    if not_owned:
+        errors.append(f"no permission to move folders in folder: {ids(not_owned)}")
+    roots = {pk for pk in new_parents if folders[pk].is_root}
+    if roots:
+        errors.append(f"cannot move a root folder: {ids(roots)}")
+    cycles = {
+        pk for pk in new_parents if final_ancestors(pk, folders, new_parents) is None
+    }
+    if cycles:
+        errors.append(f"cannot move a folder into itself or a subfolder: {ids(cycles)}")
+    return errors
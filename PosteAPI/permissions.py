@@ -0,0 +1,159 @@
+from .models import Folder, FolderPermission, FolderPermissionEnum
+
+VIEW_PERMISSIONS = {
+    FolderPermissionEnum.FULL_ACCESS,
+    FolderPermissionEnum.EDITOR,
+    FolderPermissionEnum.VIEWER,
+}
+EDIT_PERMISSIONS = {FolderPermissionEnum.FULL_ACCESS, FolderPermissionEnum.EDITOR}
+SHARE_PERMISSIONS = {FolderPermissionEnum.FULL_ACCESS}
+
+
+class PermissionResolver:
+    """
+    Answers the User.can_* checks for one user from memory.
+
+    The user's FolderPermission rows are loaded either all at once (load_all) or for a
+    batch of folders (load_folders / load_posts); every check after that is a
+    dictionary lookup. Folders that were not loaded up front are fetched on first use,
+    so the answers are always the same as the User methods, just with fewer queries.
+
+    Use PermissionResolver.for_request(request) to share one resolver across a request.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._permissions = {}  # folder id -> permission, or None if not shared
+        self._creators = {}  # folder id -> creator id
+        self._loaded_all = False
+
+    @classmethod
+    def for_request(cls, request):
+        """
+        Returns the resolver for request.user, creating it on first use.
+        """
+        http_request = getattr(request, "_request", request)  # unwrap DRF's Request
+        resolver = getattr(http_request, "_permission_resolver", None)
+        if resolver is None or resolver.user != request.user:
+            resolver = cls(request.user)
+            http_request._permission_resolver = resolver
+        return resolver
+
+    def invalidate(self):
+        """
+        Forgets everything loaded so far, e.g. after the user's permissions changed.
+        """
+        self._permissions.clear()
+        self._creators.clear()
+        self._loaded_all = False
+
+    def load_all(self):
+        """
+        Loads every permission the user holds in a single query.
+        """
+        if not self._loaded_all:
+            self._permissions = dict(
+                FolderPermission.objects.filter(user=self.user).values_list(
+                    "folder_id", "permission"
+                )
+            )
+            self._loaded_all = True
+        return self
+
+    def load_folders(self, folders):
+        """
+        Loads the user's permissions for a batch of folders (instances or ids) in a
+        single query.
+        """
+        folder_ids = set()
+        for folder in folders:
+            folder_id = self._folder_id(folder)
+            if isinstance(folder, Folder):
+                self._creators[folder_id] = folder.creator_id
+            folder_ids.add(folder_id)
+        if self._loaded_all:
+            return self
+        missing = folder_ids - self._permissions.keys()
+        if missing:
+            self._permissions.update(dict.fromkeys(missing))
+            self._permissions.update(
+                FolderPermission.objects.filter(
+                    user=self.user, folder_id__in=missing
+                ).values_list("folder_id", "permission")
+            )
+        return self
+
+    def load_posts(self, posts):
+        """
+        Loads everything needed to check a batch of posts: the user's permissions and
+        the creators of the posts' folders, in at most two queries.
+        """
+        posts = list(posts)
+        folders = [self._post_folder(post) for post in posts]
+        self.load_folders(folders)
+        missing = {
+            folder
+            for folder in folders
+            if not isinstance(folder, Folder) and folder not in self._creators
+        }
+        if missing:
+            self._creators.update(
+                Folder.objects.filter(pk__in=missing).values_list("pk", "creator_id")
+            )
+        return self
+
+    def permission_for(self, folder):
+        """
+        Returns the user's FolderPermissionEnum value for a folder, or None.
+        """
+        folder_id = self._folder_id(folder)
+        if not self._loaded_all and folder_id not in self._permissions:
+            self.load_folders([folder])
+        return self._permissions.get(folder_id)
+
+    def can_view_folder(self, folder):
+        return self.permission_for(folder) in VIEW_PERMISSIONS
+
+    def can_view_post(self, post):
+        return self.can_view_folder(self._post_folder(post))
+
+    def can_edit_folder(self, folder):
+        return (
+            self._is_creator(folder) or self.permission_for(folder) in EDIT_PERMISSIONS
+        )
+
+    def can_edit_post(self, post):
+        return self.can_edit_folder(self._post_folder(post))
+
+    def has_permissions_to_share_folder(self, folder):
+        return (
+            self._is_creator(folder) or self.permission_for(folder) in SHARE_PERMISSIONS
+        )
+
+    def has_permissions_to_share_post(self, post):
+        return self.has_permissions_to_share_folder(self._post_folder(post))
+
+    def _is_creator(self, folder):
+        if isinstance(folder, Folder):
+            return folder.creator_id == self.user.pk
+        if folder not in self._creators:
+            self._creators[folder] = (
+                Folder.objects.filter(pk=folder)
+                .values_list("creator_id", flat=True)
+                .first()
+            )
+        return self._creators[folder] == self.user.pk
+
+    @staticmethod
+    def _folder_id(folder):
+        return folder.pk if isinstance(folder, Folder) else folder
+
+    @staticmethod
+    def _post_folder(post):
+        """
+        Returns the post's folder if it is already loaded, otherwise its id, so that
+        checking a post never loads its folder on its own.
+        """
+        if post.__class__.folder.is_cached(post):
+            return post.folder
+        return post.folder_id
@@ -0,0 +1,172 @@
+"""
+Read replicas for safe requests.
+
+ReplicaMiddleware lets the queries of GET, HEAD and OPTIONS requests read from one
+of the replicas in POSTE_REPLICAS["DATABASES"]; everything else, including writes,
+transactions and queries outside requests, uses the primary ("default") database.
+
+Replicas lag behind the primary, so a client that has just written keeps reading
+from the primary for PIN_SECONDS ("read your writes"). Clients are told apart by
+their address and their Authorization header: a write pins both. A safe request
+that writes is switched to the primary from its first write on, or from the start
+for the views marked primary_only.
+"""
+import contextlib
+import contextvars
+import functools
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULT_REPLICAS = {
+    # Aliases of the replica databases in DATABASES
+    "DATABASES": [],
+    # Seconds a client reads from the primary after writing
+    "PIN_SECONDS": 5,
+    # Cache remembering which clients wrote recently; it must be shared by all the
+    # workers (see PosteAPI.checks)
+    "CACHE_ALIAS": "default",
+}
+
+current_routing = contextvars.ContextVar("current_routing", default=None)
+
+
+def replica_options():
+    return {**DEFAULT_REPLICAS, **getattr(settings, "POSTE_REPLICAS", {})}
+
+
+class RequestRouting:
+    def __init__(self, replicas):
+        # Replicas the request may read from; empty means the primary only
+        self.replicas = replicas
+        self.wrote = False
+
+
+@contextlib.contextmanager
+def use_primary():
+    """
+    Sends the reads made inside the block to the primary.
+    """
+    token = current_routing.set(RequestRouting([]))
+    try:
+        yield
+    finally:
+        current_routing.reset(token)
+
+
+def primary_only(view):
+    """
+    Decorates a view, or a view method, whose safe requests write: all of its reads
+    then go to the primary, so it never checks or changes rows a replica has not
+    caught up with yet. Its writes still pin the client.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.replicas = []
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or not routing.replicas or routing.wrote:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see what it wrote
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(routing.replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in replica_options()["DATABASES"]
+
+
+class ReplicaMiddleware:
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = replica_options()
+        if not options["DATABASES"]:
+            return self.get_response(request)
+
+        cache = caches[options["CACHE_ALIAS"]]
+        pin_keys = self.pin_keys(request)
+        replicas = []
+        if request.method in self.SAFE_METHODS and not cache.get_many(pin_keys):
+            replicas = options["DATABASES"]
+        routing = RequestRouting(replicas)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if self.pins(request, routing):
+            cache.set_many(dict.fromkeys(pin_keys, True), options["PIN_SECONDS"])
+        return response
+
+    async def __acall__(self, request):
+        options = replica_options()
+        if not options["DATABASES"]:
+            return await self.get_response(request)
+
+        cache = caches[options["CACHE_ALIAS"]]
+        pin_keys = self.pin_keys(request)
+        replicas = []
+        if request.method in self.SAFE_METHODS and not await cache.aget_many(pin_keys):
+            replicas = options["DATABASES"]
+        routing = RequestRouting(replicas)
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if self.pins(request, routing):
+            await cache.aset_many(dict.fromkeys(pin_keys, True), options["PIN_SECONDS"])
+        return response
+
+    def pins(self, request, routing):
+        return routing.wrote or request.method not in self.SAFE_METHODS
+
+    @staticmethod
+    def pin_keys(request):
+        # The address covers a client whose first write gave it its token (login).
+        # Behind nginx, the last X-Forwarded-For entry is the address nginx saw.
+        forwarded = request.headers.get("X-Forwarded-For", "")
+        address = forwarded.rsplit(",", 1)[-1].strip() or request.META.get(
+            "REMOTE_ADDR", ""
+        )
+        clients = [address]
+        if "Authorization" in request.headers:
+            clients.append(request.headers["Authorization"])
+        return [
+            "replica-pin:" + hashlib.sha1(client.encode()).hexdigest()
+            for client in clients
+        ]
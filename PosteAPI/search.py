@@ -0,0 +1,80 @@
+"""
+Full-text search over posts.
+
+The index lives in the database and is maintained by the database itself, so it is
+updated incrementally on every insert, update and delete of a post, including bulk
+inserts and cascading deletes:
+
+* PostgreSQL: a generated, weighted ``tsvector`` column on the post table with a GIN
+  index.
+* SQLite: an FTS5 table using the post table as external content, kept in sync by
+  triggers.
+
+Any other database falls back to (unindexed) substring matching.
+
+The index is created by migration 0010_post_search_index. On SQLite, a migration that
+alters the post table rebuilds it and drops the triggers, so it must create them
+again (as 0013_sync does); SearchIndexTest checks that they exist.
+"""
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Folder, Post
+
+POST_TABLE = Post._meta.db_table
+FTS_TABLE = f"{POST_TABLE}_fts"
+
+
+def search_posts(user, query, limit, offset=0):
+    """
+    Returns up to `limit` posts visible to `user` that match `query`, best match first,
+    skipping the first `offset` matches. Tags are prefetched.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    folders_sql, folders_params = (
+        Folder.objects.accessible_to(user).values("pk").query.sql_with_params()
+    )
+    connection = connections[router.db_for_read(Post)]
+    if connection.vendor == "postgresql":
+        sql = f"""
+            SELECT p.id FROM "{POST_TABLE}" p,
+                websearch_to_tsquery('english', %s) query
+            WHERE p.search_vector @@ query AND p.folder_id IN ({folders_sql})
+            ORDER BY ts_rank(p.search_vector, query) DESC, p.id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [query, *folders_params, limit, offset]
+    elif connection.vendor == "sqlite":
+        # Quote every term so user input cannot be parsed as FTS5 syntax, and match
+        # prefixes so partially typed words still find results
+        match = " ".join('"%s"*' % term.replace('"', '""') for term in terms)
+        sql = f"""
+            SELECT p.id FROM "{FTS_TABLE}" f JOIN "{POST_TABLE}" p ON p.id = f.rowid
+            WHERE "{FTS_TABLE}" MATCH %s AND p.folder_id IN ({folders_sql})
+            ORDER BY bm25("{FTS_TABLE}", 10.0, 5.0, 1.0), p.id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [match, *folders_params, limit, offset]
+    else:
+        return list(_substring_search(user, terms)[offset : offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    posts = Post.objects.for_listing().in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def _substring_search(user, terms):
+    posts = Post.objects.for_listing().filter(
+        folder__in=Folder.objects.accessible_to(user).values("pk")
+    )
+    for term in terms:
+        posts = posts.filter(
+            Q(title__icontains=term)
+            | Q(description__icontains=term)
+            | Q(url__icontains=term)
+        )
+    return posts.order_by("-created_at", "-id")
@@ -1,3 +1,5 @@
+from collections import Counter
+
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db import transaction
@@ -5,6 +7,9 @@ from rest_framework import serializers
 
 # import models
 from .models import Folder, FolderPermission, Post, Tag, User
+from .permissions import PermissionResolver
+from .tagindex import post_tag_index
+from .tags import normalize_tag_names, resolve_tags
 
 
 # Create serializers here
@@ -200,14 +205,109 @@ class PostCreateSerializer(serializers.ModelSerializer):
                 folder=folder, creator=self.context["request"].user, **validated_data
             )
             if tag_names:
-                tag_list = []
-                for tag_name in tag_names:
-                    tag, _ = Tag.objects.get_or_create(name=tag_name)
-                    tag_list.append(tag)
-                post.tags.set(tag_list)
+                post.tags.set(resolve_tags(tag_names))
         return post
 
 
+class PostBulkItemSerializer(PostCreateSerializer):
+    """
+    One post of a bulk request. Folders are checked once for the whole batch by
+    PostBulkCreateSerializer rather than once per post.
+    """
+
+    def validate_folder_id(self, value):
+        return value
+
+
+class PostBulkCreateSerializer(serializers.Serializer):
+    MAX_POSTS = 500
+
+    posts = PostBulkItemSerializer(many=True, allow_empty=False)
+
+    def validate_posts(self, value):
+        if len(value) > self.MAX_POSTS:
+            raise serializers.ValidationError(
+                f"cannot create more than {self.MAX_POSTS} posts at once"
+            )
+        folder_ids = {post["folder_id"] for post in value}
+        folders = Folder.objects.in_bulk(folder_ids)
+        missing = folder_ids - folders.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f"folder does not exist: {', '.join(map(str, sorted(missing)))}"
+            )
+        resolver = PermissionResolver.for_request(self.context["request"])
+        resolver.load_folders(folders.values())
+        forbidden = [pk for pk, f in folders.items() if not resolver.can_edit_folder(f)]
+        if forbidden:
+            raise serializers.ValidationError(
+                "no permission to add posts to folder: "
+                f"{', '.join(map(str, sorted(forbidden)))}"
+            )
+        return value
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        items = validated_data["posts"]
+        posts = [
+            Post(
+                title=item["title"],
+                description=item.get("description", ""),
+                url=item["url"],
+                folder_id=item["folder_id"],
+                creator=user,
+            )
+            for item in items
+        ]
+        with transaction.atomic():
+            posts = Post.objects.bulk_create(posts)
+            tags = {
+                tag.name: tag
+                for tag in resolve_tags(
+                    name for item in items for name in item.get("tags", [])
+                )
+            }
+            links = [
+                (post.pk, tags[name].pk)
+                for post, item in zip(posts, items)
+                for name in normalize_tag_names(item.get("tags", []))
+            ]
+            Post.tags.through.objects.bulk_create(
+                [
+                    Post.tags.through(post_id=post_id, tag_id=tag_id)
+                    for post_id, tag_id in links
+                ],
+                ignore_conflicts=True,
+            )
+            # bulk_create sends no post_save or m2m_changed signals
+            post_tag_index.add_links(links)
+            folder_ids = [item["folder_id"] for item in items]
+            Folder.objects.adjust_counts("post_count", Counter(folder_ids))
+            Folder.objects.filter(pk__in=set(folder_ids)).bump_versions()
+        return posts
+
+
+class FolderMoveItemSerializer(serializers.Serializer):
+    folder_id = serializers.IntegerField()
+    parent_id = serializers.IntegerField()
+
+
+class FolderMoveSerializer(serializers.Serializer):
+    MAX_MOVES = 500
+
+    moves = FolderMoveItemSerializer(many=True, allow_empty=False)
+
+    def validate_moves(self, value):
+        if len(value) > self.MAX_MOVES:
+            raise serializers.ValidationError(
+                f"cannot move more than {self.MAX_MOVES} folders at once"
+            )
+        folder_ids = [move["folder_id"] for move in value]
+        if len(set(folder_ids)) != len(folder_ids):
+            raise serializers.ValidationError("each folder can only be moved once")
+        return value
+
+
 class FolderSerializer(serializers.ModelSerializer):
     parent_id = serializers.SerializerMethodField()
     shares = serializers.SerializerMethodField()
@@ -232,16 +332,17 @@ class FolderSerializer(serializers.ModelSerializer):
         ]
 
     def get_folder_count(self, obj):
-        return obj.child_folders.count()
+        return obj.child_folder_count
 
     def get_file_count(self, obj):
-        return obj.posts.count()
+        return obj.post_count
 
     def get_parent_id(self, obj):
-        return obj.parent.id if obj.parent else None
+        return obj.parent_id
 
     def get_shares(self, obj):
-        folder_permissions = FolderPermission.objects.filter(folder=obj)
+        # .all() so that permissions prefetched by for_listing() are reused
+        folder_permissions = obj.folderpermission_set.all()
         return {
             folder_permission.user.email: folder_permission.permission
             for folder_permission in folder_permissions
@@ -258,29 +359,25 @@ class FolderCreateSerializer(serializers.ModelSerializer):
             "title": {"required": True},
         }
 
-        def validate_title(self, value):
-            if not value.strip():
-                raise serializers.ValidationError("title cannot be blank")
-            return value
+    def validate_title(self, value):
+        if not value.strip():
+            raise serializers.ValidationError("title cannot be blank")
+        return value
 
-        def validate_tags(self, value):
-            tags = [tag.strip() for tag in value.split(",") if tag.strip()]
-            return tags
+    def validate_tags(self, value):
+        tags = [tag.strip() for tag in value.split(",") if tag.strip()]
+        return tags
 
     def create(self, validated_data):
         tag_names = validated_data.pop("tags", [])
 
-        folder = Folder(
-            title=validated_data["title"],
-            creator=validated_data["creator"],
-        )
-
-        if tag_names:
-            tag_list = []
-            for tag_name in tag_names:
-                tag, _ = Tag.objects.get_or_create(name=tag_name)
-                tag_list.append(tag)
-            folder.tags.set(tag_list)
+        with transaction.atomic():
+            folder = Folder.objects.create(
+                title=validated_data["title"],
+                creator=validated_data["creator"],
+            )
+            if tag_names:
+                folder.tags.set(resolve_tags(tag_names))
 
         return folder
 
@@ -1,12 +1,316 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, pre_delete
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
 
-from .models import Folder
+from .authentication import token_cache
+from .cache import response_cache
+from .models import Folder, FolderPermission, Post, Tag, Tombstone, TombstoneKind
+from .sync import record_removals, removals_recorded_in_bulk
+from .tagindex import folder_tag_index, post_tag_index
+from .timing import install_query_timer
 
 
 @receiver(post_save, sender=get_user_model())
 def create_root_folder(sender, instance, created, **kwargs):
     if created:
         Folder.objects.create(title="root", creator=instance, is_root=True)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    token_cache.evict(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_saved_user_tokens(sender, instance, created, **kwargs):
+    # A cached user could otherwise keep a stale password, or stay active after
+    # being deactivated, until its entry expires
+    if not created:
+        token_cache.evict_user(instance.pk)
+
+
+@receiver(connection_created)
+def time_connection_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+TAG_INDEXES = {
+    Post.tags.through: post_tag_index,
+    Folder.tags.through: folder_tag_index,
+}
+
+
+# The receivers below react once the tag links changed. By then a cleared tag's links
+# are gone, and so are a deleted tag's, so the objects they were on are looked up
+# beforehand.
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+@receiver(m2m_changed, sender=Folder.tags.through)
+def remember_cleared_links(sender, instance, action, reverse, **kwargs):
+    if action == "pre_clear" and reverse:
+        object_field = "post_id" if sender is Post.tags.through else "folder_id"
+        instance.__dict__.setdefault("_cleared_ids", {})[sender] = set(
+            sender.objects.filter(tag=instance).values_list(object_field, flat=True)
+        )
+
+
+def changed_ids(sender, instance, action, pk_set):
+    """
+    Returns the ids on the other side of the links that changed: pk_set, or for a
+    cleared tag the ids remembered before the clear.
+    """
+    if action == "post_clear":
+        return instance.__dict__.get("_cleared_ids", {}).get(sender, set())
+    return pk_set
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_links(sender, instance, **kwargs):
+    instance._tagged_post_ids = list(instance.posts.values_list("pk", flat=True))
+    instance._tagged_folder_ids = list(instance.folder.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+@receiver(m2m_changed, sender=Folder.tags.through)
+def update_tag_index(sender, instance, action, reverse, pk_set, **kwargs):
+    index = TAG_INDEXES[sender]
+    if action in ("post_add", "post_remove"):
+        # reverse: tag.posts.add(post), instance is the tag
+        if reverse:
+            links = [(pk, instance.pk) for pk in pk_set]
+        else:
+            links = [(instance.pk, pk) for pk in pk_set]
+        if action == "post_add":
+            index.add_links(links)
+        else:
+            index.remove_links(links)
+    elif action == "post_clear":
+        if reverse:
+            index.remove_tags([instance.pk])
+        else:
+            index.remove_objects([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def remove_deleted_post_from_tag_index(sender, instance, **kwargs):
+    post_tag_index.remove_objects([instance.pk])
+
+
+@receiver(post_delete, sender=Folder)
+def remove_deleted_folder_from_tag_index(sender, instance, **kwargs):
+    folder_tag_index.remove_objects([instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+def remove_deleted_tag_from_tag_indexes(sender, instance, **kwargs):
+    post_tag_index.remove_tags([instance.pk])
+    folder_tag_index.remove_tags([instance.pk])
+
+
+# Folder counts. Post.save() and Folder.save() run their post_save receivers inside
+# a transaction, as Django does for post_delete ones, so a count changes atomically
+# with the row it counts. These receivers run before the version ones below, which
+# forget where a post was loaded from.
+
+
+def moved_counts(old_folder_id, new_folder_id):
+    if old_folder_id == new_folder_id:
+        return {}
+    return {old_folder_id: -1, new_folder_id: 1}
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        deltas = {instance.folder_id: 1}
+    elif hasattr(instance, "_loaded_folder_id"):
+        deltas = moved_counts(instance._loaded_folder_id, instance.folder_id)
+    else:
+        return
+    Folder.objects.adjust_counts("post_count", deltas)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    Folder.objects.adjust_counts("post_count", {instance.folder_id: -1})
+
+
+@receiver(post_save, sender=Folder)
+def count_saved_folder(sender, instance, created, **kwargs):
+    if created:
+        deltas = {instance.parent_id: 1}
+    elif hasattr(instance, "_saved_parent_id"):
+        deltas = moved_counts(instance._saved_parent_id, instance.parent_id)
+    else:
+        return
+    Folder.objects.adjust_counts("child_folder_count", deltas)
+
+
+@receiver(post_delete, sender=Folder)
+def count_deleted_folder(sender, instance, **kwargs):
+    Folder.objects.adjust_counts("child_folder_count", {instance.parent_id: -1})
+
+
+# Sync (see PosteAPI.sync). Folders get their updated_at with their version, below.
+# Removals are recorded before the delete, while the folder's shares still exist,
+# and before the version receivers forget where a post was loaded from.
+
+
+@receiver(pre_delete, sender=Folder)
+def record_deleted_folder(sender, instance, **kwargs):
+    if not removals_recorded_in_bulk():
+        record_removals(TombstoneKind.FOLDER, [(instance.pk, instance.pk)])
+
+
+@receiver(pre_delete, sender=Post)
+def record_deleted_post(sender, instance, **kwargs):
+    if not removals_recorded_in_bulk():
+        record_removals(TombstoneKind.POST, [(instance.pk, instance.folder_id)])
+
+
+@receiver(post_save, sender=Post)
+def record_moved_post(sender, instance, created, **kwargs):
+    # Users who could only see the old folder lose the post
+    old_folder_id = getattr(instance, "_loaded_folder_id", None)
+    if not created and old_folder_id not in (None, instance.folder_id):
+        record_removals(TombstoneKind.POST, [(instance.pk, old_folder_id)])
+
+
+@receiver(pre_delete, sender=FolderPermission)
+def record_unshared_folder(sender, instance, **kwargs):
+    # A share only goes in bulk with its folder or its user, which were recorded
+    if removals_recorded_in_bulk():
+        return
+    Tombstone.objects.create(
+        kind=TombstoneKind.FOLDER,
+        object_id=instance.folder_id,
+        user_id=instance.user_id,
+    )
+
+
+def touch_posts(posts):
+    posts.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def touch_retagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        touch_posts(Post.objects.filter(pk=instance.pk))
+    else:
+        pks = changed_ids(sender, instance, action, pk_set)
+        touch_posts(Post.objects.filter(pk__in=pks))
+
+
+@receiver(post_save, sender=Tag)
+def touch_tagged_posts(sender, instance, created, **kwargs):
+    # Posts show the names of their tags
+    if not created:
+        touch_posts(Post.objects.filter(pk__in=instance.posts.values("pk")))
+
+
+@receiver(post_delete, sender=Tag)
+def touch_untagged_posts(sender, instance, **kwargs):
+    touch_posts(Post.objects.filter(pk__in=instance._tagged_post_ids))
+
+
+# Folder versions. A change to anything a folder listing shows bumps the version of
+# the folder holding it and of that folder's parent (see FolderQuerySet.bump_versions).
+
+
+def bump_folder_versions(folder_ids):
+    folder_ids = [pk for pk in folder_ids if pk is not None]
+    if folder_ids:
+        Folder.objects.filter(pk__in=folder_ids).bump_versions()
+        # Cached responses are keyed by version, so this only frees their memory
+        response_cache.invalidate_folders(folder_ids)
+
+
+@receiver(post_save, sender=Folder)
+def bump_saved_folder_version(sender, instance, created, **kwargs):
+    if created:
+        bump_folder_versions([instance.parent_id])
+        return
+    # _saved_parent_id is only updated once save() returns
+    old_parent_id = getattr(instance, "_saved_parent_id", None)
+    folder_ids = [instance.pk, old_parent_id]
+    if old_parent_id != instance.parent_id:
+        # Also bumps the new parent's parent, which lists its child folder count
+        folder_ids.append(instance.parent_id)
+    bump_folder_versions(folder_ids)
+
+
+@receiver(post_delete, sender=Folder)
+def bump_deleted_folder_version(sender, instance, **kwargs):
+    bump_folder_versions([instance.parent_id])
+
+
+@receiver(post_save, sender=Post)
+def bump_saved_post_folder_version(sender, instance, created, **kwargs):
+    bump_folder_versions(
+        [instance.folder_id, getattr(instance, "_loaded_folder_id", None)]
+    )
+    instance._loaded_folder_id = instance.folder_id
+
+
+@receiver(post_delete, sender=Post)
+def bump_deleted_post_folder_version(sender, instance, **kwargs):
+    bump_folder_versions([instance.folder_id])
+
+
+@receiver(post_save, sender=FolderPermission)
+@receiver(post_delete, sender=FolderPermission)
+def bump_shared_folder_version(sender, instance, **kwargs):
+    bump_folder_versions([instance.folder_id])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def bump_post_tags_folder_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        bump_folder_versions([instance.folder_id])
+    else:
+        posts = Post.objects.filter(
+            pk__in=changed_ids(sender, instance, action, pk_set)
+        )
+        bump_folder_versions(posts.values_list("folder_id", flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=Folder.tags.through)
+def bump_folder_tags_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        bump_folder_versions([instance.pk])
+    else:
+        bump_folder_versions(changed_ids(sender, instance, action, pk_set))
+
+
+@receiver(post_save, sender=Tag)
+def bump_tagged_folder_versions(sender, instance, created, **kwargs):
+    # A renamed tag changes every listing showing it
+    if created:
+        return
+    bump_folder_versions(
+        [
+            *instance.posts.values_list("folder_id", flat=True).distinct(),
+            *instance.folder.values_list("pk", flat=True),
+        ]
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def bump_untagged_folder_versions(sender, instance, **kwargs):
+    post_folder_ids = (
+        Post.objects.filter(pk__in=instance._tagged_post_ids)
+        .values_list("folder_id", flat=True)
+        .distinct()
+    )
+    bump_folder_versions([*post_folder_ids, *instance._tagged_folder_ids])
@@ -0,0 +1,278 @@
+"""
+Delta sync: what changed in the folders and posts a user can see since a cursor.
+
+Folders and posts carry an `updated_at` that is set on every change (for folders,
+whenever their version is incremented). A post is also new to a user when its folder
+is shared with them, so it is placed in that user's timeline at the later of its
+`updated_at` and their share's. Deleting a folder or post, unsharing a folder or
+moving a post to another folder leaves a Tombstone for every user who could see it.
+A removed folder takes its posts and subfolders with it, so those get no tombstones
+of their own when a whole subtree is deleted.
+
+Deleting a user, a folder or a queryset of them records the tombstones of everything
+the deletion cascades to in a few queries up front (record_subtree_removals), and
+the pre_delete receivers skip their own per object while it runs
+(removals_recorded).
+
+changes() merges the visible folders and posts updated after the cursor and the
+user's tombstones recorded after it into one timeline ordered by (time, kind, id),
+and returns the first page of it. Tombstones of objects the user can still see
+(e.g. a post moved between two folders shared with them) are skipped.
+
+The cursor handed back with a page is the position of its last entry. Transactions
+do not commit in the order of their timestamps, though, so a change may become
+visible with a timestamp just before a cursor already handed out. The last page's
+cursor is therefore SETTLE_SECONDS ago: the next sync reads that window again, and
+clients apply entries idempotently. An idle client gets empty pages whose cursor
+keeps moving on, so it never expires.
+"""
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Folder, FolderPermission, Post, Tombstone, TombstoneKind
+from .serializers import FolderSerializer, PostSerializer
+
+DEFAULT_SYNC = {
+    # Folders, posts and tombstones returned per page
+    "PAGE_SIZE": 500,
+    # Seconds the last page's cursor stays behind the current time; should exceed
+    # the longest write transaction
+    "SETTLE_SECONDS": 5,
+    # Days tombstones are kept (see `manage.py prune_tombstones`); older cursors
+    # must sync from scratch
+    "TOMBSTONE_DAYS": 30,
+}
+
+# Order of entries with the same timestamp
+FOLDER, POST, TOMBSTONE = 0, 1, 2
+
+# Set while a deletion whose tombstones were recorded up front cascades
+_recorded_in_bulk = ContextVar("removals_recorded_in_bulk", default=False)
+
+
+def sync_options():
+    return {**DEFAULT_SYNC, **getattr(settings, "POSTE_SYNC", {})}
+
+
+class CursorError(ValueError):
+    """Raised for a cursor that was not handed out by changes()."""
+
+
+class CursorExpired(CursorError):
+    """Raised for a cursor older than the tombstones still kept."""
+
+
+class Cursor(namedtuple("Cursor", ["at", "rank", "id"])):
+    """
+    A position in the timeline: entries after it are newer, or as old but of a
+    later rank, or of the same rank and a higher id.
+    """
+
+    def encode(self):
+        at = self.at.astimezone(dt_timezone.utc)
+        micros = (at - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(
+            microseconds=1
+        )
+        return f"{micros}.{self.rank}.{self.id}"
+
+    @classmethod
+    def decode(cls, value):
+        try:
+            micros, rank, pk = (int(part) for part in value.split("."))
+            at = datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(
+                microseconds=micros
+            )
+        except (ValueError, OverflowError):
+            raise CursorError(f"invalid cursor: {value}")
+        return cls(at, rank, pk)
+
+
+def _after(queryset, field, cursor, rank):
+    """Filters `queryset`, whose entries have `rank`, to those after `cursor`."""
+    if cursor is None:
+        return queryset
+    if rank < cursor.rank:
+        return queryset.filter(**{f"{field}__gt": cursor.at})
+    if rank > cursor.rank:
+        return queryset.filter(**{f"{field}__gte": cursor.at})
+    return queryset.filter(
+        Q(**{f"{field}__gt": cursor.at}) | Q(**{field: cursor.at, "pk__gt": cursor.id})
+    )
+
+
+def changes(user, cursor=None, page_size=None):
+    """
+    Returns the next page of changes visible to `user` after `cursor` (a Cursor, or
+    None for everything). Raises CursorExpired if tombstones recorded after the
+    cursor may have been pruned.
+    """
+    options = sync_options()
+    page_size = page_size or options["PAGE_SIZE"]
+    now = timezone.now()
+    if cursor is not None and cursor.at < now - timedelta(
+        days=options["TOMBSTONE_DAYS"]
+    ):
+        raise CursorExpired("cursor expired, sync again from scratch")
+
+    visible_folders = Folder.objects.accessible_to(user)
+    visible_posts = Post.objects.filter(folder__in=visible_folders.values("pk"))
+    folders = (
+        _after(visible_folders, "updated_at", cursor, FOLDER)
+        .for_listing()
+        .order_by("updated_at", "pk")[: page_size + 1]
+    )
+    shares = FolderPermission.objects.filter(user_id=user.pk)
+    if cursor is not None:
+        # Narrows the posts down through the indexes before the exact filter below
+        visible_posts = visible_posts.filter(
+            Q(updated_at__gte=cursor.at)
+            | Q(folder_id__in=shares.filter(updated_at__gte=cursor.at).values("folder"))
+        )
+    shared_at = shares.filter(folder_id=OuterRef("folder_id")).values("updated_at")
+    posts = (
+        _after(
+            visible_posts.annotate(
+                synced_at=Greatest(
+                    "updated_at", Coalesce(Subquery(shared_at[:1]), "updated_at")
+                )
+            ),
+            "synced_at",
+            cursor,
+            POST,
+        )
+        .for_listing()
+        .order_by("synced_at", "pk")[: page_size + 1]
+    )
+    entries = [(Cursor(f.updated_at, FOLDER, f.pk), f) for f in folders]
+    entries += [(Cursor(p.synced_at, POST, p.pk), p) for p in posts]
+    if cursor is not None:
+        # A first sync starts from nothing, so it has nothing to remove
+        tombstones = _after(
+            Tombstone.objects.filter(user_id=user.pk), "deleted_at", cursor, TOMBSTONE
+        ).order_by("deleted_at", "pk")[: page_size + 1]
+        entries += [(Cursor(t.deleted_at, TOMBSTONE, t.pk), t) for t in tombstones]
+    entries.sort(key=lambda entry: entry[0])
+    has_more = len(entries) > page_size
+    entries = entries[:page_size]
+
+    if has_more:
+        next_cursor = entries[-1][0]
+    else:
+        # Everything up to now was read; only the last few seconds may be missing
+        next_cursor = Cursor(now - timedelta(seconds=options["SETTLE_SECONDS"]), -1, 0)
+        if cursor is not None:
+            next_cursor = max(next_cursor, cursor)
+
+    objects = defaultdict(list)
+    for position, obj in entries:
+        objects[position.rank].append(obj)
+    return {
+        "folders": FolderSerializer(objects[FOLDER], many=True).data,
+        "posts": PostSerializer(objects[POST], many=True).data,
+        "deleted": _removed(objects[TOMBSTONE], visible_folders, visible_posts),
+        "cursor": next_cursor.encode(),
+        "has_more": has_more,
+    }
+
+
+def _removed(tombstones, visible_folders, visible_posts):
+    ids = {TombstoneKind.FOLDER: {}, TombstoneKind.POST: {}}
+    for tombstone in tombstones:
+        ids[tombstone.kind][tombstone.object_id] = None  # ordered and unique
+    visible = {
+        TombstoneKind.FOLDER: visible_folders,
+        TombstoneKind.POST: visible_posts,
+    }
+    for kind, pks in ids.items():
+        if pks:
+            for pk in visible[kind].filter(pk__in=pks).values_list("pk", flat=True):
+                del pks[pk]
+    return {
+        "folders": list(ids[TombstoneKind.FOLDER]),
+        "posts": list(ids[TombstoneKind.POST]),
+    }
+
+
+def record_removals(kind, objects):
+    """
+    Leaves tombstones of `kind` for `objects`, (object id, folder id) pairs, for
+    every user who can see the folder: its creator and those it is shared with.
+    """
+    objects = list(objects)
+    folder_ids = {folder_id for _, folder_id in objects}
+    audience = defaultdict(set)
+    # Including folders being deleted, whose audience is still to be told
+    for pk, creator_id in Folder.all_objects.filter(pk__in=folder_ids).values_list(
+        "pk", "creator_id"
+    ):
+        audience[pk].add(creator_id)
+    for folder_id, user_id in FolderPermission.objects.filter(
+        folder_id__in=folder_ids
+    ).values_list("folder_id", "user_id"):
+        audience[folder_id].add(user_id)
+    Tombstone.objects.bulk_create(
+        Tombstone(kind=kind, object_id=pk, user_id=user_id)
+        for pk, folder_id in objects
+        for user_id in audience[folder_id]
+    )
+
+
+def record_subtree_removals(folders):
+    """
+    Leaves folder tombstones for `folders` (a queryset) and every folder below them,
+    with one query per separate subtree. Returns the ids of all those folders.
+    """
+    rows = sorted(
+        Folder.all_objects.filter(pk__in=folders.values("pk")).values_list(
+            "pk", "path"
+        ),
+        key=lambda row: len(row[1]),
+    )
+    folder_ids = {pk for pk, _ in rows}
+    prefixes = []
+    for pk, path in rows:
+        prefix = f"{path}{pk}/"
+        # Subtrees of a folder already included come with it
+        if not any(prefix.startswith(other) for other in prefixes):
+            prefixes.append(prefix)
+            folder_ids.update(
+                Folder.all_objects.descendants_of(prefix).values_list("pk", flat=True)
+            )
+    record_removals(TombstoneKind.FOLDER, [(pk, pk) for pk in folder_ids])
+    return folder_ids
+
+
+@contextmanager
+def removals_recorded():
+    """
+    Keeps the pre_delete receivers from leaving tombstones of their own for the
+    deletion run in this block, whose tombstones were recorded beforehand.
+    """
+    token = _recorded_in_bulk.set(True)
+    try:
+        yield
+    finally:
+        _recorded_in_bulk.reset(token)
+
+
+def removals_recorded_in_bulk():
+    return _recorded_in_bulk.get()
+
+
+def prune_tombstones(days=None):
+    """
+    Deletes the tombstones older than `days` (TOMBSTONE_DAYS by default). Returns
+    how many were deleted.
+    """
+    days = sync_options()["TOMBSTONE_DAYS"] if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,442 @@
+"""
+Inverted tag indexes for posts and folders, and the tag-query language evaluated
+against them.
+
+Each index maps a tag id to the sorted ids of the objects carrying that tag (its
+posting list). A query such as ``python AND django NOT legacy`` is answered by
+intersecting posting lists, smallest first, with binary searches into the larger
+ones, so its cost depends on the shortest list involved rather than on the size of
+the post table.
+
+Indexes are held in memory by each process. They are built from the tag through
+table on first use and then kept up to date by signals (see PosteAPI.signals) once
+the changing transaction commits. Every change also bumps a generation counter in a
+Django cache and is published there under its generation for CHANGE_LOG_SECONDS. A
+process that finds the counter moved by someone else applies the changes it missed,
+in order; only when some of them are gone (expired, evicted, or too many) does it
+rebuild its index from the table. Changes are idempotent, so one that is both read
+by a rebuild and applied afterwards does no harm. That cache must be shared by all
+workers so they see each other's changes; a system check (see PosteAPI.checks)
+rejects per-process caches.
+"""
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Folder, Post, Tag
+
+DEFAULT_TAG_INDEX = {
+    # Alias of the Django cache, shared by all workers, holding each index's
+    # generation counter
+    "CACHE_ALIAS": "default",
+    # Matching ids checked against the queryset of a tagged page per query
+    "CANDIDATE_BATCH": 500,
+    # Seconds each change stays published for the other workers to apply
+    "CHANGE_LOG_SECONDS": 300,
+    # Most missed changes applied one by one; a worker further behind rebuilds
+    "MAX_CATCH_UP": 1000,
+}
+
+
+def tag_index_options():
+    return {**DEFAULT_TAG_INDEX, **getattr(settings, "POSTE_TAG_INDEX", {})}
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+class TagIndex:
+    def __init__(self, name, through, object_field, tag_field="tag_id"):
+        self.name = name
+        self.through = through
+        self.object_field = object_field
+        self.tag_field = tag_field
+        self._postings = {}  # tag id -> sorted array of object ids
+        self._object_tags = {}  # object id -> set of tag ids
+        self._generation = None
+        self._built = False
+        self._lock = threading.RLock()
+
+    # Reading
+
+    def posting(self, tag_id):
+        """
+        Returns the sorted ids of the objects tagged with `tag_id`.
+        """
+        self._ensure_fresh()
+        return self._postings.get(tag_id, array("q"))
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if not self._built or not self._catch_up(self._shared_generation()):
+                self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            generation = self._shared_generation()
+            postings = {}
+            object_tags = {}
+            rows = (
+                self.through.objects.order_by(self.tag_field, self.object_field)
+                .values_list(self.tag_field, self.object_field)
+                .iterator(chunk_size=10000)
+            )
+            for tag_id, object_id in rows:
+                postings.setdefault(tag_id, array("q")).append(object_id)
+                object_tags.setdefault(object_id, set()).add(tag_id)
+            self._postings = postings
+            self._object_tags = object_tags
+            self._generation = generation
+            self._built = True
+
+    def clear(self):
+        """
+        Drops this process's copy of the index; it is rebuilt on next use.
+        """
+        with self._lock:
+            self._built = False
+
+    # Writing; each change is applied once the current transaction commits
+
+    def add_links(self, links):
+        """
+        Records (object id, tag id) pairs, e.g. after bulk-inserting through rows.
+        """
+        links = list(links)
+        transaction.on_commit(lambda: self._apply(self._add_links, links))
+
+    def remove_links(self, links):
+        links = list(links)
+        transaction.on_commit(lambda: self._apply(self._remove_links, links))
+
+    def remove_objects(self, object_ids):
+        object_ids = list(object_ids)
+        transaction.on_commit(lambda: self._apply(self._remove_objects, object_ids))
+
+    def remove_tags(self, tag_ids):
+        tag_ids = list(tag_ids)
+        transaction.on_commit(lambda: self._apply(self._remove_tags, tag_ids))
+
+    def _apply(self, change, arguments):
+        with self._lock:
+            generation = self._bump_shared_generation()
+            self._cache.set(
+                self._change_key(generation),
+                (change.__name__, arguments),
+                timeout=tag_index_options()["CHANGE_LOG_SECONDS"],
+            )
+            if not self._built:
+                return
+            # Changes made by other processes in the meantime come first
+            if self._catch_up(generation - 1):
+                change(arguments)
+                self._generation = generation
+            else:
+                self._built = False
+
+    def _catch_up(self, generation):
+        """
+        Applies the published changes after this copy's generation up to
+        `generation`. Returns False, changing nothing, if some are not available.
+        """
+        if generation == self._generation:
+            return True
+        if self._generation is None or not (
+            0 < generation - self._generation <= tag_index_options()["MAX_CATCH_UP"]
+        ):
+            return False
+        keys = [
+            self._change_key(missed)
+            for missed in range(self._generation + 1, generation + 1)
+        ]
+        changes = self._cache.get_many(keys)
+        if len(changes) < len(keys):
+            return False
+        for key in keys:
+            name, arguments = changes[key]
+            getattr(self, name)(arguments)
+        self._generation = generation
+        return True
+
+    def _add_links(self, links):
+        for object_id, tag_id in links:
+            tags = self._object_tags.setdefault(object_id, set())
+            if tag_id not in tags:
+                tags.add(tag_id)
+                insort(self._postings.setdefault(tag_id, array("q")), object_id)
+
+    def _remove_links(self, links):
+        for object_id, tag_id in links:
+            tags = self._object_tags.get(object_id, set())
+            if tag_id in tags:
+                tags.discard(tag_id)
+                posting = self._postings[tag_id]
+                del posting[bisect_left(posting, object_id)]
+
+    def _remove_objects(self, object_ids):
+        for object_id in object_ids:
+            for tag_id in self._object_tags.pop(object_id, ()):
+                posting = self._postings[tag_id]
+                del posting[bisect_left(posting, object_id)]
+
+    def _remove_tags(self, tag_ids):
+        for tag_id in tag_ids:
+            for object_id in self._postings.pop(tag_id, ()):
+                self._object_tags.get(object_id, set()).discard(tag_id)
+
+    # Coordination between processes
+
+    @property
+    def _cache(self):
+        return caches[tag_index_options()["CACHE_ALIAS"] or "default"]
+
+    @property
+    def _cache_key(self):
+        return f"poste:tagindex:{self.name}:generation"
+
+    def _change_key(self, generation):
+        return f"poste:tagindex:{self.name}:change:{generation}"
+
+    def _shared_generation(self):
+        return self._cache.get_or_set(self._cache_key, 0, timeout=None)
+
+    def _bump_shared_generation(self):
+        try:
+            return self._cache.incr(self._cache_key)
+        except ValueError:  # evicted from the cache
+            self._cache.set(self._cache_key, 1, timeout=None)
+            return 1
+
+
+post_tag_index = TagIndex("post", Post.tags.through, "post_id")
+folder_tag_index = TagIndex("folder", Folder.tags.through, "folder_id")
+
+
+# Tag-query language:
+#   expression := term ("OR" term)*
+#   term       := factor (["AND"] factor)*
+#   factor     := "NOT" factor | "(" expression ")" | tag name
+
+TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+MAX_TOKENS = 50
+
+
+def parse_tag_query(query):
+    """
+    Parses a tag query into a tree of ("tag", name), ("not", node), ("and", [nodes])
+    and ("or", [nodes]) tuples. Tag names are normalized like Tag.save does.
+    """
+    tokens = TOKEN_PATTERN.findall(query)
+    if not tokens:
+        raise TagQueryError("Tag query cannot be blank")
+    if len(tokens) > MAX_TOKENS:
+        raise TagQueryError(f"Tag query cannot have more than {MAX_TOKENS} terms")
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def expression():
+        nodes = [term()]
+        while peek() is not None and peek().upper() == "OR":
+            take()
+            nodes.append(term())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def term():
+        nodes = [factor()]
+        while peek() is not None and peek() != ")" and peek().upper() != "OR":
+            if peek().upper() == "AND":
+                take()
+            nodes.append(factor())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def factor():
+        token = peek()
+        if token is None or token == ")":
+            raise TagQueryError("Tag query ended unexpectedly")
+        take()
+        if token.upper() == "NOT":
+            return ("not", factor())
+        if token == "(":
+            node = expression()
+            if peek() != ")":
+                raise TagQueryError("Missing closing parenthesis")
+            take()
+            return node
+        if token.upper() in ("AND", "OR"):
+            raise TagQueryError(f"Unexpected {token.upper()}")
+        name = Tag.normalize_name(token)
+        if not name:
+            raise TagQueryError(f"Invalid tag name: {token}")
+        return ("tag", name)
+
+    node = expression()
+    if peek() is not None:
+        raise TagQueryError(f"Unexpected {peek()}")
+    return node
+
+
+def _tag_names(node):
+    kind, value = node
+    if kind == "tag":
+        return {value}
+    if kind == "not":
+        return _tag_names(value)
+    return set().union(*(_tag_names(child) for child in value))
+
+
+class _Result:
+    """
+    A set of object ids, held either as a sorted array of the ids in the set, or (when
+    negated) of the ids *not* in the set, so NOT never needs the whole table.
+    """
+
+    def __init__(self, ids, negated=False):
+        self.ids = ids
+        self.negated = negated
+
+
+def _intersect(lists):
+    """
+    Intersects sorted arrays, starting from the smallest and binary searching (with a
+    moving lower bound) into the others.
+    """
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not result:
+            break
+        matches = array("q")
+        low = 0
+        for value in result:
+            low = bisect_left(other, value, low)
+            if low == len(other):
+                break
+            if other[low] == value:
+                matches.append(value)
+        result = matches
+    return result
+
+
+def _union(lists):
+    return array("q", sorted(set().union(*lists)))
+
+
+def _difference(ids, excluded):
+    if not excluded:
+        return ids
+    excluded = set(excluded)
+    return array("q", (value for value in ids if value not in excluded))
+
+
+def _evaluate(node, index, tag_ids):
+    kind, value = node
+    if kind == "tag":
+        tag_id = tag_ids.get(value)
+        return _Result(index.posting(tag_id) if tag_id else array("q"))
+    if kind == "not":
+        result = _evaluate(value, index, tag_ids)
+        return _Result(result.ids, not result.negated)
+
+    results = [_evaluate(child, index, tag_ids) for child in value]
+    included = [r.ids for r in results if not r.negated]
+    excluded = [r.ids for r in results if r.negated]
+    if kind == "and":
+        # A and B and not C and not D == (A and B) minus (C or D)
+        if included:
+            return _Result(_difference(_intersect(included), _union(excluded)))
+        return _Result(_union(excluded), negated=True)
+    # A or B or not C or not D == not ((C and D) minus (A or B))
+    if excluded:
+        return _Result(
+            _difference(_intersect(excluded), _union(included)), negated=True
+        )
+    return _Result(_union(included))
+
+
+def evaluate_tag_query(query, index):
+    """
+    Evaluates a tag query against an index. Returns (ids, negated): the sorted ids of
+    the matching objects, or if `negated` is True, of the objects that do not match.
+    """
+    node = parse_tag_query(query)
+    tag_ids = dict(
+        Tag.objects.filter(name__in=_tag_names(node)).values_list("name", "id")
+    )
+    result = _evaluate(node, index, tag_ids)
+    return result.ids, result.negated
+
+
+def tagged_page(query, index, queryset, page_size, before=None):
+    """
+    Returns up to `page_size` objects of `queryset` matching a tag query, highest id
+    (newest) first, limited to ids below `before`, plus whether more may follow.
+
+    `queryset` restricts the results, e.g. to the objects the user can see. The
+    matches are checked against it newest first, CANDIDATE_BATCH ids per query, until
+    the page is full; a negated match walks the queryset's ids instead, skipping the
+    ids that do not match. Either way a page usually takes one query besides loading
+    its objects, however many objects the queryset or the index holds.
+    """
+    ids, negated = evaluate_tag_query(query, index)
+    batch = max(tag_index_options()["CANDIDATE_BATCH"], page_size + 1)
+    if negated:
+        page_ids = _allowed_except(queryset, ids, page_size + 1, batch, before)
+    else:
+        page_ids = _allowed_among(queryset, ids, page_size + 1, batch, before)
+
+    found = queryset.in_bulk(page_ids[:page_size])
+    page = [found[pk] for pk in page_ids if pk in found]  # skips ones deleted since
+    return page[:page_size], len(page_ids) > page_size
+
+
+def _allowed_among(queryset, ids, count, batch, before=None):
+    """
+    Returns the first `count` of the sorted `ids` below `before` that are in
+    `queryset`, highest first.
+    """
+    end = len(ids) if before is None else bisect_left(ids, before)
+    allowed_ids = []
+    while end > 0 and len(allowed_ids) < count:
+        candidates = ids[max(end - batch, 0) : end]
+        end -= len(candidates)
+        allowed = set(
+            queryset.filter(pk__in=list(candidates)).values_list("pk", flat=True)
+        )
+        allowed_ids += [pk for pk in reversed(candidates) if pk in allowed]
+    return allowed_ids[:count]
+
+
+def _allowed_except(queryset, ids, count, batch, before=None):
+    """
+    Returns the first `count` ids of `queryset` below `before` that are not in the
+    sorted `ids`, highest first.
+    """
+    allowed_ids = []
+    while len(allowed_ids) < count:
+        rows = queryset.order_by("-pk")
+        if before is not None:
+            rows = rows.filter(pk__lt=before)
+        rows = list(rows.values_list("pk", flat=True)[:batch])
+        allowed_ids += [pk for pk in rows if not _contains(ids, pk)]
+        if len(rows) < batch:
+            break
+        before = rows[-1]
+    return allowed_ids[:count]
+
+
+def _contains(ids, value):
+    position = bisect_left(ids, value)
+    return position < len(ids) and ids[position] == value
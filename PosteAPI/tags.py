@@ -0,0 +1,34 @@
+from .models import Tag
+
+
+def normalize_tag_names(names):
+    """
+    Normalizes tag names the way Tag.save does, dropping names that end up empty and
+    duplicates. The first occurrence of each name decides its position.
+    """
+    normalized = (Tag.normalize_name(name) for name in names)
+    return list(dict.fromkeys(name for name in normalized if name))
+
+
+def resolve_tags(names):
+    """
+    Returns the Tag for each of the given names, creating the missing ones, in input
+    order (after normalize_tag_names).
+
+    Costs one query for the existing tags, plus one conflict-ignoring insert and one
+    select for any missing ones. Ignoring conflicts means two requests creating the
+    same new tag at the same time both succeed instead of one hitting the unique
+    constraint on Tag.name.
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return []
+    tags = Tag.objects.in_bulk(names, field_name="name")
+    missing = [name for name in names if name not in tags]
+    if missing:
+        # bulk_create skips Tag.save, so this relies on the names being normalized
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in missing], ignore_conflicts=True
+        )
+        tags.update(Tag.objects.in_bulk(missing, field_name="name"))
+    return [tags[name] for name in names]
@@ -0,0 +1,240 @@
+"""
+Per-request timing: SQL query count and time, serializer time and render time.
+
+TimingMiddleware measures a sample of requests (POSTE_TIMING["SAMPLE_RATE"]), reports
+each one in a Server-Timing header and adds it to rolling per-route aggregates, which
+admins can read at /api/admin/metrics/. Requests that are not sampled only pay for a
+context variable lookup per query and per serializer.
+
+Aggregates are kept per process.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+DEFAULT_TIMING = {
+    # Share of requests measured, from 0 to 1
+    "SAMPLE_RATE": 1.0,
+    # Most recent samples kept per route
+    "WINDOW": 500,
+}
+
+current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+def timing_options():
+    return {**DEFAULT_TIMING, **getattr(settings, "POSTE_TIMING", {})}
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        # Queries may run in several threads at once (see AsyncDataView)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, queries=0):
+        with self._lock:
+            setattr(self, phase, getattr(self, phase) + seconds)
+            self.queries += queries
+
+    def server_timing(self, total):
+        """
+        Returns the value of a Server-Timing header, in milliseconds.
+        """
+        return ", ".join(
+            [
+                f'db;dur={self.db * 1000:.3f};desc="{self.queries} queries"',
+                f"serialize;dur={self.serialize * 1000:.3f}",
+                f"render;dur={self.render * 1000:.3f}",
+                f"total;dur={total * 1000:.3f}",
+            ]
+        )
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query to the current request's timings.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add("db", time.perf_counter() - started, queries=1)
+
+
+def install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def instrument_serializers():
+    """
+    Makes serializer.data count towards the current request's serialize time.
+    Serializers nested in one being timed are not counted twice.
+    """
+    if getattr(BaseSerializer.data.fget, "timed", False):
+        return
+    untimed_data = BaseSerializer.data.fget
+    timing_serializer = contextvars.ContextVar("timing_serializer", default=False)
+
+    def data(self):
+        timings = current_timings.get()
+        if timings is None or timing_serializer.get():
+            return untimed_data(self)
+        token = timing_serializer.set(True)
+        started = time.perf_counter()
+        try:
+            return untimed_data(self)
+        finally:
+            timing_serializer.reset(token)
+            timings.add("serialize", time.perf_counter() - started)
+
+    data.timed = True
+    BaseSerializer.data = property(data)
+
+
+class RouteStats:
+    """
+    Rolling statistics over the most recent requests to each route.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = {}  # route -> deque of (total, db, serialize, render, queries)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, total, timings):
+        sample = (total, timings.db, timings.serialize, timings.render, timings.queries)
+        with self._lock:
+            if route not in self._samples:
+                self._samples[route] = deque(maxlen=self.window)
+                self._counts[route] = 0
+            self._samples[route].append(sample)
+            self._counts[route] += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = {route: list(values) for route, values in self._samples.items()}
+            counts = dict(self._counts)
+        return {
+            route: self._summarize(values, counts[route])
+            for route, values in sorted(samples.items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+    @staticmethod
+    def _summarize(samples, count):
+        def milliseconds(values):
+            values = sorted(values)
+            return {
+                "mean": round(sum(values) / len(values) * 1000, 3),
+                "p50": round(values[len(values) // 2] * 1000, 3),
+                "p95": round(
+                    values[min(int(len(values) * 0.95), len(values) - 1)] * 1000, 3
+                ),
+                "max": round(values[-1] * 1000, 3),
+            }
+
+        total, db, serialize, render, queries = zip(*samples)
+        return {
+            "sampled_requests": count,
+            "window": len(samples),
+            "total_ms": milliseconds(total),
+            "db_ms": milliseconds(db),
+            "serialize_ms": milliseconds(serialize),
+            "render_ms": milliseconds(render),
+            "queries": {
+                "mean": round(sum(queries) / len(queries), 2),
+                "max": max(queries),
+            },
+        }
+
+
+route_stats = RouteStats(timing_options()["WINDOW"])
+
+
+class TimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = self.start()
+        if timings is None:
+            return self.get_response(request)
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = self.start()
+        if timings is None:
+            return await self.get_response(request)
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings)
+
+    @staticmethod
+    def start():
+        """
+        Returns the timings to fill in for a sampled request, or None.
+        """
+        sample_rate = timing_options()["SAMPLE_RATE"]
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return None
+        # Connections opened later get the timer from a connection_created signal
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        return RequestTimings()
+
+    @staticmethod
+    def finish(request, response, timings):
+        total = time.perf_counter() - timings.started
+        response["Server-Timing"] = timings.server_timing(total)
+        match = request.resolver_match
+        if match is not None:
+            route_stats.add(f"{request.method} /{match.route}", total, timings)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF responses are rendered
+        timings = current_timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings.add("render", time.perf_counter() - started)
+
+            response.add_post_render_callback(rendered)
+        return response
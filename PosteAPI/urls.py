@@ -2,14 +2,24 @@ from django.urls import include, path
 
 from .views import (
     AddPostToFolder,
+    AsyncDataView,
     ChangePassword,
     DataView,
+    ExportView,
     FolderAPI,
     FolderDetail,
     FolderForUser,
+    FolderMoveAPI,
+    FolderTaggedView,
+    FolderTreeView,
     IndividualPostView,
     LoginView,
+    MetricsView,
     PostAPI,
+    PostBulkAPI,
+    PostSearchView,
+    PostTaggedView,
+    SyncView,
     UserDetail,
     UsersView,
     deleteFolder,
@@ -29,6 +39,13 @@ urlpatterns = [
     path("data/", DataView.as_view(), name="get-root-data"),
     # GET to retrieve specific folder details: folders, posts (but not shared folders)
     path("data/<int:folder_id>/", DataView.as_view(), name="get-folder-data"),
+    # Same as the two above, for ASGI deployments: the listing's queries run concurrently
+    path("async/data/", AsyncDataView.as_view(), name="async-get-root-data"),
+    path(
+        "async/data/<int:folder_id>/",
+        AsyncDataView.as_view(),
+        name="async-get-folder-data",
+    ),
     # POST to update user permissions
     path("data/folder/", DataView.as_view(), name="folder"),
     # GET specific folder
@@ -38,11 +55,23 @@ urlpatterns = [
     path("folders/", FolderAPI.as_view(), name="folders-list"),
     # DELETE to delete a folder
     path("folders/<int:pk>/", deleteFolder.as_view(), name="delete a folder"),
+    # GET a folder with every folder and post below it (?depth= to limit the levels)
+    path("folders/<int:pk>/tree/", FolderTreeView.as_view(), name="folder-tree"),
+    # POST to move folders into other folders, in one transaction
+    path("folders/move/", FolderMoveAPI.as_view(), name="folder-move"),
+    # GET to list the folders the user can see matching a tag query
+    path("folders/tagged/", FolderTaggedView.as_view(), name="folder-tagged"),
     # GET to list all folders for a user
     path("folders/user/<int:pk>/", FolderForUser.as_view()),
     # GET to list all posts
     # POST to create a post
     path("posts/", PostAPI.as_view(), name="post-lists"),
+    # POST to create many posts at once
+    path("posts/bulk/", PostBulkAPI.as_view(), name="post-bulk-create"),
+    # GET to search the posts the user can see (?q=words)
+    path("posts/search/", PostSearchView.as_view(), name="post-search"),
+    # GET to list the posts the user can see matching a tag query (?q=a AND b NOT c)
+    path("posts/tagged/", PostTaggedView.as_view(), name="post-tagged"),
     # DELETE to delete a post
     # PATCH to edit a post
     path("posts/<int:id>/", IndividualPostView.as_view(), name="post-detail"),
@@ -52,6 +81,12 @@ urlpatterns = [
         AddPostToFolder.as_view(),
         name="add a post to a folder",
     ),
+    # GET what changed in the user's folders and posts since a cursor (?since=)
+    path("sync/", SyncView.as_view(), name="sync"),
+    # GET to download everything in the user's folder tree as JSON
+    path("export/", ExportView.as_view(), name="export"),
+    # GET per-route timing statistics of this worker (admins only), DELETE to reset
+    path("admin/metrics/", MetricsView.as_view(), name="metrics"),
     # Authentication; not used in client
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
 ]
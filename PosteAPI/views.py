@@ -1,28 +1,109 @@
+import asyncio
 import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connections
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, permissions, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
-from .models import Folder, FolderPermission, Post, Tag, User
+from .authentication import CachedTokenAuthentication
+from .cache import response_cache
+from .db.pool import pool_stats
+from .deletion import delete_folder
+from .export import iter_user_export
+from .hashing import (
+    HashingBusy,
+    check_user_password,
+    set_user_password,
+    verify_password,
+)
+from .listing import (
+    cache_key,
+    cache_listing,
+    get_listed_folder,
+    listing_etag,
+    serialize_child_folders,
+    serialize_posts,
+    serialize_shared_folders,
+    serialize_subtree,
+    shared_folder_versions,
+)
+from .models import Folder, FolderPermission, Post, User
+from .moves import move_folders
+from .pagination import KeysetPagination
+from .permissions import PermissionResolver
+from .routers import primary_only, use_primary
+from .search import search_posts
 
 # import local data
 from .serializers import (
     FolderCreateSerializer,
+    FolderMoveSerializer,
     FolderSerializer,
+    PostBulkCreateSerializer,
     PostCreateSerializer,
     PostSerializer,
     UserCreateSerializer,
     UserLoginSerializer,
     UserSerializer,
 )
+from .sync import Cursor, CursorError, CursorExpired, changes
+from .tagindex import TagQueryError, folder_tag_index, post_tag_index, tagged_page
+from .tags import resolve_tags
+from .timing import route_stats
+
+logger = logging.getLogger(__name__)
+
+
+def hashing_busy():
+    return Response(
+        {
+            "result": {"success": False},
+            "error": "Too many password checks in progress, try again shortly",
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
+def etag_matches(request, etag):
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    return etag in if_none_match or "*" in if_none_match
+
+
+def with_etag(response, etag):
+    response["ETag"] = etag
+    # Listings differ per user and must be revalidated before each reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Authorization"])
+    return response
+
+
+def not_modified(etag):
+    return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
 
 
 # Create views / viewsets here.
@@ -71,7 +152,10 @@ class LoginView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data.get("email")
             password = serializer.validated_data.get("password")
-            user = authenticate(request, email=email, password=password)
+            try:
+                user = authenticate(request, email=email, password=password)
+            except HashingBusy:
+                return hashing_busy()
             if user:
                 token, created = Token.objects.get_or_create(user=user)
                 return Response(
@@ -91,7 +175,7 @@ class LoginView(APIView):
 
 
 class DataView(generics.ListAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     serializer_class = FolderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -105,37 +189,170 @@ class DataView(generics.ListAPIView):
 
     @swagger_auto_schema(manual_parameters=[token_param])
     def get(self, request, folder_id=None):
-        if folder_id:
-            folder = Folder.objects.filter(id=folder_id).first()
-            print("Got specific folder: " + str(folder))
-        else:
-            folder = Folder.objects.filter(creator=request.user, is_root=True).first()
-            print("Got root")
+        folder = get_listed_folder(request.user, folder_id)
+        logger.debug(
+            "Listing folder",
+            extra={
+                "folder_id": folder.pk if folder else folder_id,
+                "root": not folder_id,
+            },
+        )
 
         if not folder:
             return Response({"error": "Folder not found"}, status=404)
 
-        own_folders = Folder.objects.filter(creator=request.user, parent=folder)
-        own_posts = Post.objects.filter(folder=folder)
+        # Sharing or unsharing a folder changes the set of shared folders
+        shared_versions = shared_folder_versions(request.user) if folder.is_root else []
+        etag = listing_etag(
+            request.user, [(folder.pk, folder.version), *shared_versions]
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        body = response_cache.get(cache_key(etag))
+        if body is not None:
+            return with_etag(HttpResponse(body, content_type="application/json"), etag)
 
-        folder_serializer = FolderSerializer(own_folders, many=True)
-        post_serializer = PostSerializer(own_posts, many=True)
+        folders, folder_ids = serialize_child_folders(request.user, folder)
         # All GET will get this information
         response_dic = {
-            "folders": folder_serializer.data,
-            "posts": post_serializer.data,
+            "folders": folders,
+            "posts": serialize_posts(folder),
         }
 
         # If in root, add shared folder
         if folder.is_root:
-            folder_perms = FolderPermission.objects.filter(
-                user=request.user, permission__isnull=False
-            ).prefetch_related("folder")
-            shared_folders = [perm.folder for perm in folder_perms]
-            shared_folder_serializer = FolderSerializer(shared_folders, many=True)
-            response_dic["shared_folders"] = shared_folder_serializer.data
+            response_dic["shared_folders"] = serialize_shared_folders(shared_versions)
+
+        shown = [folder.pk, *folder_ids, *dict(shared_versions)]
+        cache_listing(etag, response_dic, shown)
+        return with_etag(Response(response_dic, status=200), etag)
+
+
+class AsyncDataView(View):
+    """
+    DataView for ASGI deployments (see deploy/entrypoint.sh). It returns the same
+    listing, but the independent queries behind it run at the same time in a pool of
+    query threads (see run_concurrently), so their round trips overlap. The worker is
+    free to serve other requests while they run.
+    """
+
+    async def get(self, request, folder_id=None):
+        try:
+            authenticated = await sync_to_async(
+                CachedTokenAuthentication().authenticate
+            )(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+        if authenticated is None:
+            return JsonResponse(
+                {"detail": NotAuthenticated.default_detail},
+                status=NotAuthenticated.status_code,
+            )
+        user = authenticated[0]
 
-        return Response(response_dic, status=200)
+        if folder_id:
+            [folder] = await run_concurrently(
+                lambda: get_listed_folder(user, folder_id)
+            )
+            shared_versions = []
+            if folder and folder.is_root:
+                [shared_versions] = await run_concurrently(
+                    lambda: shared_folder_versions(user)
+                )
+        else:
+            folder, shared_versions = await run_concurrently(
+                lambda: get_listed_folder(user),
+                lambda: shared_folder_versions(user),
+            )
+        if not folder:
+            return JsonResponse({"error": "Folder not found"}, status=404)
+
+        etag = listing_etag(user, [(folder.pk, folder.version), *shared_versions])
+        if etag_matches(request, etag):
+            return with_etag(HttpResponseNotModified(), etag)
+        body = response_cache.get(cache_key(etag))
+        if body is None:
+            parts = [
+                lambda: serialize_child_folders(user, folder),
+                lambda: serialize_posts(folder),
+            ]
+            if folder.is_root:
+                parts.append(lambda: serialize_shared_folders(shared_versions))
+            (folders, folder_ids), posts, *shared = await run_concurrently(*parts)
+            response_dic = {"folders": folders, "posts": posts}
+            if folder.is_root:
+                response_dic["shared_folders"] = shared[0]
+            shown = [folder.pk, *folder_ids, *dict(shared_versions)]
+            body = cache_listing(etag, response_dic, shown)
+        return with_etag(HttpResponse(body, content_type="application/json"), etag)
+
+
+DEFAULT_ASYNC_QUERIES = {
+    # Threads per server process running the queries of async views; each holds
+    # its own database connection(s)
+    "THREADS": 4,
+    # Seconds a query thread keeps using the same connection
+    "CONNECTION_AGE": 300,
+}
+
+
+def async_queries_options():
+    return {**DEFAULT_ASYNC_QUERIES, **getattr(settings, "POSTE_ASYNC_QUERIES", {})}
+
+
+_query_executor = None
+_query_executor_lock = threading.Lock()
+
+
+def query_executor():
+    global _query_executor
+    with _query_executor_lock:
+        if _query_executor is None:
+            _query_executor = ThreadPoolExecutor(
+                async_queries_options()["THREADS"], thread_name_prefix="query"
+            )
+        return _query_executor
+
+
+def recycle_connections():
+    """
+    Keeps the current thread's connections open for its next query, unless they are
+    broken or older than CONNECTION_AGE.
+    """
+    now = time.monotonic()
+    max_age = async_queries_options()["CONNECTION_AGE"]
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is None:
+            connection.__dict__.pop("opened_at", None)
+            continue
+        opened_at = connection.__dict__.setdefault("opened_at", now)
+        broken = connection.errors_occurred and not connection.is_usable()
+        if broken or now - opened_at >= max_age:
+            connection.close()
+            del connection.opened_at
+        connection.errors_occurred = False
+
+
+async def run_concurrently(*functions):
+    """
+    Runs blocking functions at the same time in the query threads and returns their
+    results in order.
+
+    Unlike request threads, the query threads do not close their connections after
+    each use (whatever CONN_MAX_AGE says), so a listing's queries never wait for a
+    connection to be opened, or taken from the pool, first.
+    """
+
+    def in_thread(function):
+        def run():
+            try:
+                return function()
+            finally:
+                recycle_connections()
+
+        return sync_to_async(run, thread_sensitive=False, executor=query_executor())()
+
+    return await asyncio.gather(*(in_thread(function) for function in functions))
 
 
 class UsersView(APIView):
@@ -143,7 +360,8 @@ class UsersView(APIView):
     permission_classes = []
 
     @swagger_auto_schema(
-        operation_description="Returns a list of all users",
+        operation_description="Returns a page of users, newest first",
+        manual_parameters=KeysetPagination.swagger_parameters,
         responses={
             200: UserSerializer(many=True),
             400: "Bad Request",
@@ -151,11 +369,12 @@ class UsersView(APIView):
     )
     def get(self, request):
         """
-        Returns a list of all users
+        Returns a page of users, newest first
         """
-        users = User.objects.all()
+        paginator = KeysetPagination()
+        users = paginator.paginate_queryset(User.objects.all(), request, view=self)
         serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
         operation_description="Creates a new user.",
@@ -194,7 +413,7 @@ class UsersView(APIView):
 
 
 class UserDetail(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self, pk):
@@ -214,27 +433,32 @@ class UserDetail(APIView):
 
 
 class ChangePassword(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
         """
         Edits a user's password
         """
-        user_id = Token.objects.get(key=request.auth.key).user_id
-        user = User.objects.get(id=user_id)
+        user = User.objects.get(id=request.auth.user_id)
         data = json.loads(request.body.decode("utf-8"))
         newPassword = data.get("newPassword")
         oldPassword = data.get("oldPassword")
-        if user.check_password(oldPassword):
-            if user.check_password(newPassword):
+        try:
+            return self.change_password(user, oldPassword, newPassword)
+        except HashingBusy:
+            return hashing_busy()
+
+    def change_password(self, user, oldPassword, newPassword):
+        if check_user_password(user, oldPassword):
+            if verify_password(newPassword, user.password):
                 message = "New password cannot be same as old password"
                 return Response(
                     {"result": {"success": False}, "error": message},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             else:
-                user.set_password(newPassword)
+                set_user_password(user, newPassword)
                 user.save()
                 if hasattr(user, "auth_token"):
                     user.auth_token.delete()
@@ -253,20 +477,24 @@ class ChangePassword(APIView):
 
 
 class FolderAPI(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Returns a list of all folders",
+        operation_description="Returns a page of folders, newest first",
+        manual_parameters=KeysetPagination.swagger_parameters,
         responses={
             200: FolderSerializer(many=True),
             400: "Bad Request",
         },
     )
     def get(self, request):
-        folders = Folder.objects.all()
+        paginator = KeysetPagination()
+        folders = paginator.paginate_queryset(
+            Folder.objects.for_listing(), request, view=self
+        )
         serializer = FolderSerializer(folders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
         operation_description="Creates a new folder.",
@@ -289,8 +517,7 @@ class FolderAPI(APIView):
     def post(self, request):
         serializer = FolderCreateSerializer(data=request.data)
         if serializer.is_valid():
-            validated_data = serializer.validated_data
-            Folder.objects.create(creator=request.user, **validated_data)
+            serializer.save(creator=request.user)
             return Response(status=status.HTTP_201_CREATED)
         else:
             response = Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -305,21 +532,6 @@ class FolderForUser(APIView):
         except User.DoesNotExist:
             return None
 
-    def get_owned(self, user):
-        return Folder.objects.filter(creator=user)
-
-    def get_shared(self, user):
-        if FolderPermission.objects.filter(user=user).exists():
-            shared = None
-            for permission in FolderPermission.objects.filter(user=user):
-                if shared is None:
-                    shared = Folder.objects.filter(pk=permission.folder.pk)
-                else:
-                    shared = shared | Folder.objects.filter(pk=permission.folder.pk)
-            return shared
-        else:
-            return None
-
     def get(self, request, pk):
         user = self.get_object(pk)
         if user is None:
@@ -328,22 +540,7 @@ class FolderForUser(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        owned_folders = self.get_owned(user)
-        shared_folders = self.get_shared(user)
-        folders = None
-
-        if owned_folders is None and shared_folders is None:
-            return Response(
-                {"error": "User has no folders", "success": False},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-        elif owned_folders is None:
-            folders = shared_folders
-        elif shared_folders is None:
-            folders = owned_folders
-        else:
-            folders = shared_folders | owned_folders
-
+        folders = Folder.objects.accessible_to(user).for_listing()
         serializer = FolderSerializer(folders, many=True)
         return Response(
             {"success": True, "folders": serializer.data}, status=status.HTTP_200_OK
@@ -351,20 +548,24 @@ class FolderForUser(APIView):
 
 
 class PostAPI(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Returns a list of all posts",
+        operation_description="Returns a page of posts, newest first",
+        manual_parameters=KeysetPagination.swagger_parameters,
         responses={
             200: PostSerializer(many=True),
             400: "Bad Request",
         },
     )
     def get(self, request):
-        posts = Post.objects.all()
+        paginator = KeysetPagination()
+        posts = paginator.paginate_queryset(
+            Post.objects.for_listing(), request, view=self
+        )
         serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
         operation_description="Creates a new Post.",
@@ -390,21 +591,321 @@ class PostAPI(APIView):
                 data=request.data, context={"request": request}
             )
             if serializer.is_valid():
+                folder = Folder.objects.filter(
+                    pk=serializer.validated_data["folder_id"]
+                ).first()
+                resolver = PermissionResolver.for_request(request)
+                if folder is not None and not resolver.can_edit_folder(folder):
+                    return Response(
+                        {
+                            "success": False,
+                            "errors": {"folder": ["No permission to add posts here"]},
+                        },
+                        status=status.HTTP_403_FORBIDDEN,
+                    )
                 serializer.validated_data["creator"] = request.user
                 serializer.save()
                 return Response(status=status.HTTP_201_CREATED)
             else:
-                print("Error: ", serializer.errors)
+                logger.info("Invalid post", extra={"errors": serializer.errors})
                 response = Response(
                     serializer.errors, status=status.HTTP_400_BAD_REQUEST
                 )
                 return response
-        except Exception as e:
-            print("Error: ", e)
+        except Exception:
+            message = "Server error occurred while creating post"
+            logger.exception(message)
+            return Response(
+                {"success": False, "errors": {"post": [message]}},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class PostBulkAPI(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Creates several posts at once, in a single transaction.",
+        request_body=PostBulkCreateSerializer,
+        responses={
+            201: openapi.Response(
+                description="The ids of the created posts, in request order",
+                examples={"application/json": {"success": True, "posts": [1, 2]}},
+            ),
+            400: openapi.Response(
+                description="Bad Request",
+                examples={
+                    "application/json": {
+                        "success": False,
+                        "errors": {"posts": ["folder does not exist: 42"]},
+                    }
+                },
+            ),
+        },
+    )
+    def post(self, request):
+        serializer = PostBulkCreateSerializer(
+            data=request.data, context={"request": request}
+        )
+        if not serializer.is_valid():
+            return Response(
+                {"success": False, "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        posts = serializer.save()
+        return Response(
+            {"success": True, "posts": [post.pk for post in posts]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class FolderTreeView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Returns a folder with its posts and, nested under "
+        "'folders', every folder below it with their own posts.",
+        manual_parameters=[
+            openapi.Parameter(
+                "depth",
+                openapi.IN_QUERY,
+                description="Levels of folders to include below the folder; all of "
+                "them if left out",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={200: "The folder tree", 400: "Invalid depth", 404: "Not found"},
+    )
+    def get(self, request, pk):
+        depth = request.query_params.get("depth")
+        if depth is not None:
+            try:
+                depth = int(depth)
+            except ValueError:
+                depth = -1
+            if depth < 0:
+                return Response(
+                    {
+                        "success": False,
+                        "errors": {"depth": ["depth must be a non-negative integer"]},
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        folder = Folder.objects.accessible_to(request.user).filter(pk=pk).first()
+        if folder is None:
+            return Response(
+                {"success": False, "error": "Folder not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(serialize_subtree(folder, request.user, depth))
+
+
+class FolderMoveAPI(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Moves one or more folders into new parent folders, "
+        "all at once or not at all.",
+        request_body=FolderMoveSerializer,
+        responses={
+            200: openapi.Response(
+                description="The folders were moved",
+                examples={"application/json": {"success": True}},
+            ),
+            400: openapi.Response(
+                description="Bad Request",
+                examples={
+                    "application/json": {
+                        "success": False,
+                        "errors": {
+                            "moves": [
+                                "cannot move a folder into itself or a subfolder: 4"
+                            ]
+                        },
+                    }
+                },
+            ),
+        },
+    )
+    def post(self, request):
+        serializer = FolderMoveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"success": False, "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        moves = [
+            (move["folder_id"], move["parent_id"])
+            for move in serializer.validated_data["moves"]
+        ]
+        try:
+            move_folders(request.user, moves)
+        except ValidationError as e:
+            return Response(
+                {"success": False, "errors": {"moves": e.messages}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({"success": True}, status=status.HTTP_200_OK)
+
+
+class PostSearchView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    @swagger_auto_schema(
+        operation_description="Full-text search over the posts the user can see, "
+        "best match first.",
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                openapi.IN_QUERY,
+                description="Words to search for in post titles, descriptions and URLs",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter("page", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter("page_size", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: PostSerializer(many=True), 400: "Missing search query"},
+    )
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"success": False, "errors": {"q": ["Search query cannot be blank"]}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            page = max(int(request.query_params.get("page", 1)), 1)
+            page_size = int(request.query_params.get("page_size", self.PAGE_SIZE))
+        except ValueError:
+            page, page_size = 1, self.PAGE_SIZE
+        page_size = min(max(page_size, 1), self.MAX_PAGE_SIZE)
+
+        # Fetch one extra result to find out whether there is a next page
+        posts = search_posts(
+            request.user, query, limit=page_size + 1, offset=(page - 1) * page_size
+        )
+        next_link = None
+        if len(posts) > page_size:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), "page", page + 1
+            )
+        serializer = PostSerializer(posts[:page_size], many=True)
+        return Response({"next": next_link, "results": serializer.data})
+
+
+class TaggedView(APIView):
+    """
+    Lists the objects the user can see whose tags match a tag query such as
+    "python AND django NOT legacy", newest first. AND binds tighter than OR, AND may be
+    left out, and parentheses group.
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+
+    manual_parameters = [
+        openapi.Parameter(
+            "q",
+            openapi.IN_QUERY,
+            description="Tag query, e.g. 'python AND (django OR flask) NOT legacy'",
+            type=openapi.TYPE_STRING,
+            required=True,
+        ),
+        openapi.Parameter(
+            "cursor",
+            openapi.IN_QUERY,
+            description="Cursor taken from the 'next' link of the previous page.",
+            type=openapi.TYPE_INTEGER,
+        ),
+        openapi.Parameter("page_size", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ]
+
+    # Set by subclasses, which also define get_queryset(user)
+    index = None
+    serializer_class = None
+
+    def get(self, request):
+        try:
+            before = request.query_params.get("cursor")
+            before = int(before) if before else None
+            page_size = int(request.query_params.get("page_size", self.PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {"success": False, "errors": {"cursor": ["Invalid cursor"]}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page_size = min(max(page_size, 1), self.MAX_PAGE_SIZE)
+        try:
+            page, has_next = tagged_page(
+                request.query_params.get("q", ""),
+                self.index,
+                self.get_queryset(request.user),
+                page_size,
+                before=before,
+            )
+        except TagQueryError as e:
+            return Response(
+                {"success": False, "errors": {"q": [str(e)]}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        next_link = None
+        if has_next:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), "cursor", page[-1].pk
+            )
+        serializer = self.serializer_class(page, many=True)
+        return Response({"next": next_link, "results": serializer.data})
+
+
+class PostTaggedView(TaggedView):
+    index = post_tag_index
+    serializer_class = PostSerializer
+
+    def get_queryset(self, user):
+        return Post.objects.for_listing().filter(
+            folder__in=Folder.objects.accessible_to(user).values("pk")
+        )
+
+    @swagger_auto_schema(
+        operation_description="Lists the posts the user can see whose tags match a "
+        "tag query, newest first.",
+        manual_parameters=TaggedView.manual_parameters,
+        responses={200: PostSerializer(many=True), 400: "Invalid tag query"},
+    )
+    def get(self, request):
+        return super().get(request)
+
+
+class FolderTaggedView(TaggedView):
+    index = folder_tag_index
+    serializer_class = FolderSerializer
+
+    def get_queryset(self, user):
+        return Folder.objects.accessible_to(user).for_listing()
+
+    @swagger_auto_schema(
+        operation_description="Lists the folders the user can see whose tags match a "
+        "tag query, newest first.",
+        manual_parameters=TaggedView.manual_parameters,
+        responses={200: FolderSerializer(many=True), 400: "Invalid tag query"},
+    )
+    def get(self, request):
+        return super().get(request)
 
 
 class IndividualPostView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request, id):
@@ -431,6 +932,14 @@ class IndividualPostView(APIView):
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not PermissionResolver.for_request(request).can_edit_post(post):
+            return Response(
+                {
+                    "success": False,
+                    "errors": {"post": ["No permission to delete this post"]},
+                },
+                status=status.HTTP_403_FORBIDDEN,
+            )
         post.delete()
         return Response(
             {
@@ -447,42 +956,48 @@ class IndividualPostView(APIView):
         """
         try:
             post = Post.objects.get(pk=id)
-        except Post.DoesNotExist as e:
+        except Post.DoesNotExist:
             message = "Post does not exist"
-            print(f"{message}. Error: {e}")
+            logger.info(message, extra={"post_id": id})
             return Response(
                 {"success": False, "errors": {"post": [message]}},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        except Post.MultipleObjectsReturned as e:
+        except Post.MultipleObjectsReturned:
             message = "Multiple Posts found with that ID"
-            print(f"{message}. Error: {e}")
+            logger.error(message, extra={"post_id": id})
             return Response(
                 {"success": False, "errors": {"post": [message]}},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+        if not PermissionResolver.for_request(request).can_edit_post(post):
+            return Response(
+                {
+                    "success": False,
+                    "errors": {"post": ["No permission to edit this post"]},
+                },
+                status=status.HTTP_403_FORBIDDEN,
+            )
 
         data = json.loads(request.body.decode("utf-8"))
         try:
             tags_merged = data.get("tags")
             tag_names = [tag.strip() for tag in tags_merged.split(", ") if tag.strip()]
-        except Exception as e:
-            print(f"Error: {e}")
+        except Exception:
+            logger.info("Error parsing tags", exc_info=True, extra={"post_id": id})
             return Response(
                 {"success": False, "errors": {"post": ["Error parsing tags"]}},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        tag_list = []
-        if tag_names:
-            for tag_name in tag_names:
-                tag, created = Tag.objects.get_or_create(name=tag_name)
-                print(f"Tag: {tag}, Created: {created}")
-                tag_list.append(tag)
+        tag_list = resolve_tags(tag_names)
         post.edit(data.get("title"), data.get("description"), data.get("url"), tag_list)
         return Response({"success": True}, status=status.HTTP_200_OK)
 
 
 class AddPostToFolder(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
     def get_object(self, pk):
         try:
             return Folder.objects.get(pk=pk)
@@ -495,6 +1010,8 @@ class AddPostToFolder(APIView):
         except Post.DoesNotExist:
             return None
 
+    # Moves the post despite being a GET
+    @primary_only
     def get(self, request, pk, pk2):
         folder = self.get_object(pk)
         if folder is None:
@@ -510,6 +1027,15 @@ class AddPostToFolder(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
+        # Moving a post edits both the folder it leaves and the one it joins
+        resolver = PermissionResolver.for_request(request)
+        resolver.load_folders([folder, post.folder_id])
+        if not (resolver.can_edit_post(post) and resolver.can_edit_folder(folder)):
+            return Response(
+                {"error": "no permission to move this post", "success": False},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
         post.folder = folder
         post.save()
 
@@ -517,7 +1043,7 @@ class AddPostToFolder(APIView):
 
 
 class deleteFolder(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self, pk):
@@ -526,11 +1052,21 @@ class deleteFolder(APIView):
         except Folder.DoesNotExist:
             return None
 
+    def forbidden(self, request, folder):
+        if PermissionResolver.for_request(request).can_edit_folder(folder):
+            return None
+        return Response(
+            {"success": False, "Error": "No permission to delete this folder."},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
     def delete(self, request, pk):
-        # TODO: Check permissions
         try:
             folder = self.get_object(pk)
             if folder is not None:
+                forbidden = self.forbidden(request, folder)
+                if forbidden is not None:
+                    return forbidden
                 if folder.is_root:
                     return Response(
                         {
@@ -539,8 +1075,10 @@ class deleteFolder(APIView):
                         },
                         status=status.HTTP_400_BAD_REQUEST,
                     )
+                elif delete_folder(folder) is not None:
+                    # Large subtree, still being deleted in the background
+                    return Response({"success": True}, status=status.HTTP_202_ACCEPTED)
                 else:
-                    folder.delete()
                     return Response({"success": True}, status=status.HTTP_200_OK)
             else:
                 return Response(
@@ -553,10 +1091,24 @@ class deleteFolder(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+    # Deletes the folder despite being a GET
+    @primary_only
     def get(self, request, pk):
         folder = self.get_object(pk)
         if folder is not None:
-            folder.delete()
+            forbidden = self.forbidden(request, folder)
+            if forbidden is not None:
+                return forbidden
+            if folder.is_root:
+                return Response(
+                    {
+                        "success": False,
+                        "Error": "Cannot delete root folder.",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if delete_folder(folder) is not None:
+                return Response({"success": True}, status=status.HTTP_202_ACCEPTED)
             return Response({"success": True}, status=status.HTTP_200_OK)
         else:
             return Response(
@@ -566,7 +1118,7 @@ class deleteFolder(APIView):
 
 
 class FolderDetail(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self, pk):
@@ -581,12 +1133,31 @@ class FolderDetail(APIView):
             return Response(
                 {"error": "Folder not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        resolver = PermissionResolver.for_request(request)
+        if not (resolver.can_edit_folder(folder) or resolver.can_view_folder(folder)):
+            return Response(
+                {"error": "No permission to view this folder"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        etag = listing_etag(request.user, [(folder.pk, folder.version)])
+        if etag_matches(request, etag):
+            return not_modified(etag)
         serializer = FolderSerializer(folder)
-        return Response(serializer.data)
+        return with_etag(Response(serializer.data), etag)
 
     def patch(self, request, pk):
         try:
             folder = self.get_object(pk)
+            if folder is None:
+                raise Folder.DoesNotExist
+            if not PermissionResolver.for_request(request).can_edit_folder(folder):
+                return Response(
+                    {
+                        "success": False,
+                        "errors": {"post": ["No permission to edit this folder"]},
+                    },
+                    status=status.HTTP_403_FORBIDDEN,
+                )
             folder.edit(request.data["title"])
             return Response({"success": True}, status=status.HTTP_200_OK)
         except ObjectDoesNotExist:
@@ -595,10 +1166,113 @@ class FolderDetail(APIView):
                 {"success": False, "errors": {"post": [message]}},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        except Exception as e:
+        except Exception:
             message = "Server error occurred while editing folder"
-            print(f"{message}: {e}")
+            logger.exception(message, extra={"folder_id": pk})
             return Response(
                 {"success": False, "errors": {"post": [message]}},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+
+class SyncView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Returns the folders and posts the user can see that "
+        "changed since a cursor, and the ids of those removed, oldest change first. "
+        "Without a cursor, returns everything.",
+        manual_parameters=[
+            openapi.Parameter(
+                "since",
+                openapi.IN_QUERY,
+                description="The cursor returned by the previous sync",
+                type=openapi.TYPE_STRING,
+            ),
+        ],
+        responses={
+            200: openapi.Response(
+                description="A page of changes",
+                examples={
+                    "application/json": {
+                        "folders": [],
+                        "posts": [],
+                        "deleted": {"folders": [4], "posts": [12, 13]},
+                        "cursor": "1792215362000000.-1.0",
+                        "has_more": False,
+                    }
+                },
+            ),
+            400: "Invalid cursor",
+            410: "Cursor expired, sync again without it",
+        },
+    )
+    def get(self, request):
+        since = request.query_params.get("since")
+        try:
+            cursor = Cursor.decode(since) if since else None
+            # Replicas lag behind, and a cursor must never pass changes not yet
+            # copied to them
+            with use_primary():
+                page = changes(request.user, cursor)
+        except CursorExpired as e:
+            return Response(
+                {"success": False, "errors": {"since": [str(e)]}},
+                status=status.HTTP_410_GONE,
+            )
+        except CursorError as e:
+            return Response(
+                {"success": False, "errors": {"since": [str(e)]}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(page)
+
+
+class ExportView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Streams a JSON export of the user's folders, posts and tags.",
+        responses={
+            200: "JSON document with 'user', 'folders' and 'posts'",
+            404: "The user has no root folder",
+        },
+    )
+    def get(self, request):
+        try:
+            chunks = iter_user_export(request.user)
+        except Folder.DoesNotExist:
+            return Response(
+                {"success": False, "error": "Root folder not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        response = StreamingHttpResponse(chunks, content_type="application/json")
+        response["Content-Disposition"] = 'attachment; filename="poste-export.json"'
+        return response
+
+
+class MetricsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Returns rolling timing statistics per route for the "
+        "requests this worker sampled: latency, database time, serializer time, render "
+        "time and query counts. Also returns the worker's database connection pool "
+        "statistics, if pooling is enabled.",
+        responses={200: "Statistics keyed by method and route", 403: "Not an admin"},
+    )
+    def get(self, request):
+        return Response(
+            {"routes": route_stats.snapshot(), "database_pools": pool_stats()}
+        )
+
+    @swagger_auto_schema(
+        operation_description="Clears this worker's timing statistics.",
+        responses={204: "Cleared", 403: "Not an admin"},
+    )
+    def delete(self, request):
+        route_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
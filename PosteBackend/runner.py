@@ -0,0 +1,32 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# One in-memory cache per alias, so tests never touch (or clear) the shared cache of
+# a server running on the same host
+TEST_CACHES = {
+    alias: {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": alias,
+    }
+    for alias in ("default", "shared")
+}
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with in-memory caches, the way Django's own runner swaps in the
+    in-memory email backend.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_settings = override_settings(
+            CACHES=TEST_CACHES,
+            # The tests run in one process, so per-process caches are shared enough
+            SILENCED_SYSTEM_CHECKS=["PosteAPI.E001", "PosteAPI.E002"],
+        )
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        super().teardown_test_environment(**kwargs)
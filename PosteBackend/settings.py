@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
+from PosteAPI.log import parse_logger_values
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,11 +52,136 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",  # Ensuring only Token Auth is used
+        "PosteAPI.authentication.CachedTokenAuthentication",  # Ensuring only Token Auth is used
     ],
+    "DEFAULT_PAGINATION_CLASS": "PosteAPI.pagination.KeysetPagination",
+    "PAGE_SIZE": int(os.environ.get("API_PAGE_SIZE", 50)),
+}
+
+# "default" is per process. "shared" holds what every worker has to agree on: tag
+# index changes and replica pins, and token lookups if TOKEN_CACHE_ALIAS says so.
+# Its file-based default is only shared by the workers of one host and costs file
+# I/O per lookup; set SHARED_CACHE_BACKEND and SHARED_CACHE_LOCATION to a Memcached
+# or Redis server in production.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": os.environ.get(
+            "SHARED_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.environ.get(
+            "SHARED_CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "poste-cache")
+        ),
+        "OPTIONS": {
+            # Culled at random once full (file-based and in-memory backends only)
+            "MAX_ENTRIES": int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", 100000)),
+        },
+    },
+}
+
+# Runs the tests with in-memory caches
+TEST_RUNNER = "PosteBackend.runner.TestRunner"
+
+# Token -> user lookups cached by PosteAPI.authentication.CachedTokenAuthentication,
+# in each process by default. With several workers, set TOKEN_CACHE_ALIAS=shared
+# (backed by Memcached or Redis): otherwise a revoked token stays valid in the other
+# workers for up to TOKEN_CACHE_TTL seconds.
+POSTE_TOKEN_CACHE = {
+    "TTL": int(os.environ.get("TOKEN_CACHE_TTL", 300)),
+    "MAX_ENTRIES": int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", 10000)),
+    "CACHE_ALIAS": os.environ.get("TOKEN_CACHE_ALIAS") or None,
+}
+
+# Rendered folder listings, keyed by folder versions; with several workers, point
+# RESPONSE_CACHE_ALIAS at a shared cache so they all reuse each other's entries
+POSTE_RESPONSE_CACHE = {
+    "MAX_ENTRIES": int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 5000)),
+    "TTL": int(os.environ.get("RESPONSE_CACHE_TTL", 3600)),
+    "CACHE_ALIAS": os.environ.get("RESPONSE_CACHE_ALIAS"),
+}
+
+# Tag query indexes are held by each worker, which pick up each other's tag changes
+# through TAG_INDEX_CACHE_ALIAS, a cache shared by all of them
+POSTE_TAG_INDEX = {
+    "CACHE_ALIAS": os.environ.get("TAG_INDEX_CACHE_ALIAS", "shared"),
+    "CANDIDATE_BATCH": int(os.environ.get("TAG_INDEX_CANDIDATE_BATCH", 500)),
+    "CHANGE_LOG_SECONDS": int(os.environ.get("TAG_INDEX_CHANGE_LOG_SECONDS", 300)),
+    "MAX_CATCH_UP": int(os.environ.get("TAG_INDEX_MAX_CATCH_UP", 1000)),
+}
+
+# Share of requests whose query count, database, serializer and render time are
+# measured, reported in a Server-Timing header and aggregated per route
+POSTE_TIMING = {
+    "SAMPLE_RATE": float(os.environ.get("TIMING_SAMPLE_RATE", 0.1)),
+    "WINDOW": int(os.environ.get("TIMING_WINDOW", 500)),
+}
+
+# Threads per server process running the concurrent queries of the /api/async/
+# views, and how many seconds each keeps reusing its database connection
+POSTE_ASYNC_QUERIES = {
+    "THREADS": int(os.environ.get("ASYNC_QUERY_THREADS", 4)),
+    "CONNECTION_AGE": int(os.environ.get("ASYNC_QUERY_CONNECTION_AGE", 300)),
+}
+
+# At most PASSWORD_HASHING_MAX_PENDING passwords are hashed at once per server
+# process (see PosteAPI.hashing), so that login bursts get 503s instead of tying up
+# every thread; `manage.py benchmark_hashers` times the hashers on this host
+POSTE_PASSWORD_HASHING = {
+    "MAX_PENDING": int(os.environ.get("PASSWORD_HASHING_MAX_PENDING", 8)),
+    "WAIT": float(os.environ.get("PASSWORD_HASHING_WAIT", 2.0)),
+}
+
+# Delta sync (see PosteAPI.sync); run `manage.py prune_tombstones` daily, clients that
+# have not synced for TOMBSTONE_DAYS must download everything again
+POSTE_SYNC = {
+    "PAGE_SIZE": int(os.environ.get("SYNC_PAGE_SIZE", 500)),
+    "SETTLE_SECONDS": int(os.environ.get("SYNC_SETTLE_SECONDS", 5)),
+    "TOMBSTONE_DAYS": int(os.environ.get("SYNC_TOMBSTONE_DAYS", 30)),
+}
+
+# PosteAPI logs JSON lines to stdout from a background thread (see PosteAPI.log).
+# LOG_LEVELS and LOG_SAMPLING take "logger=value" pairs separated by commas, e.g.
+# LOG_LEVELS="PosteAPI.views=DEBUG" or LOG_SAMPLING="PosteAPI.views=0.1".
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"json": {"()": "PosteAPI.log.JSONFormatter"}},
+    "filters": {
+        "sampling": {
+            "()": "PosteAPI.log.SamplingFilter",
+            "rates": parse_logger_values(os.environ.get("LOG_SAMPLING", ""), float),
+        },
+    },
+    "handlers": {
+        "background": {
+            "()": "PosteAPI.log.BackgroundHandler",
+            "formatter": "json",
+            "filters": ["sampling"],
+            "max_queue_size": int(os.environ.get("LOG_QUEUE_SIZE", 10000)),
+        },
+    },
+    "loggers": {
+        "PosteAPI": {
+            "handlers": ["background"],
+            "level": os.environ.get("LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+        **{
+            name: {"level": level}
+            for name, level in parse_logger_values(
+                os.environ.get("LOG_LEVELS", ""), str.upper
+            ).items()
+        },
+    },
 }
 
 MIDDLEWARE = [
+    "PosteAPI.log.RequestIdMiddleware",
+    "PosteAPI.timing.TimingMiddleware",
+    "PosteAPI.routers.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -102,14 +230,23 @@ localdb = {
 }
 
 # If running via Docker Compose, Postgres may be used (see docker-compose.yml and DATABASES env var)
+# Connections come from a pool per server process (see PosteAPI.db.pool), whose
+# statistics are listed at /api/admin/metrics/
 dockerdb = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "PosteAPI.db.postgresql",
         "NAME": os.environ.get("DATABASE_NAME", "postgres"),
         "USER": os.environ.get("DATABASE_USER", "postgres"),
         "PASSWORD": os.environ.get("DATABASE_PASSWORD", "postgres"),
         "HOST": os.environ.get("DATABASE_HOST", "postgres"),
         "PORT": os.environ.get("DATABASE_PORT", "5432"),
+        "POOL": {
+            "MAX_SIZE": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+            "MAX_LIFETIME": int(os.environ.get("DATABASE_POOL_MAX_LIFETIME", 1800)),
+            "MAX_IDLE": int(os.environ.get("DATABASE_POOL_MAX_IDLE", 300)),
+            "CHECK_AFTER": int(os.environ.get("DATABASE_POOL_CHECK_AFTER", 30)),
+            "TIMEOUT": float(os.environ.get("DATABASE_POOL_TIMEOUT", 5)),
+        },
     }
 }
 
@@ -118,6 +255,32 @@ if os.environ.get("DATABASE_SETTING") == "docker":
 else:
     DATABASES = localdb
 
+# Read replicas, as a comma-separated DATABASE_REPLICAS list of hosts for Postgres
+# (same credentials as the primary) or of database files for SQLite. Safe requests
+# read from them unless the client wrote in the last REPLICA_PIN_SECONDS, as
+# remembered in the REPLICA_PIN_CACHE_ALIAS cache, which must be shared by every
+# worker (a per-process cache fails the startup checks).
+REPLICA_ALIASES = []
+for index, replica in enumerate(
+    filter(None, os.environ.get("DATABASE_REPLICAS", "").split(","))
+):
+    alias = f"replica{index + 1}"
+    location = "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        location: replica.strip(),
+        # Tests read the primary through the replicas
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ["PosteAPI.routers.ReplicaRouter"]
+POSTE_REPLICAS = {
+    "DATABASES": REPLICA_ALIASES,
+    "PIN_SECONDS": int(os.environ.get("REPLICA_PIN_SECONDS", 5)),
+    "CACHE_ALIAS": os.environ.get("REPLICA_PIN_CACHE_ALIAS", "shared"),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,118 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from PosteAPI.authentication import TokenCache, token_cache
+from PosteAPI.cache import LRUCache
+from PosteAPI.models import User
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_entries_expire(self):
+        cache = LRUCache(max_entries=2, ttl=-1)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_add_keeps_live_entries(self):
+        cache = LRUCache(max_entries=2)
+        self.assertTrue(cache.add("a", 1))
+        self.assertFalse(cache.add("a", 2))
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("a", 1, ttl=-1)
+        self.assertTrue(cache.add("a", 2))
+
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_eviction_is_seen_by_other_workers(self):
+        worker = TokenCache(300, 10, "shared")
+        other_worker = TokenCache(300, 10, "shared")
+        worker.add(self.token.key, self.user, self.token)
+        self.assertIsNotNone(other_worker.get(self.token.key))
+        other_worker.evict_user(self.user.pk)
+        self.assertIsNone(worker.get(self.token.key))
+
+    def test_lookup_racing_eviction_is_not_cached(self):
+        for cache in (TokenCache(300, 10, "shared"), TokenCache(300, 10)):
+            # Looked up before the token was revoked, cached after
+            cache.evict(self.token.key)
+            cache.add(self.token.key, self.user, self.token)
+            self.assertIsNone(cache.get(self.token.key))
+
+    def test_clear_keeps_other_shared_entries(self):
+        cache = TokenCache(300, 10, "shared")
+        cache.add(self.token.key, self.user, self.token)
+        caches["shared"].set("other", "kept")
+        cache.clear()
+        self.assertIsNone(cache.get(self.token.key))
+        self.assertEqual(caches["shared"].get("other"), "kept")
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.url = f"/api/users/{self.user.id}/"
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        return response, [
+            q for q in context.captured_queries if "authtoken_token" in q["sql"]
+        ]
+
+    def test_token_lookup_is_cached(self):
+        response, queries = self.token_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.token_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_deleted_token_is_rejected_immediately(self):
+        self.token_queries()
+        self.token.delete()
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_is_rejected_immediately(self):
+        self.token_queries()
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_change_password_revokes_old_token(self):
+        self.token_queries()
+        response = self.client.post(
+            "/api/users/changepassword/",
+            {"oldPassword": "securepassword123", "newPassword": "newpassword123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,35 @@
+from django.test import TestCase
+
+from PosteAPI.benchmark import DatasetShape, generate_dataset, run_benchmark
+from PosteAPI.models import Folder, Post
+
+
+class SyntheticDatasetTest(TestCase):
+    def test_shape(self):
+        shape = DatasetShape(users=4, depth=2, fanout=2, posts_per_folder=1)
+        dataset = generate_dataset(shape)
+        # A root and 2 + 4 descendants per user
+        self.assertEqual(dataset["folders"], 4 * 7)
+        self.assertEqual(Post.objects.count(), 4 * 7)
+        self.assertEqual(Post.tags.through.objects.count(), 4 * 7 * shape.tags_per_post)
+
+    def test_paths_match_parents(self):
+        generate_dataset(DatasetShape(users=2, depth=3, fanout=2))
+        for folder in Folder.objects.exclude(parent=None):
+            self.assertEqual(folder.path, folder.parent.descendant_path_prefix)
+
+
+class BenchmarkTest(TestCase):
+    def test_reports_every_endpoint(self):
+        results = run_benchmark(
+            DatasetShape(users=3, depth=1, fanout=2, share_density=0.5), iterations=2
+        )
+        self.assertEqual(results["dataset"]["shares"], 3 * 2)
+        for name, result in results["endpoints"].items():
+            self.assertEqual(result["iterations"], 2)
+            self.assertLessEqual(
+                result["latency_ms"]["p50"], result["latency_ms"]["p99"]
+            )
+            self.assertTrue(
+                all(code in ("200", "201") for code in result["status_codes"]), name
+            )
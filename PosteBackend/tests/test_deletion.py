@@ -0,0 +1,213 @@
+import threading
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from PosteAPI.cache import response_cache
+from PosteAPI.deletion import delete_folder, delete_subtree, mark_deleting, subtree_size
+from PosteAPI.models import (
+    Folder,
+    FolderPermission,
+    FolderPermissionEnum,
+    Post,
+    Tag,
+    User,
+)
+from PosteAPI.tagindex import folder_tag_index, post_tag_index
+
+
+def build_tree(user, parent, depth, fanout, posts_per_folder):
+    """
+    Creates `fanout` child folders per folder, `depth` levels below `parent`, each
+    with tagged posts. Returns the created folders.
+    """
+    tag = Tag.objects.get_or_create(name="tree")[0]
+    folders = []
+    level = [parent]
+    for _ in range(depth):
+        children = []
+        for folder in level:
+            for i in range(fanout):
+                child = Folder.objects.create(
+                    title=f"{folder.title}.{i}", creator=user, parent=folder
+                )
+                child.tags.add(tag)
+                for j in range(posts_per_folder):
+                    user.create_post(f"Post {j}", "http://example.com", child).tags.add(
+                        tag
+                    )
+                children.append(child)
+        folders.extend(children)
+        level = children
+    return folders
+
+
+class DeleteSubtreeTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        post_tag_index.clear()
+        folder_tag_index.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.folder = self.user.create_folder("Folder")
+        self.kept = self.user.create_folder("Kept")
+        self.kept_post = self.user.create_post("Kept", "http://example.com", self.kept)
+        self.descendants = build_tree(self.user, self.folder, 2, 2, 3)
+        self.user.share_folder_with_user(
+            self.descendants[0], self.other, FolderPermissionEnum.VIEWER
+        )
+
+    def test_deletes_subtree(self):
+        subtree_ids = [self.folder.pk] + [folder.pk for folder in self.descendants]
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = delete_subtree(self.folder, chunk_size=4)
+
+        self.assertEqual(deleted, {"folders": 7, "posts": 18})
+        self.assertFalse(Folder.objects.filter(pk__in=subtree_ids).exists())
+        self.assertFalse(Post.objects.filter(folder_id__in=subtree_ids).exists())
+        self.assertFalse(
+            Post.tags.through.objects.filter(post__folder_id__in=subtree_ids).exists()
+        )
+        self.assertFalse(
+            Folder.tags.through.objects.filter(folder_id__in=subtree_ids).exists()
+        )
+        self.assertFalse(
+            FolderPermission.objects.filter(folder_id__in=subtree_ids).exists()
+        )
+        self.assertTrue(Post.objects.filter(pk=self.kept_post.pk).exists())
+        self.assertTrue(Folder.objects.filter(pk=self.kept.pk).exists())
+
+    def test_queries_do_not_grow_with_posts(self):
+        with CaptureQueriesContext(connection) as small:
+            delete_subtree(self.descendants[0])
+        for i in range(30):
+            self.user.create_post(
+                f"More {i}", "http://example.com", self.descendants[1]
+            )
+        with CaptureQueriesContext(connection) as large:
+            delete_subtree(self.descendants[1])
+        self.assertEqual(len(large), len(small))
+
+    def test_updates_tag_indexes(self):
+        tag = Tag.objects.get(name="tree")
+        self.assertEqual(len(post_tag_index.posting(tag.pk)), 18)
+        self.assertEqual(len(folder_tag_index.posting(tag.pk)), 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_subtree(self.folder)
+        self.assertEqual(len(post_tag_index.posting(tag.pk)), 0)
+        self.assertEqual(len(folder_tag_index.posting(tag.pk)), 0)
+
+    def test_updates_parent(self):
+        root = Folder.objects.get(pk=self.folder.parent_id)
+        delete_subtree(self.folder, chunk_size=2)
+        root_after = Folder.objects.get(pk=root.pk)
+        self.assertEqual(root_after.version, root.version + 1)
+        self.assertEqual(root_after.child_folder_count, root.child_folder_count - 1)
+
+    def test_marked_subtree_is_hidden(self):
+        root = Folder.objects.get(pk=self.folder.parent_id)
+        subtree_ids = [self.folder.pk] + [folder.pk for folder in self.descendants]
+        mark_deleting(self.folder)
+        root_after = Folder.objects.get(pk=root.pk)
+        self.assertEqual(root_after.version, root.version + 1)
+        self.assertEqual(root_after.child_folder_count, root.child_folder_count - 1)
+        self.assertFalse(Folder.objects.filter(pk__in=subtree_ids).exists())
+        self.assertEqual(
+            Folder.all_objects.filter(pk__in=subtree_ids, deleting=True).count(), 7
+        )
+        self.assertNotIn(
+            self.descendants[0].pk,
+            Folder.objects.accessible_to(self.other).values_list("pk", flat=True),
+        )
+
+        # Marking again, e.g. when resuming, changes nothing
+        mark_deleting(self.folder)
+        self.assertEqual(Folder.objects.get(pk=root.pk).version, root_after.version)
+
+    def test_resume_interrupted_deletions(self):
+        mark_deleting(self.folder)
+        out = StringIO()
+        call_command("resume_folder_deletions", stdout=out)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                f"Deleted folder {self.folder.pk}: 7 folder(s), 18 post(s)",
+                "Resumed 1 deletion(s)",
+            ],
+        )
+        self.assertFalse(Folder.all_objects.filter(deleting=True).exists())
+        self.assertTrue(Folder.objects.filter(pk=self.kept.pk).exists())
+
+    def test_subtree_size(self):
+        self.assertEqual(subtree_size(self.folder), 7 + 18)
+
+    def test_root_folder_is_refused(self):
+        root = Folder.objects.get(pk=self.folder.parent_id)
+        with self.assertRaises(ValidationError):
+            delete_folder(root)
+        with self.assertRaises(ValidationError):
+            delete_subtree(root)
+        self.assertFalse(Folder.all_objects.filter(deleting=True).exists())
+
+    def test_small_subtree_is_deleted_right_away(self):
+        self.assertIsNone(delete_folder(self.folder))
+        self.assertFalse(Folder.objects.filter(pk=self.folder.pk).exists())
+
+
+class DeleteFolderViewTest(TransactionTestCase):
+    # Background deletions run in another thread, which only sees committed data
+
+    def setUp(self):
+        response_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+        build_tree(self.user, self.folder, 2, 2, 1)
+
+    def test_small_delete(self):
+        response = self.client.delete(f"/api/folders/{self.folder.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Folder.objects.filter(pk=self.folder.pk).exists())
+
+    @override_settings(POSTE_SUBTREE_DELETE={"BACKGROUND_THRESHOLD": 5})
+    def test_large_delete_runs_in_background(self):
+        with self.assertLogs("PosteAPI.deletion", "INFO") as logs:
+            response = self.client.delete(f"/api/folders/{self.folder.pk}/")
+            self.assertEqual(response.status_code, 202)
+            for thread in threading.enumerate():
+                if thread.name == f"delete-folder-{self.folder.pk}":
+                    thread.join(10)
+        self.assertEqual(
+            [record.getMessage() for record in logs.records], ["Deleted folder subtree"]
+        )
+        self.assertEqual(Folder.objects.filter(creator=self.user).count(), 1)
+        self.assertFalse(Post.objects.exists())
+
+    def test_listing_is_not_served_from_cache(self):
+        before = self.client.get("/api/data/")
+        self.client.delete(f"/api/folders/{self.folder.pk}/")
+        after = self.client.get("/api/data/")
+        self.assertNotEqual(before["ETag"], after["ETag"])
+        self.assertEqual(after.json()["folders"], [])
+
+    def test_root_folder_cannot_be_deleted(self):
+        root = Folder.objects.get(creator=self.user, is_root=True)
+        response = self.client.delete(f"/api/folders/{root.pk}/")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f"/api/folders/{root.pk}/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Folder.objects.filter(creator=self.user).count(), 8)
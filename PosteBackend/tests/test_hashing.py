@@ -0,0 +1,130 @@
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    PBKDF2SHA1PasswordHasher,
+    make_password,
+)
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from PosteAPI import hashing
+from PosteAPI.hashing import (
+    HashingBusy,
+    HashingSlots,
+    check_user_password,
+    recommend_work_factor,
+)
+from PosteAPI.models import User
+
+
+class HashingSlotsTest(TestCase):
+    def setUp(self):
+        self.slots = HashingSlots(max_pending=1, wait=0)
+
+    def test_runs_in_the_calling_thread(self):
+        self.assertEqual(self.slots.run(threading.get_ident), threading.get_ident())
+
+    def test_rejects_work_when_full(self):
+        started = threading.Event()
+        thread = threading.Thread(
+            target=lambda: (started.set(), self.slots.run(time.sleep, 0.5))
+        )
+        thread.start()
+        started.wait()
+        time.sleep(0.05)
+        with self.assertRaises(HashingBusy):
+            self.slots.run(time.sleep, 0)
+        thread.join()
+        self.slots.run(time.sleep, 0)  # the slot was given back
+
+    def test_gives_the_slot_back_on_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.slots.run(divmod, 1, 0)
+        self.slots.run(time.sleep, 0)
+
+
+class CheckUserPasswordTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+
+    def test_checks_password(self):
+        self.assertTrue(check_user_password(self.user, "securepassword123"))
+        self.assertFalse(check_user_password(self.user, "wrong"))
+        self.assertFalse(check_user_password(self.user, None))
+
+    def test_rehashes_outdated_password(self):
+        self.user.password = make_password("old-hasher", hasher="pbkdf2_sha1")
+        self.user.save()
+        self.assertTrue(check_user_password(self.user, "old-hasher"))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+        self.assertTrue(self.user.check_password("old-hasher"))
+
+
+class PasswordViewsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+
+    def login(self, password):
+        return self.client.post(
+            "/api/login/",
+            {"email": "test@example.com", "password": password},
+            format="json",
+        )
+
+    def test_login(self):
+        self.assertEqual(self.login("securepassword123").status_code, 200)
+        self.assertEqual(self.login("wrong").status_code, 401)
+
+    def test_login_when_busy(self):
+        with mock.patch.object(hashing.hashing_slots, "run", side_effect=HashingBusy):
+            response = self.login("securepassword123")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_change_password(self):
+        token = self.login("securepassword123").data["result"]["token"]
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        response = self.client.post(
+            "/api/users/changepassword/",
+            {"oldPassword": "securepassword123", "newPassword": "newpassword456"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("newpassword456"))
+
+
+class BenchmarkHashersTest(TestCase):
+    def test_recommend_work_factor(self):
+        self.assertEqual(
+            recommend_work_factor(PBKDF2PasswordHasher(), 0.5, 0.25),
+            ("iterations", 600000, 300000),
+        )
+        bcrypt = mock.Mock(algorithm="bcrypt_sha256", rounds=12)
+        self.assertEqual(recommend_work_factor(bcrypt, 0.1, 0.4), ("rounds", 12, 14))
+        self.assertIsNone(recommend_work_factor(mock.Mock(algorithm="md5"), 0.1, 1))
+
+    def test_command(self):
+        out = StringIO()
+        with self.settings(
+            PASSWORD_HASHERS=[
+                "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+                "django.contrib.auth.hashers.MD5PasswordHasher",
+            ]
+        ):
+            call_command("benchmark_hashers", "--samples", "1", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn(f"{PBKDF2SHA1PasswordHasher.__name__} (default)", lines[0])
+        self.assertIn("use iterations=", lines[0])
+        self.assertTrue(lines[1].startswith("MD5PasswordHasher: "))
@@ -0,0 +1,116 @@
+import io
+import json
+import logging
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from PosteAPI.log import (
+    BackgroundHandler,
+    JSONFormatter,
+    SamplingFilter,
+    current_request_id,
+    parse_logger_values,
+)
+from PosteAPI.models import User
+
+
+class BackgroundHandlerTest(SimpleTestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = BackgroundHandler(self.stream)
+        self.handler.setFormatter(JSONFormatter())
+        self.logger = logging.getLogger("PosteAPI.tests.log")
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(self.handler.close)
+
+    def entries(self):
+        self.handler.drain()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_writes_json_with_request_id_and_extra_fields(self):
+        token = current_request_id.set("abc123")
+        try:
+            self.logger.info("Listed %s", "folder", extra={"folder_id": 5})
+        finally:
+            current_request_id.reset(token)
+        [entry] = self.entries()
+        self.assertEqual(entry["message"], "Listed folder")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "PosteAPI.tests.log")
+        self.assertEqual(entry["request_id"], "abc123")
+        self.assertEqual(entry["folder_id"], 5)
+
+    def test_exceptions(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("Failed")
+        [entry] = self.entries()
+        self.assertIn("ValueError: boom", entry["exception"])
+
+    def test_drops_instead_of_blocking_when_full(self):
+        handler = BackgroundHandler(io.StringIO(), max_queue_size=1)
+        handler.listener.stop()  # nothing drains the queue
+        handler.stopped = True
+        record = logging.makeLogRecord({"msg": "message"})
+        for _ in range(3):
+            handler.emit(record)
+        self.assertEqual(handler.dropped, 2)
+
+
+class SamplingFilterTest(SimpleTestCase):
+    def test_rates(self):
+        sampling = SamplingFilter({"PosteAPI.views": 0, "PosteAPI": 1})
+        debug = logging.makeLogRecord({"name": "PosteAPI.views.x", "levelno": 10})
+        warning = logging.makeLogRecord({"name": "PosteAPI.views", "levelno": 30})
+        other = logging.makeLogRecord({"name": "PosteAPI.search", "levelno": 10})
+        self.assertFalse(sampling.filter(debug))
+        self.assertTrue(sampling.filter(warning))
+        self.assertTrue(sampling.filter(other))
+
+    def test_parse_logger_values(self):
+        self.assertEqual(
+            parse_logger_values("PosteAPI.views=0.1, PosteAPI=1", float),
+            {"PosteAPI.views": 0.1, "PosteAPI": 1.0},
+        )
+        self.assertEqual(parse_logger_values("", float), {})
+
+
+class RequestIdMiddlewareTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+    def test_request_ids(self):
+        response = self.client.get("/api/data/", HTTP_X_REQUEST_ID="from-nginx.1")
+        self.assertEqual(response["X-Request-ID"], "from-nginx.1")
+        response = self.client.get("/api/data/", HTTP_X_REQUEST_ID="bad id\n")
+        self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+    def test_views_log_with_request_id(self):
+        stream = io.StringIO()
+        handler = BackgroundHandler(stream)
+        handler.setFormatter(JSONFormatter())
+        logger = logging.getLogger("PosteAPI.views")
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.DEBUG)
+        # Keep the record away from the "PosteAPI" handler, which writes to stdout
+        self.addCleanup(setattr, logger, "propagate", logger.propagate)
+        logger.propagate = False
+        self.client.get("/api/data/", HTTP_X_REQUEST_ID="req-1")
+        handler.drain()
+        entry = json.loads(stream.getvalue().splitlines()[0])
+        self.assertEqual(entry["request_id"], "req-1")
+        self.assertEqual(entry["message"], "Listing folder")
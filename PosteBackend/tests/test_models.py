@@ -1,4 +1,7 @@
+from io import StringIO
+
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import transaction
 from django.db.utils import IntegrityError
 from django.test import TestCase
@@ -11,6 +14,7 @@ from PosteAPI.models import (
     Tag,
     User,
 )
+from PosteAPI.tags import resolve_tags
 
 
 class UserModelTest(TestCase):
@@ -221,6 +225,252 @@ class FolderNestedTests(TestCase):
         self.assertRaises(ValidationError, root.delete)
 
 
+class FolderPathTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.root = Folder.objects.get(creator=self.user, is_root=True)
+        self.folder1 = self.user.create_folder("Folder 1")
+        self.folder2 = Folder.objects.create(
+            title="Folder 2", creator=self.user, parent=self.folder1
+        )
+        self.folder3 = Folder.objects.create(
+            title="Folder 3", creator=self.user, parent=self.folder2
+        )
+
+    def test_paths_list_ancestors(self):
+        self.assertEqual(self.root.path, "/")
+        self.assertEqual(self.folder1.path, f"/{self.root.id}/")
+        self.assertEqual(
+            self.folder3.path, f"/{self.root.id}/{self.folder1.id}/{self.folder2.id}/"
+        )
+
+    def test_ancestor_lookups_do_not_query(self):
+        folder3 = Folder.objects.get(pk=self.folder3.pk)
+        folder1 = Folder.objects.get(pk=self.folder1.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                folder3.get_ancestor_ids(),
+                [self.folder3.id, self.folder2.id, self.folder1.id, self.root.id],
+            )
+            with self.assertRaises(ValidationError):
+                folder1.set_parent(folder3)
+
+    def test_stale_instance_keeps_moved_path(self):
+        stale = Folder.objects.get(pk=self.folder3.pk)
+        other = self.user.create_folder("Other")
+        self.folder1.place_in_folder(other)
+        self.folder1.save()
+
+        stale.title = "Renamed"
+        stale.save()
+        moved_path = f"/{self.root.id}/{other.id}/{self.folder1.id}/{self.folder2.id}/"
+        self.assertEqual(Folder.objects.get(pk=stale.pk).path, moved_path)
+
+        # Moving a stale instance rebases the descendants from their stored paths
+        stale_parent = Folder.objects.get(pk=self.folder2.pk)
+        self.folder1.place_in_folder(self.root)
+        self.folder1.save()
+        child = Folder.objects.create(
+            title="Child",
+            creator=self.user,
+            parent=Folder.objects.get(pk=self.folder3.pk),
+        )
+        stale_parent.place_in_folder(other)
+        stale_parent.save()
+        self.assertEqual(
+            Folder.objects.get(pk=child.pk).path,
+            f"/{self.root.id}/{other.id}/{self.folder2.id}/{self.folder3.id}/",
+        )
+
+    def test_move_is_checked_against_stored_paths(self):
+        # Two moves that each look fine on instances loaded before the other
+        other = self.user.create_folder("Other")
+        stale_other = Folder.objects.get(pk=other.pk)
+        stale_folder3 = Folder.objects.get(pk=self.folder3.pk)
+        self.folder1.place_in_folder(other)
+        self.folder1.save()
+
+        stale_other.place_in_folder(stale_folder3)
+        with self.assertRaises(ValidationError):
+            stale_other.save()
+        self.assertEqual(Folder.objects.get(pk=other.pk).parent, self.root)
+
+    def test_path_length_is_limited(self):
+        padding = "1/" * ((1000 - len(self.folder3.path)) // 2)
+        Folder.objects.filter(pk=self.folder3.pk).update(
+            path=self.folder3.path + padding
+        )
+        self.folder3.refresh_from_db()
+        with self.assertRaises(ValidationError):
+            Folder.objects.create(title="Deep", creator=self.user, parent=self.folder3)
+
+        # Moving folder 2 one level down would push folder 3 past the limit
+        deeper = Folder.objects.create(
+            title="Deeper", creator=self.user, parent=self.user.create_folder("Other")
+        )
+        self.folder2.place_in_folder(deeper)
+        with self.assertRaises(ValidationError):
+            self.folder2.save()
+
+    def test_get_descendants(self):
+        self.assertEqual(
+            set(self.folder1.get_descendants()), {self.folder2, self.folder3}
+        )
+        self.assertEqual(
+            set(self.folder1.get_descendants(include_self=True)),
+            {self.folder1, self.folder2, self.folder3},
+        )
+        self.assertFalse(self.folder3.get_descendants().exists())
+
+    def test_moving_folder_rewrites_descendant_paths(self):
+        folder4 = self.user.create_folder("Folder 4")
+        self.folder2.place_in_folder(folder4)
+        self.folder2.save()
+        self.folder3.refresh_from_db()
+        self.assertEqual(
+            self.folder3.path, f"/{self.root.id}/{folder4.id}/{self.folder2.id}/"
+        )
+        self.assertEqual(set(folder4.get_descendants()), {self.folder2, self.folder3})
+        self.assertFalse(self.folder1.get_descendants().exists())
+
+
+class FolderCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.root = Folder.objects.get(creator=self.user, is_root=True)
+        self.folder1 = self.user.create_folder("Folder 1")
+        self.folder2 = self.user.create_folder("Folder 2")
+
+    def assertCounts(self, folder, posts, children):
+        folder = Folder.objects.get(pk=folder.pk)
+        self.assertEqual(
+            (folder.post_count, folder.child_folder_count), (posts, children)
+        )
+
+    def test_post_create_move_delete(self):
+        post = self.user.create_post("Post", "http://example.com", self.folder1)
+        self.user.create_post("Other", "http://example.com", self.folder1)
+        self.assertCounts(self.folder1, 2, 0)
+
+        post = Post.objects.get(pk=post.pk)
+        post.folder = self.folder2
+        post.save()
+        self.assertCounts(self.folder1, 1, 0)
+        self.assertCounts(self.folder2, 1, 0)
+
+        post.title = "Renamed"
+        post.save()
+        self.assertCounts(self.folder2, 1, 0)
+        post.delete()
+        self.assertCounts(self.folder2, 0, 0)
+
+    def test_stale_post_moves(self):
+        post = self.user.create_post("Post", "http://example.com", self.folder1)
+        stale = Post.objects.get(pk=post.pk)
+        post.folder = self.folder2
+        post.save()
+        # The stale instance still thinks the post is in folder 1
+        stale.folder = self.root
+        stale.save()
+        self.assertCounts(self.folder1, 0, 0)
+        self.assertCounts(self.folder2, 0, 0)
+        self.assertCounts(self.root, 1, 2)
+
+    def test_folder_create_move_delete(self):
+        self.assertCounts(self.root, 0, 2)
+        child = Folder.objects.create(
+            title="Child", creator=self.user, parent=self.folder1
+        )
+        self.assertCounts(self.folder1, 0, 1)
+
+        child.place_in_folder(self.folder2)
+        child.save()
+        self.assertCounts(self.folder1, 0, 0)
+        self.assertCounts(self.folder2, 0, 1)
+
+        self.folder2.title = "Renamed"
+        self.folder2.save()
+        self.assertCounts(self.root, 0, 2)
+
+        # Deleting a folder deletes its posts and children along with it
+        self.user.create_post("Post", "http://example.com", child)
+        self.folder2.delete()
+        self.assertCounts(self.root, 0, 1)
+
+    def test_save_does_not_write_back_counts(self):
+        stale = Folder.objects.get(pk=self.folder1.pk)
+        self.user.create_post("Post", "http://example.com", self.folder1)
+        stale.title = "Renamed"
+        stale.save()
+        self.assertCounts(self.folder1, 1, 0)
+
+    def test_recount(self):
+        self.user.create_post("Post", "http://example.com", self.folder1)
+        Folder.objects.update(post_count=7, child_folder_count=0)
+        self.assertEqual(
+            set(Folder.objects.with_wrong_counts()),
+            {self.root, self.folder1, self.folder2},
+        )
+
+        out = StringIO()
+        call_command("recount_folders", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Fixed wrong counts on 3 folder(s)")
+        self.assertFalse(Folder.objects.with_wrong_counts().exists())
+        self.assertCounts(self.folder1, 1, 0)
+        self.assertCounts(self.root, 0, 2)
+
+
+class FolderAccessibleToTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.owned = self.user.create_folder("Owned")
+        self.viewed = self.other.create_folder("Viewed")
+        self.edited = self.other.create_folder("Edited")
+        self.private = self.other.create_folder("Private")
+        self.other.share_folder_with_user(
+            self.viewed, self.user, FolderPermissionEnum.VIEWER
+        )
+        self.other.share_folder_with_user(
+            self.edited, self.user, FolderPermissionEnum.EDITOR
+        )
+        self.root = Folder.objects.get(creator=self.user, is_root=True)
+
+    def test_owned_and_shared(self):
+        self.assertEqual(
+            set(Folder.objects.accessible_to(self.user)),
+            {self.root, self.owned, self.viewed, self.edited},
+        )
+
+    def test_min_permission(self):
+        self.assertEqual(
+            set(Folder.objects.accessible_to(self.user, FolderPermissionEnum.EDITOR)),
+            {self.root, self.owned, self.edited},
+        )
+        self.assertEqual(
+            set(
+                Folder.objects.accessible_to(
+                    self.user, FolderPermissionEnum.EDITOR, include_owned=False
+                )
+            ),
+            # create_folder gives the creator full access
+            {self.owned, self.edited},
+        )
+
+    def test_single_query_and_composable(self):
+        folders = Folder.objects.accessible_to(self.user).filter(title__startswith="V")
+        with self.assertNumQueries(1):
+            self.assertEqual(list(folders), [self.viewed])
+
+
 class TagModelTest(TestCase):
     def setUp(self) -> None:
         self.user = User.objects.create_user(
@@ -336,3 +586,21 @@ class TagModelTest(TestCase):
         Tag.objects.create(name="unique-tag")
         with self.assertRaises(IntegrityError):
             Tag.objects.create(name="unique!tag")
+
+
+class TagResolutionTest(TestCase):
+    def test_normalizes_and_keeps_input_order(self):
+        Tag.objects.create(name="existing")
+        tags = resolve_tags(["New Tag", "EXISTING", "new-tag", "!!!", "other"])
+        self.assertEqual([tag.name for tag in tags], ["newtag", "existing", "other"])
+        self.assertTrue(all(tag.pk for tag in tags))
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_constant_queries(self):
+        Tag.objects.create(name="existing")
+        with self.assertNumQueries(1):
+            resolve_tags(["existing"])
+        with self.assertNumQueries(3):
+            resolve_tags(["existing"] + [f"new{i}" for i in range(20)])
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_tags([" ", "?"]), [])
@@ -0,0 +1,185 @@
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from PosteAPI.authentication import token_cache
+from PosteAPI.models import Folder, FolderPermissionEnum, Post, User
+from PosteAPI.permissions import PermissionResolver
+
+
+class PermissionResolverTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", username="owner", password="securepassword123"
+        )
+        self.users = {}
+        self.folders = {}
+        self.posts = []
+        for permission in FolderPermissionEnum:
+            user = User.objects.create_user(
+                email=f"{permission}@example.com",
+                username=permission,
+                password="securepassword123",
+            )
+            folder = self.owner.create_folder(f"Shared as {permission}")
+            self.owner.share_folder_with_user(folder, user, permission)
+            self.users[permission] = user
+            self.folders[permission] = folder
+            self.posts.append(
+                self.owner.create_post("Post", "http://example.com", folder)
+            )
+        self.folders["root"] = Folder.objects.get(creator=self.owner, is_root=True)
+        self.posts.append(
+            self.owner.create_post("Post", "http://example.com", self.folders["root"])
+        )
+
+    def assert_matches_user_methods(self, user, resolver):
+        for folder in self.folders.values():
+            self.assertEqual(
+                resolver.can_view_folder(folder), user.can_view_folder(folder)
+            )
+            self.assertEqual(
+                resolver.can_edit_folder(folder), user.can_edit_folder(folder)
+            )
+            self.assertEqual(
+                resolver.has_permissions_to_share_folder(folder),
+                user.has_permissions_to_share_folder(folder),
+            )
+        for post in Post.objects.all():
+            self.assertEqual(resolver.can_view_post(post), user.can_view_post(post))
+            self.assertEqual(resolver.can_edit_post(post), user.can_edit_post(post))
+            self.assertEqual(
+                resolver.has_permissions_to_share_post(post),
+                user.has_permissions_to_share_post(post),
+            )
+
+    def test_same_answers_as_user_methods(self):
+        for user in [self.owner, *self.users.values()]:
+            self.assert_matches_user_methods(user, PermissionResolver(user))
+            self.assert_matches_user_methods(user, PermissionResolver(user).load_all())
+
+    def test_load_all_answers_from_memory(self):
+        resolver = PermissionResolver(self.users[FolderPermissionEnum.EDITOR])
+        with self.assertNumQueries(1):
+            resolver.load_all()
+        with self.assertNumQueries(0):
+            for folder in self.folders.values():
+                resolver.can_view_folder(folder)
+                resolver.can_edit_folder(folder)
+                resolver.has_permissions_to_share_folder(folder)
+
+    def test_batch_of_posts_costs_constant_queries(self):
+        resolver = PermissionResolver(self.users[FolderPermissionEnum.VIEWER])
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(2):
+            resolver.load_posts(posts)
+        with self.assertNumQueries(0):
+            visible = [post for post in posts if resolver.can_view_post(post)]
+            editable = [post for post in posts if resolver.can_edit_post(post)]
+        self.assertEqual(len(visible), 1)
+        self.assertEqual(editable, [])
+
+    def test_for_request_is_cached(self):
+        class FakeRequest:
+            user = self.owner
+
+        request = FakeRequest()
+        resolver = PermissionResolver.for_request(request)
+        self.assertIs(PermissionResolver.for_request(request), resolver)
+
+
+class EndpointPermissionTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", username="owner", password="securepassword123"
+        )
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.owner.create_folder("Folder")
+        self.post = self.owner.create_post("Post", "http://example.com", self.folder)
+        self.own_folder = self.user.create_folder("Own")
+
+    def share(self, permission):
+        self.owner.share_folder_with_user(self.folder, self.user, permission)
+
+    def test_folder_detail(self):
+        url = f"/api/data/folder/{self.folder.pk}/"
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.patch(url, {"title": "Renamed"})
+        self.assertEqual(response.status_code, 403)
+
+        self.share(FolderPermissionEnum.VIEWER)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.patch(url, {"title": "Renamed"})
+        self.assertEqual(response.status_code, 403)
+
+    def test_edit_and_delete_post(self):
+        url = f"/api/posts/{self.post.pk}/"
+        edit = {
+            "title": "Renamed",
+            "description": "",
+            "url": "http://example.com",
+            "tags": "",
+        }
+        self.share(FolderPermissionEnum.VIEWER)
+        self.assertEqual(self.client.patch(url, edit, format="json").status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.assertTrue(Post.objects.filter(pk=self.post.pk).exists())
+
+        self.owner.unshare_folder_with_user(self.folder, self.user)
+        self.share(FolderPermissionEnum.EDITOR)
+        self.assertEqual(self.client.patch(url, edit, format="json").status_code, 200)
+        self.assertEqual(self.client.delete(url).status_code, 200)
+
+    def test_create_post(self):
+        post = {
+            "title": "New",
+            "description": "New post",
+            "url": "http://example.com",
+            "folder_id": self.folder.pk,
+        }
+        self.share(FolderPermissionEnum.VIEWER)
+        self.assertEqual(self.client.post("/api/posts/", post).status_code, 403)
+        self.assertFalse(Post.objects.filter(title="New").exists())
+
+        self.owner.unshare_folder_with_user(self.folder, self.user)
+        self.share(FolderPermissionEnum.EDITOR)
+        self.assertEqual(self.client.post("/api/posts/", post).status_code, 201)
+        self.assertTrue(Post.objects.filter(title="New", folder=self.folder).exists())
+
+    def test_bulk_create_posts(self):
+        posts = {
+            "posts": [
+                {"title": "New", "url": "http://example.com", "folder_id": pk}
+                for pk in (self.own_folder.pk, self.folder.pk)
+            ]
+        }
+        self.share(FolderPermissionEnum.VIEWER)
+        response = self.client.post("/api/posts/bulk/", posts, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.filter(title="New").exists())
+
+        self.owner.unshare_folder_with_user(self.folder, self.user)
+        self.share(FolderPermissionEnum.EDITOR)
+        response = self.client.post("/api/posts/bulk/", posts, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_move_post(self):
+        url = f"/api/posts/addToFolder/{self.own_folder.pk}&{self.post.pk}/"
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).folder, self.folder)
+
+        self.share(FolderPermissionEnum.EDITOR)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).folder, self.own_folder)
+
+    def test_delete_folder(self):
+        url = f"/api/folders/{self.folder.pk}/"
+        self.share(FolderPermissionEnum.VIEWER)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.assertTrue(Folder.objects.filter(pk=self.folder.pk).exists())
@@ -0,0 +1,183 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from PosteAPI.db import pool as pool_module
+from PosteAPI.db.pool import ConnectionPool, PoolTimeout, pool_stats
+from PosteAPI.db.postgresql.base import DatabaseWrapper
+
+# Stand-in for the cost of opening a Postgres connection (TCP, TLS, authentication)
+HANDSHAKE = 0.01
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = f"{directory.name}/db.sqlite3"
+
+    def connect(self):
+        time.sleep(HANDSHAKE)
+        return sqlite3.connect(self.database, check_same_thread=False)
+
+    def check(self, connection):
+        connection.execute("SELECT 1")
+
+    def make_pool(self, **kwargs):
+        pool = ConnectionPool(self.connect, check=self.check, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def request(self, pool):
+        connection = pool.getconn()
+        connection.execute("SELECT 1").fetchone()
+        pool.putconn(connection)
+
+    def test_reuses_connections(self):
+        pool = self.make_pool()
+        for _ in range(5):
+            self.request(pool)
+        stats = pool.stats()
+        self.assertEqual(stats["opened"], 1)
+        self.assertEqual(stats["reused"], 4)
+        self.assertEqual(stats["checkouts"], 5)
+        self.assertEqual((stats["idle"], stats["in_use"]), (1, 0))
+
+    def test_lower_latency_than_connecting(self):
+        requests = 20
+        started = time.perf_counter()
+        for _ in range(requests):
+            connection = self.connect()
+            connection.execute("SELECT 1").fetchone()
+            connection.close()
+        unpooled = time.perf_counter() - started
+
+        pool = self.make_pool()
+        started = time.perf_counter()
+        for _ in range(requests):
+            self.request(pool)
+        pooled = time.perf_counter() - started
+        self.assertLess(pooled, unpooled / 5)
+
+    def test_bounded(self):
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        held = [pool.getconn(), pool.getconn()]
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+        # A connection given back wakes up a waiting thread
+        threading.Timer(0.01, pool.putconn, [held.pop()]).start()
+        pool.timeout = 5
+        self.assertIsNotNone(pool.getconn())
+        self.assertEqual(pool.stats()["size"], 2)
+
+    def test_checks_idle_connections(self):
+        pool = self.make_pool(check_after=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.close()  # e.g. the server dropped it meanwhile
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, connection)
+        replacement.execute("SELECT 1")
+        self.assertEqual(pool.stats()["check_failures"], 1)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_lifetimes(self):
+        pool = self.make_pool(max_idle=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIsNot(pool.getconn(), first)
+
+        pool = self.make_pool(max_lifetime=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertEqual(pool.stats()["idle"], 0)
+        self.assertEqual(pool.stats()["closed"], 1)
+
+    def test_discards_connections_that_cannot_be_reset(self):
+        pool = self.make_pool()
+        pool.reset = lambda connection: False
+        pool.putconn(pool.getconn())
+        self.assertEqual(pool.stats()["size"], 0)
+
+
+class PooledPostgresBackendTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(pool_module._pools, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connections = []
+
+        def connect(wrapper, conn_params):
+            connection = mock.MagicMock(closed=0, autocommit=False)
+            connection.info.transaction_status = 0  # idle
+            self.connections.append(connection)
+            return connection
+
+        patcher = mock.patch(
+            "django.db.backends.postgresql.base.DatabaseWrapper.get_new_connection",
+            connect,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wrapper(self, name="poste"):
+        return DatabaseWrapper(
+            {
+                "ENGINE": "PosteAPI.db.postgresql",
+                "NAME": name,
+                "USER": "",
+                "PASSWORD": "",
+                "HOST": "",
+                "PORT": "",
+                "OPTIONS": {},
+                "TIME_ZONE": None,
+                "CONN_MAX_AGE": 0,
+                "CONN_HEALTH_CHECKS": False,
+                "AUTOCOMMIT": True,
+                "POOL": {"MAX_SIZE": 2},
+            },
+            alias="pooled",
+        )
+
+    def test_closing_gives_connection_back(self):
+        first = self.wrapper()
+        connection = first.get_new_connection({})
+        first.connection = connection
+        first.close()
+        self.assertIsNone(first.connection)
+        connection.close.assert_not_called()
+
+        second = self.wrapper()
+        self.assertIs(second.get_new_connection({}), connection)
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(pool_stats()["pooled"]["reused"], 1)
+
+    def test_rolls_back_open_transactions(self):
+        wrapper = self.wrapper()
+        connection = wrapper.get_new_connection({})
+        connection.info.transaction_status = 2  # in a transaction
+        wrapper.connection = connection
+        wrapper.close()
+        connection.rollback.assert_called_once()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with("DISCARD ALL")
+        self.assertFalse(connection.autocommit)
+        self.assertEqual(pool_stats()["pooled"]["idle"], 1)
+
+    def test_settings_change_replaces_pool(self):
+        first = self.wrapper()
+        connection = first.get_new_connection({})
+        first.connection = connection
+        first.close()
+
+        # e.g. the test runner switching to the test database
+        other = self.wrapper(name="test_poste")
+        self.assertIsNot(other.get_new_connection({}), connection)
+        connection.close.assert_called_once()
+        self.assertEqual(len(self.connections), 2)
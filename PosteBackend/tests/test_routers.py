@@ -0,0 +1,134 @@
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from PosteAPI.checks import check_replica_pin_cache
+from PosteAPI.models import Folder
+from PosteAPI.routers import ReplicaMiddleware, ReplicaRouter, primary_only, use_primary
+
+router = ReplicaRouter()
+
+
+@override_settings(POSTE_REPLICAS={"DATABASES": ["replica"], "PIN_SECONDS": 60})
+class ReplicaRoutingTest(TransactionTestCase):
+    # TestCase runs every test inside a transaction, which always reads the primary
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, method, write=False, **headers):
+        """
+        Returns the database a read goes to while handling a request, and the one
+        it goes to after the view wrote if `write` is true.
+        """
+        used = []
+
+        def view(request):
+            used.append(router.db_for_read(Folder))
+            if write:
+                router.db_for_write(Folder)
+                used.append(router.db_for_read(Folder))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)("/api/data/", **headers)
+        ReplicaMiddleware(view)(request)
+        return used
+
+    async def test_async_requests(self):
+        used = []
+
+        async def view(request):
+            used.append(router.db_for_read(Folder))
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(self.factory.get("/api/data/"))
+        await middleware(self.factory.post("/api/data/"))
+        await middleware(self.factory.get("/api/data/"))
+        self.assertEqual(used, ["replica", DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+
+    def test_primary_only_views(self):
+        used = []
+
+        @primary_only
+        def view(request):
+            used.append(router.db_for_read(Folder))
+            router.db_for_write(Folder)
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(self.factory.get("/api/data/"))
+        self.assertEqual(used, [DEFAULT_DB_ALIAS])
+        # It wrote, so the client is pinned
+        self.assertEqual(self.route("get"), [DEFAULT_DB_ALIAS])
+
+    def test_safe_requests_read_from_replicas(self):
+        self.assertEqual(self.route("get"), ["replica"])
+        self.assertEqual(self.route("head"), ["replica"])
+
+    def test_unsafe_requests_use_primary(self):
+        self.assertEqual(self.route("post"), [DEFAULT_DB_ALIAS])
+
+    def test_read_your_writes(self):
+        client = {"HTTP_AUTHORIZATION": "Token abc"}
+        self.route("post", **client)
+        self.assertEqual(self.route("get", **client), [DEFAULT_DB_ALIAS])
+        # Other clients are not affected
+        self.assertEqual(
+            self.route("get", HTTP_AUTHORIZATION="Token xyz", REMOTE_ADDR="10.0.0.2"),
+            ["replica"],
+        )
+
+    def test_login_pins_address(self):
+        self.route("post")
+        self.assertEqual(
+            self.route("get", HTTP_AUTHORIZATION="Token new"), [DEFAULT_DB_ALIAS]
+        )
+
+    def test_clients_behind_proxy(self):
+        self.route("post", HTTP_X_FORWARDED_FOR="10.0.0.1, 10.0.0.2")
+        self.assertEqual(
+            self.route("get", HTTP_X_FORWARDED_FOR="10.0.0.2"), [DEFAULT_DB_ALIAS]
+        )
+        self.assertEqual(
+            self.route("get", HTTP_X_FORWARDED_FOR="10.0.0.3"), ["replica"]
+        )
+
+    def test_safe_request_writing(self):
+        client = {"HTTP_AUTHORIZATION": "Token abc"}
+        self.assertEqual(
+            self.route("get", write=True, **client), ["replica", DEFAULT_DB_ALIAS]
+        )
+        self.assertEqual(self.route("get", **client), [DEFAULT_DB_ALIAS])
+
+    def test_transactions_and_use_primary(self):
+        def view(request):
+            with transaction.atomic():
+                in_transaction = router.db_for_read(Folder)
+            with use_primary():
+                primary = router.db_for_read(Folder)
+            return HttpResponse(f"{in_transaction} {primary}")
+
+        response = ReplicaMiddleware(view)(self.factory.get("/api/data/"))
+        self.assertEqual(response.content, b"default default")
+
+    def test_outside_requests(self):
+        self.assertEqual(router.db_for_read(Folder), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate("replica", "PosteAPI"))
+        self.assertTrue(router.allow_migrate(DEFAULT_DB_ALIAS, "PosteAPI"))
+
+    @override_settings(POSTE_REPLICAS={"DATABASES": []})
+    def test_no_replicas(self):
+        self.assertEqual(self.route("get"), [DEFAULT_DB_ALIAS])
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_requires_a_shared_pin_cache(self):
+        errors = check_replica_pin_cache(None)
+        self.assertEqual([error.id for error in errors], ["PosteAPI.E002"])
+        with override_settings(POSTE_REPLICAS={"DATABASES": []}):
+            self.assertEqual(check_replica_pin_cache(None), [])
@@ -0,0 +1,236 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from PosteAPI.authentication import token_cache
+from PosteAPI.deletion import delete_subtree
+from PosteAPI.models import Folder, FolderPermissionEnum, Post, Tag, Tombstone, User
+from PosteAPI.sync import Cursor
+
+
+@override_settings(POSTE_SYNC={"SETTLE_SECONDS": 0})
+class SyncViewTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+        self.post = self.user.create_post("Post", "http://example.com", self.folder)
+        self.shared = self.other.create_folder("Shared")
+        self.shared_post = self.other.create_post(
+            "Shared post", "http://example.com", self.shared
+        )
+        self.other.share_folder_with_user(
+            self.shared, self.user, FolderPermissionEnum.VIEWER
+        )
+        self.cursor = self.sync().data["cursor"]
+
+    def sync(self, cursor=None):
+        params = {"since": cursor} if cursor else {}
+        return self.client.get("/api/sync/", params)
+
+    def changes(self):
+        response = self.sync(self.cursor)
+        self.assertEqual(response.status_code, 200)
+        self.cursor = response.data["cursor"]
+        return response.data
+
+    def test_first_sync_returns_everything_visible(self):
+        data = self.sync().data
+        root = Folder.objects.get(creator=self.user, is_root=True)
+        self.assertEqual(
+            {f["id"] for f in data["folders"]},
+            {root.pk, self.folder.pk, self.shared.pk},
+        )
+        self.assertEqual(
+            {p["id"] for p in data["posts"]}, {self.post.pk, self.shared_post.pk}
+        )
+        self.assertEqual(data["deleted"], {"folders": [], "posts": []})
+        self.assertFalse(data["has_more"])
+
+    def test_nothing_changed(self):
+        data = self.changes()
+        self.assertEqual(
+            data,
+            {
+                "folders": [],
+                "posts": [],
+                "deleted": {"folders": [], "posts": []},
+                "cursor": self.cursor,
+                "has_more": False,
+            },
+        )
+
+    def test_updated_posts_and_folders(self):
+        self.post.title = "Renamed"
+        self.post.save()
+        data = self.changes()
+        self.assertEqual([p["title"] for p in data["posts"]], ["Renamed"])
+        # So did the listing of its folder
+        self.assertIn(self.folder.pk, [f["id"] for f in data["folders"]])
+
+        self.shared_post.tags.add(Tag.objects.create(name="tag"))
+        data = self.changes()
+        self.assertEqual([p["tags"] for p in data["posts"]], [["tag"]])
+
+        tag = Tag.objects.get()
+        tag.name = "renamed"
+        tag.save()
+        data = self.changes()
+        self.assertEqual([p["tags"] for p in data["posts"]], [["renamed"]])
+
+    def test_deleted_posts_and_folders(self):
+        post_id = self.post.pk
+        self.post.delete()
+        data = self.changes()
+        self.assertEqual(data["deleted"], {"folders": [], "posts": [post_id]})
+
+        self.other.unshare_folder_with_user(self.shared, self.user)
+        self.assertEqual(
+            self.changes()["deleted"], {"folders": [self.shared.pk], "posts": []}
+        )
+
+        child = Folder.objects.create(
+            title="Child", creator=self.user, parent=self.folder
+        )
+        self.changes()
+        delete_subtree(self.folder)
+        data = self.changes()
+        self.assertEqual(
+            sorted(data["deleted"]["folders"]), sorted([self.folder.pk, child.pk])
+        )
+
+    def test_shared_folder_deleted_by_owner(self):
+        folder_id = self.shared.pk
+        self.shared.delete()
+        self.assertIn(folder_id, self.changes()["deleted"]["folders"])
+
+    def test_newly_shared_folder(self):
+        folder = self.other.create_folder("Later")
+        post = self.other.create_post("Later post", "http://example.com", folder)
+        self.changes()
+        self.other.share_folder_with_user(
+            folder, self.user, FolderPermissionEnum.VIEWER
+        )
+        data = self.changes()
+        self.assertEqual([f["id"] for f in data["folders"]], [folder.pk])
+        self.assertEqual([p["id"] for p in data["posts"]], [post.pk])
+        self.assertEqual(self.changes()["posts"], [])
+
+        # The post itself did not change, so it is not sent again to anyone else
+        self.assertEqual(Post.objects.get(pk=post.pk).updated_at, post.updated_at)
+
+    def test_cascades_record_removals_in_bulk(self):
+        def delete_subtree_of(posts):
+            folder = self.other.create_folder("Many")
+            self.other.share_folder_with_user(
+                folder, self.user, FolderPermissionEnum.VIEWER
+            )
+            child = Folder.objects.create(
+                title="Child", creator=self.other, parent=folder
+            )
+            for i in range(posts):
+                self.other.create_post(f"Post {i}", "http://example.com", child)
+            with CaptureQueriesContext(connection) as queries:
+                Folder.objects.get(pk=folder.pk).delete()
+            # Only the shared folder was visible to the user
+            self.assertEqual(self.changes()["deleted"]["folders"], [folder.pk])
+            return [
+                query["sql"]
+                for query in queries
+                if "tombstone" in query["sql"] or "folderpermission" in query["sql"]
+            ]
+
+        self.changes()
+        self.assertEqual(len(delete_subtree_of(2)), len(delete_subtree_of(20)))
+
+    def test_deleted_user(self):
+        theirs = self.other.create_post("Theirs", "http://example.com", self.folder)
+        self.changes()
+        self.other.delete()
+        # Their shared folder takes its posts along; their post in a folder that
+        # stays goes on its own
+        self.assertEqual(
+            self.changes()["deleted"],
+            {"folders": [self.shared.pk], "posts": [theirs.pk]},
+        )
+
+    def test_post_moved_out_of_sight(self):
+        private = self.other.create_folder("Private")
+        self.shared_post.folder = private
+        self.shared_post.save()
+        self.assertEqual(self.changes()["deleted"]["posts"], [self.shared_post.pk])
+
+        # Moved between folders the user can see: updated, not deleted
+        self.post.folder = Folder.objects.get(creator=self.user, is_root=True)
+        self.post.save()
+        data = self.changes()
+        self.assertEqual([p["id"] for p in data["posts"]], [self.post.pk])
+        self.assertEqual(data["deleted"]["posts"], [])
+
+    @override_settings(POSTE_SYNC={"SETTLE_SECONDS": 0, "PAGE_SIZE": 2})
+    def test_pages(self):
+        for i in range(5):
+            self.user.create_post(f"Post {i}", "http://example.com", self.folder)
+        seen = []
+        while True:
+            data = self.changes()
+            self.assertLessEqual(len(data["folders"]) + len(data["posts"]), 2)
+            seen += [p["title"] for p in data["posts"]]
+            if not data["has_more"]:
+                break
+        self.assertEqual(seen, [f"Post {i}" for i in range(5)])
+
+    def test_query_count_does_not_depend_on_changes(self):
+        self.user.create_post("Deleted", "http://example.com", self.folder).delete()
+        self.post.save()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.changes()
+        for i in range(10):
+            self.user.create_post(f"Post {i}", "http://example.com", self.folder)
+            self.user.create_post(f"Deleted {i}", "http://example.com", self.folder)
+        self.post.save()
+        Post.objects.filter(title__startswith="Deleted").delete()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            data = self.changes()
+        self.assertEqual(len(data["posts"]), 10 + 1)
+        self.assertEqual(len(data["deleted"]["posts"]), 10)
+        self.assertEqual(len(small), len(large))
+
+    def test_invalid_cursor(self):
+        response = self.sync("yesterday")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("since", response.data["errors"])
+
+    def test_expired_cursor(self):
+        old = Cursor(timezone.now() - timedelta(days=31), -1, 0).encode()
+        self.assertEqual(self.sync(old).status_code, 410)
+
+
+class PruneTombstonesTest(TestCase):
+    def test_command(self):
+        Tombstone.objects.create(kind="post", object_id=1, user_id=1)
+        Tombstone.objects.create(kind="post", object_id=2, user_id=1)
+        Tombstone.objects.filter(object_id=1).update(
+            deleted_at=timezone.now() - timedelta(days=31)
+        )
+        out = StringIO()
+        call_command("prune_tombstones", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Deleted 1 tombstone(s)")
+        self.assertEqual(list(Tombstone.objects.values_list("object_id")), [(2,)])
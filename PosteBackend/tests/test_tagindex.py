@@ -0,0 +1,122 @@
+from array import array
+
+from django.test import TestCase, override_settings
+
+from PosteAPI.checks import check_tag_index_cache
+from PosteAPI.models import Post, Tag, User
+from PosteAPI.tagindex import (
+    TagIndex,
+    TagQueryError,
+    _intersect,
+    evaluate_tag_query,
+    parse_tag_query,
+    post_tag_index,
+)
+
+
+class TagQueryParserTest(TestCase):
+    def test_and_binds_tighter_than_or(self):
+        self.assertEqual(
+            parse_tag_query("a b OR c"),
+            ("or", [("and", [("tag", "a"), ("tag", "b")]), ("tag", "c")]),
+        )
+
+    def test_not_and_parentheses(self):
+        self.assertEqual(
+            parse_tag_query("a AND NOT (b or c)"),
+            ("and", [("tag", "a"), ("not", ("or", [("tag", "b"), ("tag", "c")]))]),
+        )
+
+    def test_names_are_normalized(self):
+        self.assertEqual(parse_tag_query("Python!"), ("tag", "python"))
+
+    def test_invalid_queries(self):
+        for query in ["", "a AND", "(a", "a)", "OR a", "NOT", "!!"]:
+            with self.assertRaises(TagQueryError, msg=query):
+                parse_tag_query(query)
+
+    def test_intersect(self):
+        self.assertEqual(
+            _intersect([array("q", [1, 3, 5, 7, 9]), array("q", [3, 4, 9, 10])]),
+            array("q", [3, 9]),
+        )
+
+
+class TagIndexTest(TestCase):
+    def setUp(self):
+        post_tag_index.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.folder = self.user.create_folder("Folder")
+        self.posts = {}
+        for title, tags in [
+            ("both", ["python", "django"]),
+            ("legacy", ["python", "django", "legacy"]),
+            ("python", ["python"]),
+            ("none", []),
+        ]:
+            post = self.user.create_post(title, "http://example.com", self.folder)
+            with self.captureOnCommitCallbacks(execute=True):
+                post.tags.set(Tag.objects.get_or_create(name=name)[0] for name in tags)
+            self.posts[title] = post
+
+    def matches(self, query):
+        ids, negated = evaluate_tag_query(query, post_tag_index)
+        if negated:
+            ids = Post.objects.exclude(pk__in=ids).values_list("pk", flat=True)
+        return {title for title, post in self.posts.items() if post.pk in ids}
+
+    def test_queries(self):
+        self.assertEqual(self.matches("python django NOT legacy"), {"both"})
+        self.assertEqual(self.matches("django OR legacy"), {"both", "legacy"})
+        self.assertEqual(self.matches("NOT python"), {"none"})
+        self.assertEqual(
+            self.matches("NOT django OR legacy"), {"legacy", "python", "none"}
+        )
+        self.assertEqual(self.matches("unknown"), set())
+
+    def test_follows_tag_changes(self):
+        self.assertEqual(self.matches("legacy"), {"legacy"})
+        legacy = Tag.objects.get(name="legacy")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts["legacy"].tags.remove(legacy)
+            legacy.posts.add(self.posts["python"])
+        self.assertEqual(self.matches("legacy"), {"python"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts["both"].tags.clear()
+            self.posts["legacy"].delete()
+        self.assertEqual(self.matches("django"), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            legacy.delete()
+        self.assertEqual(self.matches("python"), {"python"})
+
+    def test_applies_changes_from_another_process(self):
+        self.assertEqual(self.matches("legacy"), {"legacy"})
+        # Another worker's copy of the same index, publishing its changes
+        other = TagIndex("post", Post.tags.through, "post_id")
+        other.rebuild()
+        legacy = Tag.objects.get(name="legacy")
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.tags.through.objects.create(post=self.posts["none"], tag=legacy)
+            other.add_links([(self.posts["none"].pk, legacy.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.remove_objects([self.posts["legacy"].pk])
+        with self.assertNumQueries(0):
+            posting = post_tag_index.posting(legacy.pk)
+        self.assertEqual(list(posting), [self.posts["none"].pk])
+
+    def test_rebuilds_after_change_in_another_process(self):
+        self.assertEqual(self.matches("legacy"), {"legacy"})
+        # Simulate another worker: the rows change behind this process's back and
+        # only the shared generation counter moves
+        Post.tags.through.objects.filter(post=self.posts["legacy"]).delete()
+        post_tag_index._bump_shared_generation()
+        self.assertEqual(self.matches("legacy"), set())
+
+    @override_settings(
+        CACHES={"shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_requires_a_shared_cache(self):
+        errors = check_tag_index_cache(None)
+        self.assertEqual([error.id for error in errors], ["PosteAPI.E001"])
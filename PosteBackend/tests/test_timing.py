@@ -0,0 +1,80 @@
+import re
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from PosteAPI.cache import response_cache
+from PosteAPI.models import User
+from PosteAPI.timing import route_stats
+
+
+@override_settings(POSTE_TIMING={"SAMPLE_RATE": 1.0})
+class TimingMiddlewareTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        route_stats.reset()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.user.create_post(
+            "Post", "http://example.com", self.user.create_folder("A")
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+    def server_timing(self, response):
+        return dict(
+            re.match(r"(\w+);dur=([\d.]+)", part.strip()).groups()
+            for part in response["Server-Timing"].split(",")
+        )
+
+    def test_server_timing_header(self):
+        response = self.client.get("/api/data/")
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {"db", "serialize", "render", "total"})
+        self.assertGreater(float(timing["serialize"]), 0)
+        self.assertGreaterEqual(float(timing["total"]), float(timing["db"]))
+        queries = re.search(r'desc="(\d+) queries"', response["Server-Timing"])
+        self.assertGreater(int(queries.group(1)), 0)
+
+    def test_render_time(self):
+        # The clock only moves while the response is rendered, by 5 ms
+        clock = [0.0]
+        render = JSONRenderer.render
+
+        def slow_render(renderer, *args, **kwargs):
+            clock[0] += 0.005
+            return render(renderer, *args, **kwargs)
+
+        with mock.patch("PosteAPI.timing.time.perf_counter", lambda: clock[0]):
+            with mock.patch.object(JSONRenderer, "render", slow_render):
+                response = self.client.get("/api/data/")
+        timing = self.server_timing(response)
+        self.assertEqual(timing["render"], "5.000")
+        self.assertGreaterEqual(float(timing["total"]), 5)
+
+    @override_settings(POSTE_TIMING={"SAMPLE_RATE": 0})
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get("/api/data/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(route_stats.snapshot(), {})
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/data/")
+        self.client.get("/api/data/")
+        self.assertEqual(self.client.get("/api/admin/metrics/").status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        routes = self.client.get("/api/admin/metrics/").data["routes"]
+        data = routes["GET /api/data/"]
+        self.assertEqual(data["sampled_requests"], 2)
+        self.assertGreater(data["queries"]["max"], 0)
+        self.assertLessEqual(data["total_ms"]["p50"], data["total_ms"]["max"])
+
+        self.assertEqual(self.client.delete("/api/admin/metrics/").status_code, 204)
+        self.assertNotIn("GET /api/data/", route_stats.snapshot())
@@ -0,0 +1,1026 @@
+import json
+from urllib.parse import urlencode
+
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from PosteAPI.authentication import token_cache
+from PosteAPI.cache import response_cache
+from PosteAPI.models import Folder, FolderPermissionEnum, Post, Tag, User
+from PosteAPI.pagination import KeysetPagination
+from PosteAPI.tagindex import folder_tag_index, post_tag_index
+from PosteAPI.views import DEFAULT_ASYNC_QUERIES
+
+
+class DataViewQueryBudgetTest(TestCase):
+    """
+    The folder listing must cost a fixed number of queries, however many folders,
+    posts, tags and shares it returns.
+    """
+
+    # auth, root, shared folder versions (for the ETag), folders (+ tags, children,
+    # shares), posts (+ tags), shared folders (+ tags, children, shares)
+    QUERY_BUDGET = 13
+
+    def setUp(self):
+        response_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.tag = Tag.objects.create(name="tag")
+
+    def populate(self, count):
+        for i in range(count):
+            folder = self.user.create_folder(f"Folder {i}")
+            folder.tags.add(self.tag)
+            self.user.share_folder_with_user(
+                folder, self.other, FolderPermissionEnum.VIEWER
+            )
+            child = self.user.create_folder(f"Child {i}")
+            child.set_parent(folder)
+            child.save()
+            post = self.user.create_post(
+                f"Post {i}", "http://example.com", folder.parent
+            )
+            post.tags.add(self.tag)
+            shared = self.other.create_folder(f"Shared {i}")
+            self.other.share_folder_with_user(
+                shared, self.user, FolderPermissionEnum.EDITOR
+            )
+
+    def count_queries(self, url):
+        token_cache.clear()  # measure the uncached authentication path
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_root_listing_within_budget(self):
+        self.populate(2)
+        small, _ = self.count_queries("/api/data/")
+        self.populate(20)
+        large, response = self.count_queries("/api/data/")
+        self.assertLessEqual(large, self.QUERY_BUDGET)
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data["posts"]), 22)
+
+    def test_folder_listing_within_budget(self):
+        self.populate(20)
+        folder = Folder.objects.get(title="Folder 0")
+        queries, response = self.count_queries(f"/api/data/{folder.id}/")
+        self.assertLessEqual(queries, self.QUERY_BUDGET)
+        self.assertEqual(len(response.data["folders"]), 1)
+
+    def test_listing_payload(self):
+        self.populate(1)
+        _, response = self.count_queries("/api/data/")
+        folder = Folder.objects.get(title="Folder 0")
+        listed = next(f for f in response.data["folders"] if f["id"] == folder.id)
+        self.assertEqual(listed["parent_id"], folder.parent_id)
+        self.assertEqual(listed["tags"], [self.tag.id])
+        self.assertEqual(
+            listed["shares"],
+            {"test@example.com": "full_access", "other@example.com": "viewer"},
+        )
+        self.assertEqual(listed["file_count"], 0)
+        self.assertEqual(listed["folder_count"], 1)
+        post = Post.objects.get(title="Post 0")
+        self.assertEqual(response.data["posts"][0]["id"], post.id)
+        self.assertEqual(response.data["posts"][0]["tags"], ["tag"])
+        self.assertEqual(
+            {f["title"] for f in response.data["shared_folders"]},
+            {"Folder 0", "Child 0", "Shared 0"},
+        )
+
+    def test_user_folders_within_budget(self):
+        url = f"/api/folders/user/{self.user.pk}/"
+        self.populate(2)
+        small, _ = self.count_queries(url)
+        self.populate(20)
+        large, response = self.count_queries(url)
+        self.assertEqual(small, large)
+        # Its root, 22 folders and 22 children of its own, 22 folders shared with it
+        self.assertEqual(len(response.data["folders"]), 1 + 22 + 22 + 22)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+        self.posts = [
+            self.user.create_post(f"Post {i}", "http://example.com", self.folder)
+            for i in range(7)
+        ]
+
+    def test_walks_every_post_newest_first(self):
+        seen = []
+        url = "/api/posts/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 3)
+            seen.extend(post["id"] for post in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, [post.id for post in reversed(self.posts)])
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        first = self.client.get("/api/posts/?page_size=2")
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get("/api/posts/?page_size=2")
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(first.data["next"])
+        self.assertEqual(len(first_page), len(deep_page))
+
+    def test_deep_pages_seek_the_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("reads SQLite's query plan")
+        position = (self.posts[3].created_at, self.posts[3].pk)
+        page = KeysetPagination().after(
+            Post.objects.order_by(*KeysetPagination.ordering), position
+        )[:2]
+        self.assertEqual(list(page), [self.posts[2], self.posts[1]])
+        plan = page.explain()
+        self.assertIn("SEARCH PosteAPI_post USING INDEX", plan)
+        self.assertIn("(created_at<?)", plan)
+        self.assertNotIn("SCAN", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/posts/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_folders_and_users_are_paginated(self):
+        response = self.client.get("/api/folders/?page_size=1")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
+        response = self.client.get("/api/users/")
+        self.assertEqual(response.data["results"][0]["id"], self.user.id)
+        self.assertIsNone(response.data["next"])
+
+
+class ExportViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+    def test_export_streams_whole_tree(self):
+        folder = self.user.create_folder("Folder")
+        child = Folder.objects.create(title="Child", creator=self.user, parent=folder)
+        post = self.user.create_post("Post", "http://example.com", child)
+        post.tags.add(Tag.objects.create(name="tag"))
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        other.create_folder("Not exported")
+
+        response = self.client.get("/api/export/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        export = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(export["user"]["email"], "test@example.com")
+        self.assertEqual(
+            [f["title"] for f in export["folders"]], ["root", "Folder", "Child"]
+        )
+        self.assertEqual(export["posts"][0]["folder_id"], child.id)
+        self.assertEqual(export["posts"][0]["tags"], ["tag"])
+
+    def test_missing_root_folder(self):
+        Folder.all_objects.filter(creator=self.user, is_root=True).update(deleting=True)
+        response = self.client.get("/api/export/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.streaming)
+
+
+class PostBulkAPITest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+        Tag.objects.create(name="existing")
+
+    def payload(self, count, folder=None):
+        return {
+            "posts": [
+                {
+                    "title": f"Post {i}",
+                    "description": "Description",
+                    "url": "http://example.com",
+                    "folder_id": (folder or self.folder).id,
+                    "tags": f"Existing, New {i % 3}, shared!",
+                }
+                for i in range(count)
+            ]
+        }
+
+    def test_creates_posts_and_tags(self):
+        response = self.client.post("/api/posts/bulk/", self.payload(4), format="json")
+        self.assertEqual(response.status_code, 201)
+        posts = Post.objects.filter(pk__in=response.data["posts"]).order_by("id")
+        self.assertEqual([p.title for p in posts], [f"Post {i}" for i in range(4)])
+        self.assertEqual(
+            sorted(t.name for t in posts[1].tags.all()),
+            ["existing", "new1", "shared"],
+        )
+        self.assertEqual(Tag.objects.count(), 5)
+        self.assertEqual(Folder.objects.get(pk=self.folder.pk).post_count, 4)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post("/api/posts/bulk/", self.payload(2), format="json")
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            self.client.post("/api/posts/bulk/", self.payload(30), format="json")
+        self.assertEqual(len(small), len(large))
+
+    def test_rejects_folders_without_edit_permission(self):
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        folder = other.create_folder("Other")
+        other.share_folder_with_user(folder, self.user, FolderPermissionEnum.VIEWER)
+        response = self.client.post(
+            "/api/posts/bulk/", self.payload(1, folder), format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_rejects_missing_folders(self):
+        payload = self.payload(2)
+        payload["posts"][1]["folder_id"] = 9999
+        response = self.client.post("/api/posts/bulk/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+
+class FolderTreeViewTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.top = self.user.create_folder("Top")
+
+    def nest(self, levels, parent=None):
+        """
+        Creates a chain of `levels` folders below `parent`, each with a post.
+        """
+        parent = parent or self.top
+        for level in range(levels):
+            folder = Folder.objects.create(
+                title=f"Level {level}", creator=self.user, parent=parent
+            )
+            self.user.create_post(f"Post {level}", "http://example.com", folder)
+            parent = folder
+        return parent
+
+    def tree(self, folder, **params):
+        return self.client.get(f"/api/folders/{folder.pk}/tree/", params)
+
+    def test_nested_folders_and_posts(self):
+        self.nest(2)
+        sibling = Folder.objects.create(
+            title="Sibling", creator=self.user, parent=self.top
+        )
+        self.user.create_post("Top post", "http://example.com", self.top)
+        response = self.tree(self.top)
+        self.assertEqual(response.status_code, 200)
+        tree = response.data
+        self.assertEqual(tree["title"], "Top")
+        self.assertEqual([p["title"] for p in tree["posts"]], ["Top post"])
+        self.assertEqual([f["title"] for f in tree["folders"]], ["Level 0", "Sibling"])
+        level0 = tree["folders"][0]
+        self.assertEqual([p["title"] for p in level0["posts"]], ["Post 0"])
+        self.assertEqual([f["title"] for f in level0["folders"]], ["Level 1"])
+        self.assertEqual(level0["folders"][0]["folders"], [])
+        self.assertEqual(tree["folders"][1]["id"], sibling.pk)
+
+    def test_depth(self):
+        self.nest(3)
+        tree = self.tree(self.top, depth=1).data
+        self.assertEqual(len(tree["folders"]), 1)
+        self.assertEqual(tree["folders"][0]["folders"], [])
+        tree = self.tree(self.top, depth=0).data
+        self.assertEqual(tree["folders"], [])
+
+        root = Folder.objects.get(creator=self.user, is_root=True)
+        tree = self.tree(root, depth=2).data
+        self.assertEqual(tree["folders"][0]["folders"][0]["title"], "Level 0")
+        self.assertEqual(tree["folders"][0]["folders"][0]["folders"], [])
+
+    def test_fixed_number_of_queries(self):
+        shallow = self.user.create_folder("Shallow")
+        self.nest(1, shallow)
+        self.nest(5)
+        with CaptureQueriesContext(connection) as small:
+            self.tree(shallow)
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            response = self.tree(self.top)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 8)
+        node = response.data
+        for level in range(5):
+            [node] = node["folders"]
+            self.assertEqual(node["title"], f"Level {level}")
+
+    def test_invalid_depth(self):
+        for depth in ("-1", "deep"):
+            response = self.tree(self.top, depth=depth)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("depth", response.data["errors"])
+
+    def test_other_users_folder(self):
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        folder = other.create_folder("Other")
+        self.assertEqual(self.tree(folder).status_code, 404)
+        other.share_folder_with_user(folder, self.user, FolderPermissionEnum.VIEWER)
+        self.assertEqual(self.tree(folder).status_code, 200)
+
+    def test_only_visible_descendants(self):
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        folder = other.create_folder("Other")
+        other.share_folder_with_user(folder, self.user, FolderPermissionEnum.VIEWER)
+        shared = Folder.objects.create(title="Shared", creator=other, parent=folder)
+        other.share_folder_with_user(shared, self.user, FolderPermissionEnum.VIEWER)
+        private = Folder.objects.create(title="Private", creator=other, parent=folder)
+        other.create_post("Private post", "http://example.com", private)
+        # Shared, but below a folder the user cannot see
+        hidden = Folder.objects.create(title="Hidden", creator=other, parent=private)
+        other.share_folder_with_user(hidden, self.user, FolderPermissionEnum.VIEWER)
+
+        tree = self.tree(folder).data
+        self.assertEqual([f["title"] for f in tree["folders"]], ["Shared"])
+        self.assertEqual(tree["folders"][0]["folders"], [])
+        self.assertEqual(tree["posts"], [])
+
+
+class FolderMoveAPITest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.a = self.user.create_folder("A")
+        self.b = Folder.objects.create(title="B", creator=self.user, parent=self.a)
+        self.c = Folder.objects.create(title="C", creator=self.user, parent=self.b)
+        self.d = self.user.create_folder("D")
+
+    def move(self, *moves):
+        return self.client.post(
+            "/api/folders/move/",
+            {
+                "moves": [
+                    {"folder_id": folder.pk, "parent_id": parent.pk}
+                    for folder, parent in moves
+                ]
+            },
+            format="json",
+        )
+
+    def assertParent(self, folder, parent):
+        folder = Folder.objects.get(pk=folder.pk)
+        self.assertEqual(folder.parent_id, parent.pk)
+        parent = Folder.objects.get(pk=parent.pk)
+        self.assertEqual(folder.path, parent.descendant_path_prefix)
+
+    def test_moves_folder_and_descendants(self):
+        response = self.move((self.b, self.d))
+        self.assertEqual(response.status_code, 200)
+        self.assertParent(self.b, self.d)
+        self.assertParent(self.c, self.b)
+        self.assertEqual(Folder.objects.get(pk=self.a.pk).child_folder_count, 0)
+        self.assertEqual(Folder.objects.get(pk=self.d.pk).child_folder_count, 1)
+
+    def test_dependent_moves(self):
+        # Swap the nesting of A and B: B moves up, then A moves into it
+        root = Folder.objects.get(creator=self.user, is_root=True)
+        response = self.move((self.a, self.b), (self.b, root))
+        self.assertEqual(response.status_code, 200)
+        self.assertParent(self.b, root)
+        self.assertParent(self.a, self.b)
+        self.assertParent(self.c, self.b)
+
+    def test_rejects_cycles(self):
+        for moves in [
+            [(self.a, self.c)],
+            [(self.a, self.a)],
+            [(self.a, self.d), (self.d, self.c)],
+        ]:
+            response = self.move(*moves)
+            self.assertEqual(response.status_code, 400, moves)
+        self.assertParent(self.a, Folder.objects.get(creator=self.user, is_root=True))
+        self.assertParent(self.d, Folder.objects.get(creator=self.user, is_root=True))
+
+    def test_batch_is_all_or_nothing(self):
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        foreign = other.create_folder("Other")
+        response = self.move((self.c, self.d), (self.b, foreign))
+        self.assertEqual(response.status_code, 400)
+        self.assertParent(self.c, self.b)
+        self.assertParent(self.b, self.a)
+
+    def test_rejects_root_and_missing_folders(self):
+        root = Folder.objects.get(creator=self.user, is_root=True)
+        self.assertEqual(self.move((root, self.a)).status_code, 400)
+        response = self.client.post(
+            "/api/folders/move/",
+            {"moves": [{"folder_id": self.a.pk, "parent_id": 9999}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_paths_that_are_too_long(self):
+        padding = "1/" * ((1000 - len(self.b.descendant_path_prefix)) // 2)
+        Folder.objects.filter(pk=self.c.pk).update(
+            path=self.b.descendant_path_prefix + padding
+        )
+        e = Folder.objects.create(title="E", creator=self.user, parent=self.d)
+        response = self.move((self.b, e))
+        self.assertEqual(response.status_code, 400)
+        self.assertParent(self.b, self.a)
+
+    def test_query_count_does_not_depend_on_depth(self):
+        with CaptureQueriesContext(connection) as shallow:
+            self.move((self.d, self.a))
+        deep = self.c
+        for i in range(10):
+            deep = Folder.objects.create(title=f"{i}", creator=self.user, parent=deep)
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as nested:
+            self.move((self.d, deep))
+        self.assertEqual(len(shallow), len(nested))
+
+    def test_listing_reflects_move(self):
+        before = self.client.get(f"/api/data/{self.d.pk}/")
+        self.move((self.b, self.d))
+        after = self.client.get(f"/api/data/{self.d.pk}/")
+        self.assertNotEqual(before["ETag"], after["ETag"])
+        self.assertEqual([f["id"] for f in after.json()["folders"]], [self.b.pk])
+
+
+class TagWritePathTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+
+    def test_create_post_with_tags(self):
+        response = self.client.post(
+            "/api/posts/",
+            {
+                "title": "Post",
+                "description": "Description",
+                "url": "http://example.com",
+                "folder_id": self.folder.id,
+                "tags": "One, two!, ONE",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(title="Post")
+        self.assertEqual(sorted(t.name for t in post.tags.all()), ["one", "two"])
+
+    def test_create_folder_with_tags(self):
+        response = self.client.post(
+            "/api/folders/", {"title": "Tagged", "tags": "a, b"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        folder = Folder.objects.get(title="Tagged")
+        self.assertEqual(sorted(t.name for t in folder.tags.all()), ["a", "b"])
+        self.assertTrue(folder.parent.is_root)
+
+    def test_edit_post_tags(self):
+        post = self.user.create_post("Post", "http://example.com", self.folder)
+        response = self.client.patch(
+            f"/api/posts/{post.id}/",
+            {
+                "title": "Post",
+                "description": "",
+                "url": "http://example.com",
+                "tags": "Fresh, tag",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(t.name for t in post.tags.all()), ["fresh", "tag"])
+
+
+class PostSearchViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+        self.title_match = Post.objects.create(
+            title="Django tutorial",
+            description="Getting started",
+            url="http://example.com/a",
+            creator=self.user,
+            folder=self.folder,
+        )
+        self.description_match = Post.objects.create(
+            title="Notes",
+            description="Some django tips",
+            url="http://example.com/b",
+            creator=self.user,
+            folder=self.folder,
+        )
+        shared = self.other.create_folder("Shared")
+        self.other.share_folder_with_user(
+            shared, self.user, FolderPermissionEnum.VIEWER
+        )
+        self.shared_match = self.other.create_post(
+            "Shared django link", "http://example.com/c", shared
+        )
+        self.hidden = self.other.create_post(
+            "Private django link",
+            "http://example.com/d",
+            self.other.create_folder("Private"),
+        )
+
+    def search(self, query, **params):
+        response = self.client.get("/api/posts/search/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def ids(self, response):
+        return [post["id"] for post in response.data["results"]]
+
+    def test_ranked_and_limited_to_visible_posts(self):
+        ids = self.ids(self.search("django"))
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn(self.hidden.id, ids)
+        self.assertEqual(ids[-1], self.description_match.id)
+
+    def test_paginates(self):
+        first = self.search("django", page_size=2)
+        self.assertEqual(len(first.data["results"]), 2)
+        second = self.client.get(first.data["next"])
+        self.assertEqual(len(second.data["results"]), 1)
+        self.assertIsNone(second.data["next"])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.title_match.edit("Flask tutorial", "Getting started", "http://x.io", [])
+        self.assertNotIn(self.title_match.id, self.ids(self.search("django")))
+        self.assertEqual(self.ids(self.search("flask")), [self.title_match.id])
+        self.title_match.delete()
+        self.assertEqual(self.ids(self.search("flask")), [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.ids(self.search('"django OR (')), [])
+
+    def test_blank_query(self):
+        response = self.client.get("/api/posts/search/", {"q": " "})
+        self.assertEqual(response.status_code, 400)
+
+    def test_triggers_survive_migrations(self):
+        # A migration that alters the post table on SQLite drops the triggers that
+        # maintain the index; it must create them again
+        if connection.vendor != "sqlite":
+            self.skipTest("the search index is maintained by triggers on SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [Post._meta.db_table],
+            )
+            triggers = {name for (name,) in cursor.fetchall()}
+        self.assertEqual(
+            triggers,
+            {"PosteAPI_post_fts_ai", "PosteAPI_post_fts_ad", "PosteAPI_post_fts_au"},
+        )
+
+
+class TaggedViewTest(TestCase):
+    def setUp(self):
+        post_tag_index.clear()
+        folder_tag_index.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        python, django = Tag.objects.create(name="python"), Tag.objects.create(
+            name="django"
+        )
+        self.folder = self.user.create_folder("Folder")
+        self.folder.tags.add(python)
+        self.posts = [
+            self.user.create_post(f"Post {i}", "http://example.com", self.folder)
+            for i in range(3)
+        ]
+        for post in self.posts:
+            post.tags.add(python, django)
+        self.posts[0].tags.remove(django)
+        hidden = self.other.create_post(
+            "Hidden", "http://example.com", self.other.create_folder("Private")
+        )
+        hidden.tags.add(python, django)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_posts_limited_to_visible_and_paginated(self):
+        first = self.client.get(
+            "/api/posts/tagged/", {"q": "python AND django", "page_size": 1}
+        )
+        self.assertEqual(self.ids(first), [self.posts[2].id])
+        second = self.client.get(first.data["next"])
+        self.assertEqual(self.ids(second), [self.posts[1].id])
+        self.assertIsNone(second.data["next"])
+
+    def test_not_query(self):
+        response = self.client.get("/api/posts/tagged/", {"q": "python NOT django"})
+        self.assertEqual(self.ids(response), [self.posts[0].id])
+
+    def test_folders(self):
+        response = self.client.get("/api/folders/tagged/", {"q": "python"})
+        self.assertEqual(self.ids(response), [self.folder.id])
+
+    def test_bulk_created_posts_are_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/posts/bulk/",
+                {
+                    "posts": [
+                        {
+                            "title": "Bulk",
+                            "description": "Description",
+                            "url": "http://example.com",
+                            "folder_id": self.folder.id,
+                            "tags": "legacy",
+                        }
+                    ]
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        created = response.data["posts"]
+        response = self.client.get("/api/posts/tagged/", {"q": "legacy"})
+        self.assertEqual(self.ids(response), created)
+
+    @override_settings(POSTE_TAG_INDEX={"CANDIDATE_BATCH": 2})
+    def test_pages_across_candidate_batches(self):
+        private = self.other.create_folder("Other")
+        python = Tag.objects.get(name="python")
+        for i in range(3):
+            self.user.create_post(f"Untagged {i}", "http://example.com", self.folder)
+            post = self.other.create_post(f"Hidden {i}", "http://example.com", private)
+            post.tags.add(python)
+            post = self.user.create_post(
+                f"Tagged {i}", "http://example.com", self.folder
+            )
+            post.tags.add(python)
+        visible = Post.objects.filter(creator=self.user).order_by("-pk")
+        for q, expected in [
+            ("python", visible.filter(tags=python)),
+            ("NOT django", visible.exclude(tags__name="django")),
+        ]:
+            seen = []
+            url = "/api/posts/tagged/?" + urlencode({"q": q, "page_size": 2})
+            while url:
+                response = self.client.get(url)
+                seen += self.ids(response)
+                url = response.data["next"]
+            self.assertEqual(seen, [post.pk for post in expected], q)
+
+    def test_only_matches_are_checked_against_the_queryset(self):
+        for i in range(20):
+            self.user.create_post(f"Untagged {i}", "http://example.com", self.folder)
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.ids(self.client.get("/api/posts/tagged/", {"q": "python"}))
+        checks = [
+            query["sql"]
+            for query in context.captured_queries
+            if 'FROM "PosteAPI_post"' in query["sql"]
+        ]
+        # The candidates are passed in, not every visible post read out
+        self.assertTrue(all('"PosteAPI_post"."id" IN' in sql for sql in checks))
+
+    def test_query_count_does_not_depend_on_hidden_matches(self):
+        def queries(q):
+            token_cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.ids(self.client.get("/api/posts/tagged/", {"q": q}))
+            return len(context)
+
+        queries("python")  # builds the index
+        before = [queries("python"), queries("NOT legacy")]
+        folder = self.other.create_folder("Hidden")
+        hidden = Post.objects.bulk_create(
+            Post(
+                title="Hidden",
+                url="http://example.com",
+                creator=self.other,
+                folder=folder,
+            )
+            for _ in range(300)
+        )
+        python = Tag.objects.get(name="python")
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.tags.through.objects.bulk_create(
+                Post.tags.through(post=post, tag=python) for post in hidden
+            )
+            post_tag_index.add_links((post.id, python.id) for post in hidden)
+        self.assertEqual([queries("python"), queries("NOT legacy")], before)
+
+    def test_invalid_query(self):
+        response = self.client.get("/api/posts/tagged/", {"q": "python AND"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data["success"])
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        self.folder = self.user.create_folder("Folder")
+        self.child = self.user.create_folder("Child")
+        self.child.set_parent(self.folder)
+        self.child.save()
+        self.post = self.user.create_post("Post", "http://example.com", self.child)
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLessEqual(len(context.captured_queries), 3)
+        return etag
+
+    def assertChanged(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_data_view(self):
+        url = f"/api/data/{self.folder.id}/"
+        etag = self.assertNotModified(url)
+        # A change inside a child folder changes the child's counts in this listing
+        self.post.tags.add(Tag.objects.create(name="tag"))
+        self.assertChanged(url, etag)
+
+        etag = self.assertNotModified(url)
+        self.user.share_folder_with_user(
+            self.child, self.other, FolderPermissionEnum.VIEWER
+        )
+        self.assertChanged(url, etag)
+
+        etag = self.assertNotModified(url)
+        self.child.delete()
+        self.assertChanged(url, etag)
+
+    def test_root_tracks_shared_folders(self):
+        etag = self.assertNotModified("/api/data/")
+        shared = self.other.create_folder("Shared")
+        self.other.share_folder_with_user(
+            shared, self.user, FolderPermissionEnum.VIEWER
+        )
+        self.assertChanged("/api/data/", etag)
+
+        etag = self.assertNotModified("/api/data/")
+        self.other.create_post("Post", "http://example.com", shared)
+        self.assertChanged("/api/data/", etag)
+
+    def test_folder_detail(self):
+        url = f"/api/data/folder/{self.child.id}/"
+        etag = self.assertNotModified(url)
+        self.user.create_post("Another", "http://example.com", self.child)
+        self.assertChanged(url, etag)
+
+        etag = self.assertNotModified(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.folder = self.folder
+        post.save()
+        self.assertChanged(url, etag)
+
+    def test_move_changes_new_grandparent(self):
+        other = self.user.create_folder("Other")
+        target = Folder.objects.create(title="Target", creator=self.user, parent=other)
+        url = f"/api/data/{other.id}/"
+        etag = self.assertNotModified(url)
+        self.child.set_parent(target)
+        self.child.save()
+        # The listing shows how many folders Target holds
+        self.assertChanged(url, etag)
+
+    def test_cleared_and_deleted_tags(self):
+        tag = Tag.objects.create(name="tag")
+        urls = [f"/api/data/{self.child.id}/", f"/api/data/{self.folder.id}/"]
+        for clear in (tag.posts.clear, tag.folder.clear, tag.delete):
+            self.post.tags.add(tag)
+            self.child.tags.add(tag)
+            etags = [self.assertNotModified(url) for url in urls]
+            clear()
+            for url, etag in zip(urls, etags):
+                self.assertChanged(url, etag)
+        response = self.client.get(urls[0])
+        self.assertEqual(response.json()["posts"][0]["tags"], [])
+
+    def test_stale_instance_does_not_roll_back_version(self):
+        folder = Folder.objects.get(pk=self.child.pk)
+        self.user.create_post("Another", "http://example.com", self.child)
+        version = Folder.objects.get(pk=self.child.pk).version
+        folder.title = "Renamed"
+        folder.save()
+        self.assertGreater(Folder.objects.get(pk=self.child.pk).version, version)
+
+    def test_etag_is_per_user(self):
+        url = f"/api/data/folder/{self.child.id}/"
+        self.user.share_folder_with_user(
+            self.child, self.other, FolderPermissionEnum.VIEWER
+        )
+        etag = self.client.get(url)["ETag"]
+        other = APIClient()
+        other.credentials(
+            HTTP_AUTHORIZATION="Token " + Token.objects.create(user=self.other).key
+        )
+        self.assertNotEqual(other.get(url)["ETag"], etag)
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", username="owner", password="securepassword123"
+        )
+        self.shared = self.owner.create_folder("Shared")
+        self.owner.create_post("Post", "http://example.com", self.shared)
+        self.clients = []
+        for i in range(2):
+            user = User.objects.create_user(
+                email=f"user{i}@example.com", username=f"user{i}", password="pw12345!"
+            )
+            self.owner.share_folder_with_user(
+                self.shared, user, FolderPermissionEnum.VIEWER
+            )
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION="Token " + Token.objects.create(user=user).key
+            )
+            self.clients.append(client)
+
+    def get(self, client):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get("/api/data/")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content), len(context.captured_queries)
+
+    def test_repeated_listing_is_served_from_cache(self):
+        first, uncached = self.get(self.clients[0])
+        second, cached = self.get(self.clients[0])
+        self.assertEqual(first, second)
+        self.assertLess(cached, uncached)
+        self.assertLessEqual(cached, 4)
+
+    def test_shared_folders_are_serialized_once_for_all_users(self):
+        first, first_queries = self.get(self.clients[0])
+        second, second_queries = self.get(self.clients[1])
+        self.assertEqual(first["shared_folders"], second["shared_folders"])
+        # The shared folder (and its tags, children and shares) is not loaded again
+        self.assertEqual(second_queries, first_queries - 4)
+
+    def test_changes_are_never_served_stale(self):
+        before, _ = self.get(self.clients[0])
+        self.owner.create_post("Another", "http://example.com", self.shared)
+        after, _ = self.get(self.clients[0])
+        self.assertEqual(before["shared_folders"][0]["file_count"], 1)
+        self.assertEqual(after["shared_folders"][0]["file_count"], 2)
+
+    def test_invalidation_frees_entries(self):
+        self.get(self.clients[0])
+        entries = len(response_cache.local)
+        self.shared.tags.add(Tag.objects.create(name="tag"))
+        self.assertLess(len(response_cache.local), entries)
+
+
+class AsyncDataViewTest(TransactionTestCase):
+    # The async view queries from worker threads, which only see committed data
+
+    def setUp(self):
+        response_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com", username="unused", password="securepassword123"
+        )
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="securepassword123"
+        )
+        self.client = APIClient()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.folder = self.user.create_folder("Folder")
+        post = self.user.create_post("Post", "http://example.com", self.folder)
+        post.tags.add(Tag.objects.create(name="tag"))
+        shared = other.create_folder("Shared")
+        other.share_folder_with_user(shared, self.user, FolderPermissionEnum.VIEWER)
+
+    def test_matches_sync_view(self):
+        for path in ["data/", f"data/{self.folder.id}/"]:
+            response = self.client.get("/api/async/" + path)
+            self.assertEqual(response.status_code, 200)
+            response_cache.clear()
+            expected = self.client.get("/api/" + path)
+            self.assertEqual(json.loads(response.content), expected.json())
+            self.assertEqual(response["ETag"], expected["ETag"])
+
+    def test_query_threads_reuse_connections(self):
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        self.client.get("/api/async/data/")
+        connection_created.connect(count)
+        try:
+            for _ in range(3):
+                response_cache.clear()
+                self.assertEqual(self.client.get("/api/async/data/").status_code, 200)
+        finally:
+            connection_created.disconnect(count)
+        self.assertLessEqual(len(opened), DEFAULT_ASYNC_QUERIES["THREADS"])
+
+    @override_settings(DEBUG=True, POSTE_TIMING={"SAMPLE_RATE": 1})
+    async def test_middleware_runs_on_the_event_loop(self):
+        # Django logs every sync middleware it has to run in a thread under ASGI
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+            response = await AsyncClient().get(
+                "/api/async/data/", headers={"Authorization": "Token " + self.token.key}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("X-Request-ID", response)
+        self.assertIn("Server-Timing", response)
+
+    def test_conditional_get(self):
+        etag = self.client.get("/api/async/data/")["ETag"]
+        response = self.client.get("/api/async/data/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_errors(self):
+        response = self.client.get("/api/async/data/999999/")
+        self.assertEqual(response.status_code, 404)
+        self.client.credentials()
+        self.assertEqual(self.client.get("/api/async/data/").status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+        self.assertEqual(self.client.get("/api/async/data/").status_code, 401)
@@ -3,8 +3,18 @@
 echo "Applying database migrations..."
 python manage.py migrate --noinput
 
+# Finishes the large folder deletions a restart interrupted, alongside the server
+echo "Resuming folder deletions..."
+python manage.py resume_folder_deletions &
+
 echo "Creating superuser..."
 python manage.py createsuperuser --noinput
 
+# SERVER_MODE=asgi runs uvicorn workers, which serve the /api/async/ endpoints
+# concurrently; the default, wsgi, runs the classic synchronous workers
 echo "Starting server..."
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    exec gunicorn PosteBackend.asgi:application --bind 0.0.0.0:8000 --workers 4 \
+        --worker-class uvicorn.workers.UvicornWorker
+fi
 exec gunicorn PosteBackend.wsgi:application --bind 0.0.0.0:8000 --workers 4
\ No newline at end of file